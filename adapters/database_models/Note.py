@@ -11,6 +11,12 @@ class GPTCard(BaseModel):
     answer: str = Field(min_length=1, strip_whitespace=True)
 
 
+class GeneratedCard(GPTCard):
+    # the part of the note text the card was generated from
+    chunk_start_index: int = 0
+    chunk_end_index: Optional[int] = None
+
+
 class Card(GPTCard):
     source_start_index: int
     source_end_index: int
@@ -23,4 +29,6 @@ class Note(BaseMongoModel):
     cards_added: bool
     cards_edited: bool
     cards: list[Card]
+    # start and end offsets of the sentences in text
+    sentence_boundaries: list[tuple[int, int]] = []
     cards_edited_at: Optional[datetime]
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 from adapters.http_models.HttpModels import BaseResponse
@@ -12,6 +14,8 @@ class ChatQuestion(BaseModel):
 class SearchResult(BaseModel):
     type: ContentSourceType
     ids: list[str]
+    # character offsets of the matching chunk in the view_text of each source
+    spans: list[Optional[tuple[int, int]]] = []
 
 
 class QuestionResponseData(BaseModel):
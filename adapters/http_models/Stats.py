@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+
+from adapters.http_models.HttpModels import BaseResponse
+from lib.CompletionCache import CacheStats
+from lib.CompletionScheduler import SchedulerStats
+
+
+class LLMStatsData(BaseModel):
+    scheduler: SchedulerStats
+    cache: dict[str, CacheStats]
+
+
+LLMStatsResponse = BaseResponse[LLMStatsData]
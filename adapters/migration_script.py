@@ -1,28 +1,27 @@
+import sys
+
 import motor.motor_asyncio
 
 from adapters.vector_store.ChromaConnection import chroma_conn
-from adapters.vector_store.VectorStore import VectorStore
+from adapters.vector_store.VectorStore import create_vector_store
 from config import env_config
-from lib.TextSplitter import TextSplitter
 
 CONN_STRING = env_config.MONGO_DB_CONNECTION
 CHROMA_PORT = env_config.CHROMA_PORT
 CHROMA_HOST = env_config.CHROMA_HOST
 
-CHROMA_COLLECTION_NAME = "content"
 MONGO_TARGET_COLLECTION = "content"
 
 
-async def main():
+async def main(reindex: bool, rebuild_lexical_index: bool):
     # --- Connect to MongoDB and ChromaDB --- #
     db_client = motor.motor_asyncio.AsyncIOMotorClient(CONN_STRING)
     chroma_client = chroma_conn.get_client()
     db = db_client["spacey"]
     target_collection = db[MONGO_TARGET_COLLECTION]
-    chroma_collection = chroma_client.get_or_create_collection(name="content")
 
-    ts = TextSplitter(1000, 70)
-    vs = VectorStore(ts, chroma_client)
+    # writes into the collections the app reads, partitioned or not
+    vs = create_vector_store(chroma_client)
     no_docs = await target_collection.count_documents({})
 
     if no_docs <= 0:
@@ -81,7 +80,9 @@ async def main():
         no_docs = await target_collection.count_documents({})
         print(f"Migrated {no_docs} documents into mongoDB!")
 
-    if chroma_collection.count() <= 0:
+    # only new or changed chunks are embedded, so re-indexing an existing
+    # corpus with --reindex costs little more than splitting it
+    if reindex or await vs.count() <= 0:
         content = await target_collection.find({}).to_list(length=1000)
 
         documents = []
@@ -100,11 +101,31 @@ async def main():
                 )
 
         # --- Add all documents to ChromaDB --- #
-        vs.add_documents(documents, metadata)  # type: ignore
-        print(f"Imported {chroma_collection.count()} documents into chroma DB!")
+        stats = await vs.add_documents(documents, metadata)  # type: ignore
+        print(f"Imported {stats['no_documents']} documents into chroma DB!")
+        print(
+            f"Indexed {stats['no_chunks']} chunks in {stats['duration_s']:.1f}s "
+            f"({stats['chunks_per_s']:.1f} chunks/s), embedded "
+            f"{stats['no_new_chunks']} new chunks and deleted "
+            f"{stats['no_deleted_chunks']}"
+        )
+
+    # --- Fill the lexical index with the chunks already in ChromaDB --- #
+    if rebuild_lexical_index:
+        if not env_config.HYBRID_SEARCH:
+            print("Set HYBRID_SEARCH to build the lexical index.")
+            return
+
+        await vs.setup()
+        no_chunks = await vs.rebuild_lexical_index()
+        print(f"Added {no_chunks} chunks to the lexical index!")
 
 
 if __name__ == "__main__":
     import asyncio
 
-    asyncio.run(main())
+    # chunks that are in ChromaDB already are never new to add_documents, so
+    # turning on hybrid search for an existing corpus needs --rebuild-lexical-index
+    asyncio.run(
+        main("--reindex" in sys.argv[1:], "--rebuild-lexical-index" in sys.argv[1:])
+    )
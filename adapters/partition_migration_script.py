@@ -0,0 +1,30 @@
+import sys
+
+from adapters.vector_store.ChromaConnection import chroma_conn
+from adapters.vector_store.VectorStore import COLLECTION_NAME, create_vector_store
+from config import env_config
+
+PARTITION_MODE = env_config.VECTOR_STORE_PARTITION_MODE
+
+
+def main(delete_source: bool):
+    if PARTITION_MODE == "none":
+        print("Set VECTOR_STORE_PARTITION_MODE to user or bucket to split the index.")
+        return
+
+    # --- Copy the chunks of the shared collection into the partitions --- #
+    chroma_client = chroma_conn.get_client()
+    vs = create_vector_store(chroma_client)
+
+    no_chunks = vs.copy_collection(COLLECTION_NAME)
+    print(f"Copied {no_chunks} chunks into {PARTITION_MODE} partitions!")
+
+    if delete_source:
+        chroma_client.delete_collection(COLLECTION_NAME)
+        print(f"Deleted the {COLLECTION_NAME} collection!")
+
+
+if __name__ == "__main__":
+    # keeps the shared collection unless --delete is passed, so the migration
+    # can be verified before switching over
+    main("--delete" in sys.argv[1:])
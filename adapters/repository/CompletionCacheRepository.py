@@ -0,0 +1,21 @@
+from typing import Annotated
+
+from fastapi import Depends
+
+from adapters.DBConnection import DBConnection, get_db_connection
+from adapters.repository.BaseRepository import BaseRepository
+
+COLLECTION_NAME = "completionCache"
+
+
+class CompletionCacheRepository(BaseRepository):
+
+    def __init__(self, db: Annotated[DBConnection, Depends(get_db_connection)]):
+        super().__init__(COLLECTION_NAME, db)
+
+    async def ensure_indexes(self, ttl_s: int) -> None:
+        await self._collection.create_index("key", unique=True)
+        await self._collection.create_index("created_at", expireAfterSeconds=ttl_s)
+
+    async def upsert_one(self, query: dict, document: dict) -> None:
+        await self._collection.update_one(query, {"$set": document}, upsert=True)
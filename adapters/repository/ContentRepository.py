@@ -1,5 +1,6 @@
 from typing import Annotated
 
+from bson import ObjectId
 from fastapi import Depends
 
 from adapters.DBConnection import DBConnection, get_db_connection
@@ -12,3 +13,13 @@ class ContentRepository(BaseRepository):
 
     def __init__(self, db: Annotated[DBConnection, Depends(get_db_connection)]):
         super().__init__(COLLECTION_NAME, db)
+
+    async def find_existing_ids(self, ids: list[str]) -> set[str]:
+        """
+        Returns those of the given content ids that still exist.
+        """
+        object_ids = [ObjectId(id) for id in ids if ObjectId.is_valid(id)]
+
+        cursor = self._collection.find({"_id": {"$in": object_ids}}, {"_id": 1})
+
+        return {str(document["_id"]) async for document in cursor}
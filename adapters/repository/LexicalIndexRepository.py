@@ -0,0 +1,46 @@
+from typing import Annotated
+
+from fastapi import Depends
+from pymongo import ReplaceOne
+
+from adapters.DBConnection import DBConnection, get_db_connection
+from adapters.repository.BaseRepository import BaseRepository
+
+COLLECTION_NAME = "lexicalIndex"
+
+
+class LexicalIndexRepository(BaseRepository):
+    """
+    The term counts of every chunk in the vector store, one document per chunk.
+    """
+
+    def __init__(self, db: Annotated[DBConnection, Depends(get_db_connection)]):
+        super().__init__(COLLECTION_NAME, db)
+
+    async def ensure_indexes(self) -> None:
+        await self._collection.create_index("chunk_id", unique=True)
+        await self._collection.create_index("user_id")
+        await self._collection.create_index("source_id")
+
+    async def upsert_many(self, documents: list[dict]) -> None:
+        """
+        Replaces the documents of chunks that are indexed already, so adding
+        chunks again after a failure does not duplicate them.
+        """
+        if documents:
+            await self._collection.bulk_write(
+                [
+                    ReplaceOne({"chunk_id": d["chunk_id"]}, d, upsert=True)
+                    for d in documents
+                ],
+                ordered=False,
+            )
+
+    async def find_by_user(self, user_id: str) -> list[dict]:
+        return await self._collection.find({"user_id": user_id}).to_list(length=None)
+
+    async def delete_by_sources(self, source_ids: list[str]) -> None:
+        await self._collection.delete_many({"source_id": {"$in": source_ids}})
+
+    async def delete_by_chunk_ids(self, chunk_ids: list[str]) -> None:
+        await self._collection.delete_many({"chunk_id": {"$in": chunk_ids}})
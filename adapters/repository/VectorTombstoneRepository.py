@@ -0,0 +1,44 @@
+from datetime import datetime
+from typing import Annotated
+
+from fastapi import Depends
+
+from adapters.DBConnection import DBConnection, get_db_connection
+from adapters.repository.BaseRepository import BaseRepository
+
+COLLECTION_NAME = "vectorTombstones"
+
+
+class VectorTombstoneRepository(BaseRepository):
+    """
+    Content whose vectors still have to be deleted. A tombstone is removed
+    once the deletion succeeded, so failed deletions are retried later.
+    """
+
+    def __init__(self, db: Annotated[DBConnection, Depends(get_db_connection)]):
+        super().__init__(COLLECTION_NAME, db)
+
+    async def ensure_indexes(self) -> None:
+        await self._collection.create_index("source_id", unique=True)
+
+    async def add(self, source_id: str, user_id: str) -> None:
+        await self._collection.update_one(
+            {"source_id": source_id},
+            {
+                "$setOnInsert": {
+                    "source_id": source_id,
+                    "user_id": user_id,
+                    "attempts": 0,
+                    "created_at": datetime.now(),
+                }
+            },
+            upsert=True,
+        )
+
+    async def remove(self, source_ids: list[str]) -> None:
+        await self._collection.delete_many({"source_id": {"$in": source_ids}})
+
+    async def record_attempt(self, source_ids: list[str]) -> None:
+        await self._collection.update_many(
+            {"source_id": {"$in": source_ids}}, {"$inc": {"attempts": 1}}
+        )
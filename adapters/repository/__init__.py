@@ -2,3 +2,6 @@ from .NoteRepository import NoteRepository  # noqa F401
 from .ContentRepository import ContentRepository  # noqa F401
 from .UserRepository import UserRepository  # noqa F401
 from .ConfigRepository import ConfigRepository  # noqa F401
+from .CompletionCacheRepository import CompletionCacheRepository  # noqa F401
+from .VectorTombstoneRepository import VectorTombstoneRepository  # noqa F401
+from .LexicalIndexRepository import LexicalIndexRepository  # noqa F401
@@ -0,0 +1,112 @@
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, Literal, Optional, TypedDict, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+QueryCacheStat = Literal["embedding_hits", "result_hits", "misses"]
+
+
+class QueryCacheStats(TypedDict):
+    embedding_hits: int
+    result_hits: int
+    misses: int
+
+
+class _LRU(Generic[K, V]):
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        if key not in self._entries:
+            return None
+
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key: K, value: V) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+
+class QueryCache:
+    """
+    Caches query embeddings and search results of the vector store.
+
+    Embeddings are keyed by the normalized query text only, as they do not
+    depend on the user. Results are keyed by user, query and filters and
+    expire after ttl_s. Every user has a generation that is part of the result
+    key, so adding or deleting content of a user invalidates all of their
+    results at once. Invalidation is local to the process, the ttl bounds how
+    long other instances may serve outdated results.
+    """
+
+    def __init__(
+        self,
+        max_embeddings: int = 1000,
+        max_results: int = 1000,
+        ttl_s: float = 300,
+    ):
+        self._embeddings: _LRU[str, list[float]] = _LRU(max_embeddings)
+        self._results: _LRU[tuple, tuple[float, dict]] = _LRU(max_results)
+        self._ttl_s = ttl_s
+
+        self._generations: dict[str, int] = {}
+        self._stats: QueryCacheStats = {
+            "embedding_hits": 0,
+            "result_hits": 0,
+            "misses": 0,
+        }
+
+    def _normalize(self, query: str) -> str:
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    def get_embedding(self, query: str) -> Optional[list[float]]:
+        embedding = self._embeddings.get(self._normalize(query))
+
+        if embedding is not None:
+            self._stats["embedding_hits"] += 1
+
+        return embedding
+
+    def put_embedding(self, query: str, embedding: list[float]) -> None:
+        self._embeddings.put(self._normalize(query), embedding)
+
+    def result_key(self, user_id: str, query: str, filters: dict) -> tuple:
+        """
+        Returns the key of a search of the user. The key has to be taken before
+        querying, so a result that raced with an invalidation is never served.
+        """
+        return (
+            user_id,
+            self._generations.get(user_id, 0),
+            self._normalize(query),
+            json.dumps(filters, sort_keys=True, default=str),
+        )
+
+    def get_result(self, key: tuple) -> Optional[dict]:
+        entry = self._results.get(key)
+
+        if entry is None or time.monotonic() - entry[0] > self._ttl_s:
+            self._stats["misses"] += 1
+            return None
+
+        self._stats["result_hits"] += 1
+        return entry[1]
+
+    def put_result(self, key: tuple, result: dict) -> None:
+        self._results.put(key, (time.monotonic(), result))
+
+    def invalidate(self, user_id: str) -> None:
+        # outdated entries are never looked up again and age out of the LRU
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def stats(self) -> QueryCacheStats:
+        return self._stats.copy()
@@ -1,17 +1,50 @@
+import asyncio
+import hashlib
+import logging
+import time
 from abc import ABC, abstractmethod
-from typing import Annotated, Literal, NotRequired, Optional, TypedDict, cast
-from uuid import uuid4
-
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Callable,
+    Iterable,
+    Iterator,
+    Literal,
+    NamedTuple,
+    NotRequired,
+    Optional,
+    TypedDict,
+    TypeVar,
+    cast,
+)
+
+import numpy as np
 from chromadb.api import ClientAPI
+from chromadb.api.models.Collection import Collection
+from chromadb.api.types import Embeddings, Where
 from chromadb.utils import embedding_functions
-from fastapi import Depends
 
 from adapters.database_models.Content import ContentSourceType
-from adapters.vector_store.ChromaConnection import get_chroma_client
+from adapters.DBConnection import get_db_connection
+from adapters.repository.LexicalIndexRepository import LexicalIndexRepository
+from adapters.vector_store.QueryCache import QueryCache
+from config import env_config
+from lib.LexicalIndex import LexicalIndex
 from lib.TextSplitter import TextSplitterInterface, get_text_splitter
 
 COLLECTION_NAME = "content"
 
+PartitionMode = Literal["none", "user", "bucket"]
+
+# source ids per request, keeps the where clause small
+SOURCE_BATCH_SIZE = 500
+
+# collection handles kept, with one collection per user there can be many
+MAX_CACHED_COLLECTIONS = 1024
+
+# dampens the influence of the top ranks in reciprocal rank fusion
+RRF_K = 60
+
 Include = list[
     Literal["documents", "embeddings", "metadatas", "distances", "uris", "data"]
 ]
@@ -27,6 +60,9 @@ class MetaData(TypedDict):
     source_id: str
     source_type: ContentSourceType
     user_id: str
+    # character offsets of the chunk in the document
+    chunk_start: NotRequired[int]
+    chunk_end: NotRequired[int]
 
 
 class QueryResult(TypedDict):
@@ -39,62 +75,572 @@ class QueryResult(TypedDict):
 SearchQueryOperators = Literal["$and", "$or"]
 SearchQuery = dict[SearchQueryOperators, list[dict[str, str]]]
 
-# TODO: cutoff for number of results + relevance score -> only return results above a certain distance
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionStats(TypedDict):
+    no_documents: int
+    no_chunks: int
+    # chunks that were not stored yet and had to be embedded
+    no_new_chunks: int
+    no_deleted_chunks: int
+    duration_s: float
+    chunks_per_s: float
+
+
+class _Candidate(NamedTuple):
+    id: str
+    document: str
+    metadata: MetaData
+    distance: float
+    embedding: np.ndarray
+    relevance: float
+    # whether the chunk matched the query lexically
+    lexical: bool
+
+
+class _Chunks(NamedTuple):
+    ids: list[str]
+    documents: list[str]
+    metadatas: list[MetaData]
+
+
+class _ChunkChanges(NamedTuple):
+    added: _Chunks
+    # chunk id to user id of the chunks that are no longer part of their source
+    deleted: dict[str, str]
 
 
 class VectorStoreInterface(ABC):
+    async def setup(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
     @abstractmethod
-    def add_document(self, document: str, metadata: MetaData):
+    async def add_document(self, document: str, metadata: MetaData):
         pass
 
     @abstractmethod
-    def add_documents(self, documents: list[str], metadatas: list[MetaData]):
+    async def add_documents(
+        self, documents: list[str], metadatas: list[MetaData]
+    ) -> IngestionStats:
         pass
 
     @abstractmethod
-    def query(
+    async def query(
         self,
         query: str,
         filter_values: QueryFilters,
+        n_results: Optional[int] = None,
     ) -> QueryResult:
         pass
 
+    @abstractmethod
+    async def delete_by_source(self, source_id: str, user_id: str) -> None:
+        pass
+
+    @abstractmethod
+    async def delete_by_sources(self, sources: dict[str, str]) -> None:
+        """
+        Deletes the chunks of all sources, given as source id to user id.
+        """
+        pass
+
+    @abstractmethod
+    async def get_sources(self) -> dict[str, str]:
+        """
+        Returns the source id and user id of every source with stored chunks.
+        """
+        pass
+
 
 class VectorStore(VectorStoreInterface):
+    """
+    Stores document chunks with their embeddings in Chroma.
+
+    The embedding model and the collection are created once for the lifetime
+    of the application. Chroma requests and embedding run on a bounded thread
+    pool, so they neither block the event loop nor pile up without limit.
+    If a query cache is given, repeated searches reuse the query embedding
+    and the results until the user's content changes.
+
+    With partition_mode "user", every user has a collection of their own, with
+    "bucket" users are hashed into partition_buckets collections. A query then
+    only searches the collection of its user instead of the whole corpus.
+
+    If a lexical index is given, chunks are also ranked by BM25 and both
+    rankings are fused with reciprocal rank fusion, so exact terms like names
+    or identifiers are found even if their embeddings are not similar.
+
+    Queries drop chunks further than max_distance from the query. With an
+    mmr_lambda below 1, n_results are picked from mmr_candidates by maximal
+    marginal relevance, so near duplicate chunks do not crowd out the rest.
+    """
+
     def __init__(
         self,
-        document_splitter: Annotated[TextSplitterInterface, Depends(get_text_splitter)],
-        chroma_client: Annotated[ClientAPI, Depends(get_chroma_client)],
-        # TODO: fix somehow param max_query_results: int = 5,
+        document_splitter: TextSplitterInterface,
+        chroma_client: ClientAPI,
+        max_workers: int = 4,
+        embedding_batch_size: int = 64,
+        query_cache: Optional[QueryCache] = None,
+        partition_mode: PartitionMode = "none",
+        partition_buckets: int = 64,
+        lexical_index: Optional[LexicalIndex] = None,
+        n_results: int = 5,
+        max_distance: Optional[float] = None,
+        mmr_lambda: float = 1.0,
+        mmr_candidates: int = 20,
     ):
-        default_ef = embedding_functions.DefaultEmbeddingFunction()
+        embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        assert embedding_function is not None, "The embedding model is not available."
+        self._embedding_function = embedding_function
+
+        self._collections: OrderedDict[str, Collection] = OrderedDict()
+        self._partition_mode = partition_mode
+        self._partition_buckets = partition_buckets
+
+        self._n_results = n_results
+        self._max_distance = max_distance
+        self._mmr_lambda = mmr_lambda
+        self._mmr_candidates = mmr_candidates
+        self._document_splitter = document_splitter
+        self._chroma_client = chroma_client
+        self._embedding_batch_size = embedding_batch_size
+        self._max_batch_size: Optional[int] = None
+        self._query_cache = query_cache
+        self._lexical_index = lexical_index
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="vector-store"
+        )
 
-        self._collection = chroma_client.get_or_create_collection(
-            name=COLLECTION_NAME, embedding_function=default_ef  # type: ignore
+    def _get_collection_name(self, user_id: str) -> str:
+        if self._partition_mode == "none":
+            return COLLECTION_NAME
+
+        # stable across processes, unlike hash()
+        digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()
+
+        if self._partition_mode == "user":
+            return f"{COLLECTION_NAME}-user-{digest[:32]}"
+
+        return f"{COLLECTION_NAME}-bucket-{int(digest, 16) % self._partition_buckets}"
+
+    def _get_collection(self, name: str) -> Collection:
+        collection = self._find_collection(name)
+
+        if collection is None:
+            collection = self._chroma_client.get_or_create_collection(
+                name=name, embedding_function=self._embedding_function  # type: ignore
+            )
+            self._cache_collection(collection)
+
+        return collection
+
+    def _find_collection(self, name: str) -> Optional[Collection]:
+        """
+        Returns the collection if it exists, without creating an empty one for
+        every user that only reads.
+        """
+        if name in self._collections:
+            self._collections.move_to_end(name)
+            return self._collections[name]
+
+        try:
+            collection = self._chroma_client.get_collection(
+                name=name, embedding_function=self._embedding_function  # type: ignore
+            )
+        except Exception as e:
+            # the http client turns the server's ValueError into a plain
+            # Exception that only carries its message
+            if "does not exist" in str(e):
+                return None
+            raise
+
+        self._cache_collection(collection)
+
+        return collection
+
+    def _cache_collection(self, collection: Collection) -> None:
+        self._collections[collection.name] = collection
+        self._collections.move_to_end(collection.name)
+
+        while len(self._collections) > MAX_CACHED_COLLECTIONS:
+            self._collections.popitem(last=False)
+
+    def _get_user_collection(self, user_id: str) -> Collection:
+        return self._get_collection(self._get_collection_name(user_id))
+
+    def _list_collection_names(self) -> list[str]:
+        return [
+            collection.name
+            for collection in self._chroma_client.list_collections()
+            if collection.name == COLLECTION_NAME
+            or collection.name.startswith(f"{COLLECTION_NAME}-")
+        ]
+
+    async def _run(self, func: Callable[[], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func)
+
+    async def setup(self) -> None:
+        """
+        Loads the embedding model before the first request needs it.
+        """
+        await self._run(lambda: self._embedding_function(["warm up"]))
+
+        if self._lexical_index:
+            await self._lexical_index.setup()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    async def add_document(self, document: str, metadata: MetaData):
+        await self.add_documents([document], [metadata])
+
+    async def add_documents(
+        self, documents: list[str], metadatas: list[MetaData]
+    ) -> IngestionStats:
+        stats, changes = await self._run(
+            lambda: self._add_documents(documents, metadatas)
         )
 
-        self._max_query_results = 5
-        self._chunk_char_size = 1000
-        self._overlap = 100
-        self._document_splitter = document_splitter
+        if self._lexical_index:
+            try:
+                await self._lexical_index.delete_chunks(changes.deleted)
+                await self._lexical_index.add(*changes.added)
+            except Exception as e:
+                # the chunks can still be found by their embeddings, until
+                # rebuild_lexical_index adds them
+                logger.error(f"Failed to add chunks to the lexical index: {e}")
+
+        self._invalidate_query_cache(metadata["user_id"] for metadata in metadatas)
+
+        return stats
+
+    async def rebuild_lexical_index(self) -> int:
+        """
+        Adds every chunk stored in Chroma to the lexical index, e.g. after
+        turning on hybrid search for an existing corpus or after writes to the
+        lexical index failed. Chunks that are indexed already are replaced.
+        Returns the number of chunks indexed.
+        """
+        if not self._lexical_index:
+            return 0
+
+        no_chunks = 0
+
+        for name in await self._run(self._list_collection_names):
+            pages = self._get_pages(
+                await self._run(lambda: self._get_collection(name)),
+                ["documents", "metadatas"],
+            )
+
+            while page := await self._run(lambda: next(pages, None)):
+                await self._lexical_index.add(
+                    page["ids"], page["documents"], page["metadatas"]
+                )
+                no_chunks += len(page["ids"])
+
+        logger.info(f"Added {no_chunks} chunks to the lexical index")
+
+        return no_chunks
+
+    def _invalidate_query_cache(self, user_ids: Iterable[str]) -> None:
+        if self._query_cache:
+            for user_id in set(user_ids):
+                self._query_cache.invalidate(user_id)
+
+    async def delete_by_source(self, source_id: str, user_id: str) -> None:
+        await self.delete_by_sources({source_id: user_id})
+
+    async def delete_by_sources(self, sources: dict[str, str]) -> None:
+        await self._run(lambda: self._delete_by_sources(sources))
+
+        if self._lexical_index:
+            await self._lexical_index.delete(sources)
+
+        self._invalidate_query_cache(sources.values())
+
+    def _delete_by_sources(self, sources: dict[str, str]) -> None:
+        source_ids_by_collection: dict[str, list[str]] = {}
+        for source_id, user_id in sources.items():
+            source_ids_by_collection.setdefault(
+                self._get_collection_name(user_id), []
+            ).append(source_id)
+
+        for name, source_ids in source_ids_by_collection.items():
+            collection = self._find_collection(name)
+            if collection is None:
+                continue
+
+            for i in range(0, len(source_ids), SOURCE_BATCH_SIZE):
+                collection.delete(
+                    where=cast(
+                        Where,
+                        {"source_id": {"$in": source_ids[i : i + SOURCE_BATCH_SIZE]}},
+                    )
+                )
+
+        logger.info(f"Deleted the chunks of {len(sources)} sources")
+
+    async def get_sources(self) -> dict[str, str]:
+        return await self._run(self._get_sources)
+
+    async def count(self) -> int:
+        """
+        Returns the number of chunks in all collections.
+        """
+        return await self._run(
+            lambda: sum(
+                self._get_collection(name).count()
+                for name in self._list_collection_names()
+            )
+        )
 
-    def add_document(self, document: str, metadata: MetaData):
+    def _get_sources(self) -> dict[str, str]:
+        sources: dict[str, str] = {}
+
+        for name in self._list_collection_names():
+            for page in self._get_pages(self._get_collection(name), ["metadatas"]):
+                for metadata in page["metadatas"] or []:
+                    sources[str(metadata["source_id"])] = str(metadata["user_id"])
+
+        return sources
+
+    def _get_pages(
+        self, collection: Collection, include: Include, where: Optional[dict] = None
+    ) -> Iterator[dict]:
+        page_size = self._get_max_batch_size()
+        offset = 0
+
+        while True:
+            page = collection.get(
+                where=where, include=include, limit=page_size, offset=offset  # type: ignore
+            )
+            yield cast(dict, page)
+
+            if len(page["ids"]) < page_size:
+                return
+
+            offset += page_size
+
+    def _get_max_batch_size(self) -> int:
+        # the limit of the server, which requires a request to the http client
+        if self._max_batch_size is None:
+            self._max_batch_size = self._chroma_client.max_batch_size
+
+        return self._max_batch_size
+
+    def _add_documents(
+        self, documents: list[str], metadatas: list[MetaData]
+    ) -> tuple[IngestionStats, _ChunkChanges]:
+        """
+        Replaces the chunks of the sources of the documents. Chunk ids are
+        derived from the source and the chunk text, so only chunks that are
+        not stored yet are embedded, chunks that only moved get their offsets
+        updated and chunks that are no longer part of their source are deleted.
+        New chunks are embedded in batches of embedding_batch_size and written
+        with as few requests as the server's maximum batch size allows.
+        """
+        started_at = time.perf_counter()
+
+        ids: list[str] = []
+        seen_ids: set[str] = set()
+        chunks: list[str] = []
+        chunk_metadatas: list[MetaData] = []
 
-        split_documents = self._document_splitter(document)
+        for document, metadata in zip(documents, metadatas):
+            for chunk in self._document_splitter(document):
+                chunk_id = self._generate_id(metadata["source_id"], chunk.text)
+
+                # a repeated passage of a source is stored once
+                if chunk_id in seen_ids:
+                    continue
+
+                seen_ids.add(chunk_id)
+                ids.append(chunk_id)
+                chunks.append(chunk.text)
+                chunk_metadatas.append(
+                    {
+                        **metadata,
+                        "chunk_start": chunk.char_start,
+                        "chunk_end": chunk.char_end,
+                    }
+                )
+
+        stored = self._get_stored_chunks(metadatas)
+
+        new = [i for i, chunk_id in enumerate(ids) if chunk_id not in stored]
+        moved = [
+            i
+            for i, chunk_id in enumerate(ids)
+            if chunk_id in stored and stored[chunk_id] != chunk_metadatas[i]
+        ]
+        deleted = {
+            chunk_id: str(metadata["user_id"])
+            for chunk_id, metadata in stored.items()
+            if chunk_id not in seen_ids
+        }
 
-        ids = [self._generate_id() for _ in split_documents]
+        new_chunks = _Chunks(
+            [ids[i] for i in new],
+            [chunks[i] for i in new],
+            [chunk_metadatas[i] for i in new],
+        )
 
-        metadatas = [metadata for _ in split_documents]
+        embeddings: Embeddings = []
+        for i in range(0, len(new_chunks.documents), self._embedding_batch_size):
+            embeddings += self._embedding_function(
+                new_chunks.documents[i : i + self._embedding_batch_size]
+            )
 
-        self._collection.add(
-            documents=split_documents,
-            ids=ids,
-            metadatas=metadatas,  # type: ignore
+        self._write_chunks(
+            new_chunks.ids, embeddings, new_chunks.documents, new_chunks.metadatas
         )
+        self._update_metadatas(
+            [ids[i] for i in moved], [chunk_metadatas[i] for i in moved]
+        )
+        self._delete_chunks(deleted)
+
+        duration_s = time.perf_counter() - started_at
+        stats: IngestionStats = {
+            "no_documents": len(documents),
+            "no_chunks": len(chunks),
+            "no_new_chunks": len(new),
+            "no_deleted_chunks": len(deleted),
+            "duration_s": duration_s,
+            "chunks_per_s": len(chunks) / duration_s if duration_s > 0 else 0.0,
+        }
 
-    def add_documents(self, documents: list[str], metadatas: list[MetaData]):
-        for document, metadata in zip(documents, metadatas):
-            self.add_document(document, metadata)
+        logger.info(
+            f"Indexed {stats['no_chunks']} chunks of {stats['no_documents']} "
+            f"documents in {duration_s:.2f}s ({stats['chunks_per_s']:.1f} chunks/s), "
+            f"embedded {len(new)} new chunks and deleted {len(deleted)}"
+        )
+
+        return stats, _ChunkChanges(new_chunks, deleted)
+
+    def _group_by_collection(self, user_ids: Iterable[str]) -> dict[str, list[int]]:
+        """
+        Groups the positions of the user ids by the collection of the user.
+        """
+        indices_by_collection: dict[str, list[int]] = {}
+        for i, user_id in enumerate(user_ids):
+            indices_by_collection.setdefault(
+                self._get_collection_name(user_id), []
+            ).append(i)
+
+        return indices_by_collection
+
+    def _get_stored_chunks(self, metadatas: list[MetaData]) -> dict[str, dict]:
+        """
+        Returns the ids and metadata of the stored chunks of the sources.
+        """
+        sources = {m["source_id"]: m["user_id"] for m in metadatas}
+        source_ids = list(sources)
+
+        stored: dict[str, dict] = {}
+
+        for name, indices in self._group_by_collection(sources.values()).items():
+            collection = self._find_collection(name)
+            if collection is None:
+                continue
+
+            collection_source_ids = [source_ids[i] for i in indices]
+
+            for i in range(0, len(collection_source_ids), SOURCE_BATCH_SIZE):
+                where = {
+                    "source_id": {
+                        "$in": collection_source_ids[i : i + SOURCE_BATCH_SIZE]
+                    }
+                }
+
+                for page in self._get_pages(collection, ["metadatas"], where):
+                    stored.update(zip(page["ids"], page["metadatas"]))
+
+        return stored
+
+    def _update_metadatas(self, ids: list[str], metadatas: list[MetaData]) -> None:
+        max_batch_size = self._get_max_batch_size()
+
+        for name, indices in self._group_by_collection(
+            m["user_id"] for m in metadatas
+        ).items():
+            collection = self._get_collection(name)
+
+            for start in range(0, len(indices), max_batch_size):
+                batch = indices[start : start + max_batch_size]
+                collection.update(
+                    ids=[ids[i] for i in batch],
+                    metadatas=[metadatas[i] for i in batch],  # type: ignore
+                )
+
+    def _delete_chunks(self, chunks: dict[str, str]) -> None:
+        chunk_ids = list(chunks)
+        max_batch_size = self._get_max_batch_size()
+
+        for name, indices in self._group_by_collection(chunks.values()).items():
+            collection = self._find_collection(name)
+            if collection is None:
+                continue
+
+            for start in range(0, len(indices), max_batch_size):
+                collection.delete(
+                    ids=[chunk_ids[i] for i in indices[start : start + max_batch_size]]
+                )
+
+    def _write_chunks(
+        self,
+        ids: list[str],
+        embeddings: Embeddings,
+        chunks: list[str],
+        metadatas: list[MetaData],
+    ) -> None:
+        """
+        Writes the chunks to the collections of their users, in as few
+        requests as the server's maximum batch size allows.
+        """
+        max_batch_size = self._get_max_batch_size()
+
+        for name, indices in self._group_by_collection(
+            metadata["user_id"] for metadata in metadatas
+        ).items():
+            collection = self._get_collection(name)
+
+            for start in range(0, len(indices), max_batch_size):
+                batch = indices[start : start + max_batch_size]
+                collection.upsert(
+                    ids=[ids[i] for i in batch],
+                    embeddings=[embeddings[i] for i in batch],
+                    documents=[chunks[i] for i in batch],
+                    metadatas=[metadatas[i] for i in batch],  # type: ignore
+                )
+
+    def copy_collection(self, name: str) -> int:
+        """
+        Copies the chunks of another collection, e.g. the unpartitioned one,
+        into the partitions of their users without embedding them again.
+        """
+        no_chunks = 0
+        user_ids: set[str] = set()
+
+        for page in self._get_pages(
+            self._get_collection(name), ["embeddings", "documents", "metadatas"]
+        ):
+            self._write_chunks(
+                page["ids"], page["embeddings"], page["documents"], page["metadatas"]
+            )
+            no_chunks += len(page["ids"])
+            user_ids |= {str(metadata["user_id"]) for metadata in page["metadatas"]}
+
+        self._invalidate_query_cache(user_ids)
+
+        return no_chunks
 
     def _compose_and_filter(self, filter_values: dict[str, str]) -> Optional[dict]:
         if not filter_values:
@@ -113,26 +659,301 @@ class VectorStore(VectorStoreInterface):
 
         return filter
 
-    def query(
+    async def query(
         self,
         query: str,
         filter_values: QueryFilters,
+        n_results: Optional[int] = None,
     ) -> QueryResult:
+        n_results = n_results or self._n_results
+
+        cache_key = None
+        if self._query_cache:
+            cache_key = self._query_cache.result_key(
+                filter_values["user_id"],
+                query,
+                {**filter_values, "n_results": n_results},
+            )
+            cached = self._query_cache.get_result(cache_key)
+            if cached is not None:
+                return self._copy_result(cast(QueryResult, cached))
+
         query_filter = self._compose_and_filter(cast(dict[str, str], filter_values))
+        query_embedding = np.asarray(await self._embed_query(query))
 
-        results = self._collection.query(
-            query_texts=[query],
-            n_results=self._max_query_results,
-            where=query_filter,
-            include=["documents", "metadatas", "distances"],
+        # diversifying needs more candidates than results to choose from
+        no_candidates = (
+            max(n_results, self._mmr_candidates) if self._mmr_lambda < 1 else n_results
         )
 
+        vector_search = self._run(
+            lambda: self._vector_search(
+                filter_values["user_id"], query_embedding, no_candidates, query_filter
+            )
+        )
+
+        if self._lexical_index:
+            (collection, results), lexical_results = await asyncio.gather(
+                vector_search,
+                self._lexical_index.search(query, dict(filter_values), no_candidates),
+            )
+        else:
+            (collection, results), lexical_results = await vector_search, []
+
+        candidates = [
+            _Candidate(
+                id=chunk_id,
+                document=document,
+                metadata=metadata,  # type: ignore
+                distance=distance,
+                embedding=np.asarray(embedding),
+                relevance=self._cosine_similarity(query_embedding, embedding),
+                lexical=False,
+            )
+            for chunk_id, document, metadata, distance, embedding in zip(
+                results["ids"][0],
+                results["documents"][0] if results["documents"] else [],
+                results["metadatas"][0] if results["metadatas"] else [],
+                results["distances"][0] if results["distances"] else [],
+                results["embeddings"][0] if results["embeddings"] else [],
+            )
+        ]
+
+        if lexical_results and collection is not None:
+            candidates = await self._fuse(
+                collection,
+                query_embedding,
+                candidates,
+                [chunk_id for chunk_id, _ in lexical_results],
+            )
+
+        if self._max_distance is not None:
+            # exact term matches are kept even if their embedding is far off
+            candidates = [
+                c for c in candidates if c.lexical or c.distance <= self._max_distance
+            ]
+
+        selected = self._select_diverse(candidates, n_results)
+
+        query_result: QueryResult = {
+            "ids": [c.id for c in selected],
+            "documents": [c.document for c in selected],
+            "metadatas": [c.metadata for c in selected],
+            "distances": [c.distance for c in selected],
+        }
+
+        if self._query_cache and cache_key:
+            self._query_cache.put_result(
+                cache_key, dict(self._copy_result(query_result))
+            )
+
+        return query_result
+
+    def _vector_search(
+        self,
+        user_id: str,
+        query_embedding: np.ndarray,
+        n_results: int,
+        where: Optional[dict],
+    ) -> tuple[Optional[Collection], dict]:
+        collection = self._find_collection(self._get_collection_name(user_id))
+
+        # the user has not added any content yet
+        if collection is None:
+            return None, {
+                "ids": [[]],
+                "documents": [[]],
+                "metadatas": [[]],
+                "distances": [[]],
+                "embeddings": [[]],
+            }
+
+        results = collection.query(
+            query_embeddings=[query_embedding.tolist()],
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances", "embeddings"],
+        )
+
+        return collection, cast(dict, results)
+
+    def _cosine_similarity(self, a: np.ndarray, b) -> float:
+        b = np.asarray(b)
+        return float(a @ b / ((np.linalg.norm(a) * np.linalg.norm(b)) or 1.0))
+
+    def _select_diverse(
+        self, candidates: list[_Candidate], n_results: int
+    ) -> list[_Candidate]:
+        """
+        Selects n_results candidates by maximal marginal relevance. Every pick
+        maximizes its relevance weighted by mmr_lambda minus its highest
+        similarity to the candidates picked before.
+        """
+        if self._mmr_lambda >= 1 or len(candidates) <= n_results:
+            return candidates[:n_results]
+
+        embeddings = np.array([c.embedding for c in candidates], dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
+        similarities = embeddings @ embeddings.T
+        relevance = np.array([c.relevance for c in candidates])
+
+        selected = [int(np.argmax(relevance))]
+        remaining = [i for i in range(len(candidates)) if i != selected[0]]
+
+        while remaining and len(selected) < n_results:
+            redundancy = similarities[np.ix_(remaining, selected)].max(axis=1)
+            scores = (
+                self._mmr_lambda * relevance[remaining]
+                - (1 - self._mmr_lambda) * redundancy
+            )
+            selected.append(remaining.pop(int(np.argmax(scores))))
+
+        return [candidates[i] for i in selected]
+
+    async def _fuse(
+        self,
+        collection: Collection,
+        query_embedding: np.ndarray,
+        candidates: list[_Candidate],
+        lexical_ids: list[str],
+    ) -> list[_Candidate]:
+        """
+        Ranks the chunks found by either search by their reciprocal rank
+        fusion score. Chunks that were only found lexically are fetched from
+        the collection and get their distance to the query computed locally.
+
+        The fusion scores become the relevance of the chunks after mapping them
+        onto the range of the chunks' cosine similarities to the query. Maximal
+        marginal relevance weighs the relevance against cosine similarities
+        between chunks, so mmr_lambda means the same with and without hybrid
+        search.
+        """
+        scores: dict[str, float] = {}
+        for ranking in ([c.id for c in candidates], lexical_ids):
+            for rank, chunk_id in enumerate(ranking):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1 / (RRF_K + rank + 1)
+
+        chunks = {c.id: c for c in candidates}
+
+        missing_ids = [chunk_id for chunk_id in lexical_ids if chunk_id not in chunks]
+        if missing_ids:
+            missing = await self._run(
+                lambda: collection.get(
+                    ids=missing_ids, include=["documents", "metadatas", "embeddings"]
+                )
+            )
+
+            for chunk_id, document, metadata, stored_embedding in zip(
+                missing["ids"],
+                missing["documents"] or [],
+                missing["metadatas"] or [],
+                missing["embeddings"] or [],
+            ):
+                embedding = np.asarray(stored_embedding)
+                chunks[chunk_id] = _Candidate(
+                    id=chunk_id,
+                    document=document,
+                    metadata=metadata,  # type: ignore
+                    # squared euclidean distance, as reported by chroma
+                    distance=float(np.sum((embedding - query_embedding) ** 2)),
+                    embedding=embedding,
+                    relevance=self._cosine_similarity(query_embedding, embedding),
+                    lexical=True,
+                )
+
+        # chunks deleted from chroma but still in the lexical index are skipped
+        fused_ids = sorted(
+            (chunk_id for chunk_id in scores if chunk_id in chunks),
+            key=lambda chunk_id: -scores[chunk_id],
+        )
+        if not fused_ids:
+            return []
+
+        similarities = [chunks[chunk_id].relevance for chunk_id in fused_ids]
+        min_similarity, max_similarity = min(similarities), max(similarities)
+        min_score, max_score = scores[fused_ids[-1]], scores[fused_ids[0]]
+        lexical_ids_set = set(lexical_ids)
+
+        return [
+            chunks[chunk_id]._replace(
+                relevance=min_similarity
+                + (max_similarity - min_similarity)
+                * (scores[chunk_id] - min_score)
+                / ((max_score - min_score) or 1.0),
+                lexical=chunk_id in lexical_ids_set,
+            )
+            for chunk_id in fused_ids
+        ]
+
+    async def _embed_query(self, query: str) -> list[float]:
+        if self._query_cache:
+            embedding = self._query_cache.get_embedding(query)
+            if embedding is not None:
+                return embedding
+
+        [query_embedding] = await self._run(lambda: self._embedding_function([query]))
+        embedding = [float(value) for value in query_embedding]
+
+        if self._query_cache:
+            self._query_cache.put_embedding(query, embedding)
+
+        return embedding
+
+    def _copy_result(self, result: QueryResult) -> QueryResult:
+        """
+        Copies the lists of a result, so that cached results are not changed
+        by callers.
+        """
         return {
-            "ids": results["ids"][0],
-            "documents": results["documents"][0] if results["documents"] else [],
-            "metadatas": results["metadatas"][0] if results["metadatas"] else [],  # type: ignore
-            "distances": results["distances"][0] if results["distances"] else [],
+            "ids": list(result["ids"]),
+            "documents": list(result["documents"]),
+            "metadatas": list(result["metadatas"]),
+            "distances": list(result["distances"]),
         }
 
-    def _generate_id(self) -> str:
-        return str(uuid4())
+    def _generate_id(self, source_id: str, chunk: str) -> str:
+        chunk_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:16]
+        return f"{source_id}:{chunk_hash}"
+
+
+vector_store: VectorStore
+
+
+def create_vector_store(chroma_client: ClientAPI) -> VectorStore:
+    """
+    Builds the vector store as configured, also for scripts that work on the
+    same collections as the app.
+    """
+    return VectorStore(
+        get_text_splitter(),
+        chroma_client,
+        env_config.VECTOR_STORE_MAX_WORKERS,
+        env_config.EMBEDDING_BATCH_SIZE,
+        QueryCache(
+            max_embeddings=env_config.QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+            max_results=env_config.SEARCH_RESULT_CACHE_MAX_ENTRIES,
+            ttl_s=env_config.SEARCH_RESULT_CACHE_TTL_S,
+        ),
+        partition_mode=env_config.VECTOR_STORE_PARTITION_MODE,
+        partition_buckets=env_config.VECTOR_STORE_PARTITION_BUCKETS,
+        lexical_index=LexicalIndex(
+            LexicalIndexRepository(get_db_connection()),
+            max_users=env_config.LEXICAL_INDEX_MAX_USERS,
+        )
+        if env_config.HYBRID_SEARCH
+        else None,
+        n_results=env_config.VECTOR_STORE_N_RESULTS,
+        max_distance=env_config.VECTOR_STORE_MAX_DISTANCE,
+        mmr_lambda=env_config.VECTOR_STORE_MMR_LAMBDA,
+        mmr_candidates=env_config.VECTOR_STORE_MMR_CANDIDATES,
+    )
+
+
+def init(chroma_client: ClientAPI) -> None:
+    global vector_store
+
+    vector_store = create_vector_store(chroma_client)
+
+
+def get_vector_store() -> VectorStoreInterface:
+    return vector_store
@@ -13,7 +13,7 @@ from adapters.http_models.Content import (
 from adapters.http_models.HttpModels import BaseResponse, EmptyResponse, HTTPException
 from adapters.PDFStorage import PDFStorage
 from adapters.repository import ContentRepository
-from usecases import CreateContentUsecase
+from usecases import CreateContentUsecase, DeleteContentUsecase
 
 logger = logging.getLogger(__name__)
 
@@ -145,9 +145,9 @@ async def get_content(
 async def delete_pdf(
     userID: str,
     id: str,
-    content_repository: Annotated[ContentRepository, Depends()],
+    delete_content_usecase: Annotated[DeleteContentUsecase, Depends()],
 ) -> EmptyResponse:
-    is_deleted = await content_repository.delete_one({"id": id, "user_id": userID})
+    is_deleted = await delete_content_usecase(id, userID)
 
     if not is_deleted:
         message = "Failed to delete content"
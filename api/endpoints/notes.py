@@ -1,11 +1,14 @@
+import hashlib
 import logging
 from datetime import datetime
-from typing import Annotated, Dict, List
+from typing import Annotated, AsyncIterator, Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
 
 from adapters.database_models.Note import (
     Card,
+    GeneratedCard,
     GPTCard,
     Note,
 )
@@ -33,9 +36,12 @@ from dependencies import (
     get_card_source_generator,
     get_deck_service,
 )
-from lib.CardSourceGenerator import CardSourceGenerator
+from lib.CardSourcePool import CardSourcePool, CardSourcePoolSaturatedError
 from lib.GPT import GPTInterface, get_card_generation, get_single_card_generator
+from lib.GPT.CardGeneration import CardGenerationInterface
+from lib.SentenceIndex import SentenceIndex
 from lib.util.limitier import limiter
+from lib.util.SingleFlight import SingleFlight
 
 logger = logging.getLogger("logger")
 
@@ -46,6 +52,12 @@ router = APIRouter(
     tags=["notes"],
 )
 
+generation_flights: SingleFlight = SingleFlight()
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
 
 def map_notes_to_deck(notes: List[Dict]) -> Dict[str, Dict]:
     notes_by_deck_id: Dict[str, Dict] = {}
@@ -59,6 +71,43 @@ def map_notes_to_deck(notes: List[Dict]) -> Dict[str, Dict]:
     return notes_by_deck_id
 
 
+async def find_card_sources(
+    card_source_generator: CardSourcePool,
+    text: str,
+    generated_cards: List[GeneratedCard],
+    sentence_index: SentenceIndex,
+) -> List[Card]:
+    """
+    Searches the sources of all cards of a note in one batch. The chunk a card
+    was generated from is passed as a hint, so only that part of the note is
+    searched.
+    """
+    hints: List[Optional[Tuple[int, int]]] = [
+        (card.chunk_start_index, card.chunk_end_index)
+        if card.chunk_end_index is not None
+        else None
+        for card in generated_cards
+    ]
+
+    sources = await card_source_generator(
+        text,
+        [card.question for card in generated_cards],
+        sentence_index,
+        [card.answer for card in generated_cards],
+        hints,
+    )
+
+    return [
+        Card(
+            question=card.question,
+            answer=card.answer,
+            source_start_index=start_index,
+            source_end_index=end_index,
+        )
+        for card, (start_index, end_index) in zip(generated_cards, sources)
+    ]
+
+
 async def get_or_create_openai_user(user_repo: UserRepository, userID: str) -> str:
     existing_open_ai_user = await user_repo.find_one({"user_id": userID})
 
@@ -74,36 +123,32 @@ async def get_or_create_openai_user(user_repo: UserRepository, userID: str) -> s
     return open_ai_user_id
 
 
-@router.post("", response_model=CardsResponse)
-@limiter.limit(f"{USER_RATE_LIMIT}/minute")
-async def generate_cards(
-    # request needs to be there because of rate limiter
-    request: Request,
+async def create_note_with_cards(
     body: GenerateCardsRequest,
     userID: str,
-    note_repo: Annotated[NoteRepository, Depends()],
-    user_repo: Annotated[UserRepository, Depends()],
-    generate_cards: GPTInterface = Depends(get_card_generation),
-    card_source_generator: CardSourceGenerator = Depends(get_card_source_generator),
-):
+    note_repo: NoteRepository,
+    user_repo: UserRepository,
+    generate_cards: CardGenerationInterface,
+    card_source_generator: CardSourcePool,
+) -> CardsResponseData:
     open_ai_user_id = await get_or_create_openai_user(user_repo, userID)
 
     text = body.text
 
-    generated_cards = generate_cards(text, open_ai_user_id)
+    generated_cards = await generate_cards(text, open_ai_user_id)
 
-    cards_with_source = []
-
-    for card in generated_cards:
-        start_index, end_index = card_source_generator(text, card.question)
+    sentence_index = SentenceIndex.from_text(text)
 
-        card = Card(
-            **card.dict(),
-            source_start_index=start_index,
-            source_end_index=end_index,
+    try:
+        cards_with_source = await find_card_sources(
+            card_source_generator, text, generated_cards, sentence_index
+        )
+    except CardSourcePoolSaturatedError as e:
+        raise HTTPException(
+            status_code=503,
+            message="Failed to generate cards",
+            error=f"Card source attribution is overloaded: {e}",
         )
-
-        cards_with_source.append(card)
 
     note = Note(
         user_id=userID,
@@ -111,21 +156,136 @@ async def generate_cards(
         text=text,
         cards_added=False,
         cards=cards_with_source,
+        sentence_boundaries=sentence_index.boundaries,
         cards_edited_at=None,
         cards_edited=False,
     ).dict(by_alias=True)
 
     id = await note_repo.insert_one(note)
 
-    data = CardsResponseData(
+    return CardsResponseData(
         id=id,
         text=text,
         cards=cards_with_source,
     )
 
+
+@router.post("", response_model=CardsResponse)
+@limiter.limit(f"{USER_RATE_LIMIT}/minute")
+async def generate_cards(
+    # request needs to be there because of rate limiter
+    request: Request,
+    body: GenerateCardsRequest,
+    userID: str,
+    note_repo: Annotated[NoteRepository, Depends()],
+    user_repo: Annotated[UserRepository, Depends()],
+    generate_cards: CardGenerationInterface = Depends(get_card_generation),
+    card_source_generator: CardSourcePool = Depends(get_card_source_generator),
+):
+    # duplicate submissions share the generation that is already running
+    key = ("generate_cards", userID, body.deck_id, hash_text(body.text))
+
+    data = await generation_flights.do(
+        key,
+        lambda: create_note_with_cards(
+            body,
+            userID,
+            note_repo,
+            user_repo,
+            generate_cards,
+            card_source_generator,
+        ),
+    )
+
     return CardsResponse(message="success", data=data)
 
 
+def format_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def stream_note_events(
+    body: GenerateCardsRequest,
+    userID: str,
+    open_ai_user_id: str,
+    note_repo: NoteRepository,
+    generate_cards: CardGenerationInterface,
+    card_source_generator: CardSourcePool,
+) -> AsyncIterator[str]:
+    text = body.text
+    sentence_index = SentenceIndex.from_text(text)
+
+    cards_with_source = []
+
+    try:
+        async for generated_card in generate_cards.stream(text, open_ai_user_id):
+            [card] = await find_card_sources(
+                card_source_generator, text, [generated_card], sentence_index
+            )
+            cards_with_source.append(card)
+
+            yield format_event("card", card.json())
+
+        note = Note(
+            user_id=userID,
+            deck_id=body.deck_id,
+            text=text,
+            cards_added=False,
+            cards=cards_with_source,
+            sentence_boundaries=sentence_index.boundaries,
+            cards_edited_at=None,
+            cards_edited=False,
+        ).dict(by_alias=True)
+
+        id = await note_repo.insert_one(note)
+    except Exception as e:
+        logger.error(f"Failed to stream cards: {e}")
+        yield format_event("error", '{"message": "Failed to generate cards"}')
+        return
+
+    data = CardsResponseData(
+        id=id,
+        text=text,
+        cards=cards_with_source,
+    )
+
+    yield format_event("done", data.json())
+
+
+@router.post("/stream")
+@limiter.limit(f"{USER_RATE_LIMIT}/minute")
+async def stream_cards(
+    # request needs to be there because of rate limiter
+    request: Request,
+    body: GenerateCardsRequest,
+    userID: str,
+    note_repo: Annotated[NoteRepository, Depends()],
+    user_repo: Annotated[UserRepository, Depends()],
+    generate_cards: CardGenerationInterface = Depends(get_card_generation),
+    card_source_generator: CardSourcePool = Depends(get_card_source_generator),
+):
+    """
+    Streams every card as a server-sent "card" event as soon as it is generated.
+    The persisted note is sent as a final "done" event.
+    """
+    open_ai_user_id = await get_or_create_openai_user(user_repo, userID)
+
+    events = stream_note_events(
+        body,
+        userID,
+        open_ai_user_id,
+        note_repo,
+        generate_cards,
+        card_source_generator,
+    )
+
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post(
     "/{id}/cards", response_model=AddedCardsResponse, response_model_by_alias=True
 )
@@ -208,22 +368,19 @@ async def get_note(
     return NotesResponse(message="success", data=data)
 
 
-@router.post("/{id}/card", response_model=CardResponse)
-@limiter.limit(f"{USER_RATE_LIMIT}/minute")
-async def generate_card(
+async def add_generated_card(
     id: str,
-    request: Request,
     body: GenerateCardRequest,
     userID: str,
-    user_repo: Annotated[UserRepository, Depends()],
-    note_repo: Annotated[NoteRepository, Depends()],
-    generate_card: GPTInterface = Depends(get_single_card_generator),
-):
+    user_repo: UserRepository,
+    note_repo: NoteRepository,
+    generate_card: GPTInterface,
+) -> CardResponseData:
     openai_user_id = await get_or_create_openai_user(user_repo, userID)
 
     text = body.text
 
-    generated_card: GPTCard = generate_card(
+    generated_card: GPTCard = await generate_card(
         text,
         openai_user_id,
     )
@@ -244,5 +401,34 @@ async def generate_card(
         },
     )
 
-    data = CardResponseData(id=id, text=text, card=card)
+    return CardResponseData(id=id, text=text, card=card)
+
+
+@router.post("/{id}/card", response_model=CardResponse)
+@limiter.limit(f"{USER_RATE_LIMIT}/minute")
+async def generate_card(
+    id: str,
+    request: Request,
+    body: GenerateCardRequest,
+    userID: str,
+    user_repo: Annotated[UserRepository, Depends()],
+    note_repo: Annotated[NoteRepository, Depends()],
+    generate_card: GPTInterface = Depends(get_single_card_generator),
+):
+    key = (
+        "generate_card",
+        userID,
+        id,
+        body.source_start_index,
+        body.source_end_index,
+        hash_text(body.text),
+    )
+
+    data = await generation_flights.do(
+        key,
+        lambda: add_generated_card(
+            id, body, userID, user_repo, note_repo, generate_card
+        ),
+    )
+
     return CardResponse(message="success", data=data)
@@ -10,7 +10,8 @@ from adapters.http_models.SearchResults import (
 )
 from adapters.vector_store.VectorStore import (
     ContentSourceType,
-    VectorStore,
+    VectorStoreInterface,
+    get_vector_store,
 )
 from lib.GPT.GPTInterface import GPTInterface
 from lib.GPT.QuestionAnswerGPT import get_qa_model
@@ -43,10 +44,10 @@ def build_gpt_context(documents: list[str]) -> str:
 async def search(
     userID: str,
     query: str,
-    vector_store: Annotated[VectorStore, Depends()],
+    vector_store: Annotated[VectorStoreInterface, Depends(get_vector_store)],
     qa_gpt: GPTInterface = Depends(get_qa_model),
 ):
-    results = vector_store.query(
+    results = await vector_store.query(
         query,
         {
             "user_id": userID,
@@ -68,17 +69,23 @@ async def search(
                 {
                     "id": source_id,
                     "document": document,
+                    # chunks stored before offsets were recorded have none
+                    "span": (metadata["chunk_start"], metadata["chunk_end"])
+                    if "chunk_start" in metadata
+                    else None,
                 }
             )
 
-    context_docs = []
-
-    for source_type in INCLUDE_SOURCE_TYPES:
-        if len(query_results[source_type]) > 0:
-            context_docs += query_results[source_type][0]["document"]
+    # the results are already cut off by relevance and diversified, so all of
+    # them are used as context in the order of their rank
+    context_docs = [
+        document
+        for document, metadata in zip(results["documents"], results["metadatas"])
+        if metadata["source_type"] in query_results
+    ]
 
     if len(context_docs) > 0:
-        answer = qa_gpt(context_docs, query, userID)
+        answer = await qa_gpt(context_docs, query, userID)
     else:
         answer = "Could not find any results in your knowledge base. Please refine your question."
 
@@ -90,6 +97,7 @@ async def search(
                 SearchResult(
                     type=source_type,
                     ids=[result["id"] for result in query_results[source_type]],
+                    spans=[result["span"] for result in query_results[source_type]],
                 )
             )
 
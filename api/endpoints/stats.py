@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends
+
+from adapters.http_models.Stats import LLMStatsData, LLMStatsResponse
+from lib.CompletionCache import CompletionCache, get_completion_cache
+from lib.CompletionScheduler import CompletionScheduler, get_completion_scheduler
+
+router = APIRouter(
+    prefix="/stats",
+    tags=["stats"],
+)
+
+
+@router.get("/llm", response_model=LLMStatsResponse)
+async def get_llm_stats(
+    scheduler: CompletionScheduler = Depends(get_completion_scheduler),
+    cache: CompletionCache = Depends(get_completion_cache),
+):
+    data = LLMStatsData(scheduler=scheduler.stats(), cache=cache.stats())
+
+    return LLMStatsResponse(message="success", data=data)
@@ -2,11 +2,13 @@ from fastapi import APIRouter
 
 from api.endpoints.content import router as content_router
 from api.endpoints.notes import router as notes_router
+from api.endpoints.stats import router as stats_router
 
 routers = APIRouter()
 router_list = [
     notes_router,
     content_router,
+    stats_router,
 ]
 
 for router in router_list:
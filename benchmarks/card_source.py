@@ -0,0 +1,93 @@
+"""
+Measures the latency of the question answering backends used for card source
+attribution.
+
+    python -m benchmarks.card_source --runs 20
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+from config import env_config
+from lib.QuestionAnswering import (
+    ONNXBackend,
+    PipelineBackend,
+    QuestionAnsweringBackend,
+)
+
+CONTEXT = " ".join(
+    [
+        "The mitochondrion is the powerhouse of the cell.",
+        "It produces ATP through cellular respiration.",
+        "Photosynthesis takes place in the chloroplasts of plant cells.",
+        "The nucleus contains most of the genetic material of the cell.",
+        "Ribosomes translate messenger RNA into proteins.",
+        "The cell membrane controls what enters and leaves the cell.",
+    ]
+    * 4
+)
+
+QUESTIONS = [
+    "What is the powerhouse of the cell?",
+    "How does the mitochondrion produce ATP?",
+    "Where does photosynthesis take place?",
+    "What does the nucleus contain?",
+    "What do ribosomes do?",
+    "What controls what enters the cell?",
+    "What is produced through cellular respiration?",
+    "Which cells contain chloroplasts?",
+]
+
+
+def benchmark(
+    name: str, backend: QuestionAnsweringBackend, runs: int, batch_size: int
+) -> None:
+    # the first call initializes lazy state and is not representative
+    backend(QUESTIONS, [CONTEXT] * len(QUESTIONS), batch_size)
+
+    latencies = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        backend(QUESTIONS, [CONTEXT] * len(QUESTIONS), batch_size)
+        latencies.append(time.perf_counter() - started_at)
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    print(
+        f"{name:<10} {len(QUESTIONS)} questions: "
+        f"median {statistics.median(latencies) * 1000:.1f}ms, "
+        f"p95 {p95 * 1000:.1f}ms, "
+        f"{len(QUESTIONS) * runs / sum(latencies):.1f} questions/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument(
+        "--batch-size", type=int, default=env_config.CARD_SOURCE_BATCH_SIZE
+    )
+    parser.add_argument(
+        "--threads", type=int, default=env_config.CARD_SOURCE_INTRA_OP_THREADS
+    )
+    args = parser.parse_args()
+
+    model_path = env_config.BERT_MODEL_PATH
+
+    with tempfile.TemporaryDirectory() as onnx_dir:
+        backends = {
+            "pipeline": PipelineBackend(model_path),
+            "onnx": ONNXBackend(model_path, onnx_dir, intra_op_threads=args.threads),
+            "onnx-int8": ONNXBackend(
+                model_path, onnx_dir, quantize=True, intra_op_threads=args.threads
+            ),
+        }
+
+        for name, backend in backends.items():
+            benchmark(name, backend, args.runs, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from typing import Literal
+from typing import Literal, Optional
 
 from dotenv import find_dotenv, load_dotenv
 from pydantic import BaseSettings, Field, validator
@@ -8,6 +8,16 @@ class EnvConfig(BaseSettings):
     PORT: int = Field(8000, env="PORT")
     LOG_LEVEL: str = Field("info", env="LOG_LEVEL")
     OPENAI_API_KEY: str = Field(None, env="OPENAI_API_KEY")
+    OPENAI_REQUEST_TIMEOUT_S: float = Field(60, env="OPENAI_REQUEST_TIMEOUT_S")
+    OPENAI_MAX_CONNECTIONS: int = Field(20, env="OPENAI_MAX_CONNECTIONS")
+    OPENAI_RETRY_DEADLINE_S: float = Field(120, env="OPENAI_RETRY_DEADLINE_S")
+    OPENAI_REQUESTS_PER_MINUTE: int = Field(3500, env="OPENAI_REQUESTS_PER_MINUTE")
+    OPENAI_TOKENS_PER_MINUTE: int = Field(90000, env="OPENAI_TOKENS_PER_MINUTE")
+    COMPLETION_CACHE_MAX_ENTRIES: int = Field(1000, env="COMPLETION_CACHE_MAX_ENTRIES")
+    COMPLETION_CACHE_TTL_S: int = Field(7 * 24 * 3600, env="COMPLETION_CACHE_TTL_S")
+    COMPLETION_CACHE_ALLOW_NONDETERMINISTIC: bool = Field(
+        False, env="COMPLETION_CACHE_ALLOW_NONDETERMINISTIC"
+    )
     MONGO_DB_CONNECTION: str = Field(
         "mongodb://127.0.0.1:27017", env="MONGO_DB_CONNECTION"
     )
@@ -21,18 +31,79 @@ class EnvConfig(BaseSettings):
     DATABASE: str = Field("spacey", env="DATABASE")
     ENV: Literal["development", "production"] = Field("development", env="ENV")
     MAX_TEXT_LENGTH: int = Field(1000, env="MAX_TEXT_LENGTH")
+    CONTENT_FLIGHT_TTL_S: int = Field(3600, env="CONTENT_FLIGHT_TTL_S")
     CHROMA_HOST: str = Field("localhost", env="CHROMA_HOST")
     CHROMA_PORT: str = Field("8000", env="CHROMA_PORT")
+    VECTOR_STORE_MAX_WORKERS: int = Field(4, env="VECTOR_STORE_MAX_WORKERS")
+    EMBEDDING_BATCH_SIZE: int = Field(64, env="EMBEDDING_BATCH_SIZE")
+    VECTOR_STORE_PARTITION_MODE: Literal["none", "user", "bucket"] = Field(
+        "none", env="VECTOR_STORE_PARTITION_MODE"
+    )
+    VECTOR_STORE_PARTITION_BUCKETS: int = Field(
+        64, env="VECTOR_STORE_PARTITION_BUCKETS"
+    )
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES: int = Field(
+        1000, env="QUERY_EMBEDDING_CACHE_MAX_ENTRIES"
+    )
+    SEARCH_RESULT_CACHE_MAX_ENTRIES: int = Field(
+        1000, env="SEARCH_RESULT_CACHE_MAX_ENTRIES"
+    )
+    SEARCH_RESULT_CACHE_TTL_S: int = Field(300, env="SEARCH_RESULT_CACHE_TTL_S")
+    VECTOR_RECONCILE_INTERVAL_S: int = Field(60, env="VECTOR_RECONCILE_INTERVAL_S")
+    VECTOR_ORPHAN_SCAN_INTERVAL_S: int = Field(
+        24 * 3600, env="VECTOR_ORPHAN_SCAN_INTERVAL_S"
+    )
+    VECTOR_STORE_N_RESULTS: int = Field(5, env="VECTOR_STORE_N_RESULTS")
+    # squared euclidean distance of normalized embeddings, 2 - 2 * cosine similarity
+    VECTOR_STORE_MAX_DISTANCE: Optional[float] = Field(
+        1.5, env="VECTOR_STORE_MAX_DISTANCE"
+    )
+    VECTOR_STORE_MMR_LAMBDA: float = Field(0.7, env="VECTOR_STORE_MMR_LAMBDA")
+    VECTOR_STORE_MMR_CANDIDATES: int = Field(20, env="VECTOR_STORE_MMR_CANDIDATES")
+    HYBRID_SEARCH: bool = Field(False, env="HYBRID_SEARCH")
+    LEXICAL_INDEX_MAX_USERS: int = Field(100, env="LEXICAL_INDEX_MAX_USERS")
+    # gpt-3.5-turbo tokens, kept below the 256 WordPiece tokens the embedding
+    # model reads as WordPiece splits the same text into more tokens
+    TEXT_SPLITTER_MAX_TOKENS: int = Field(192, env="TEXT_SPLITTER_MAX_TOKENS")
 
     BERT_MODEL_PATH: str = Field(
         "distilbert/distilbert-base-cased-distilled-squad", env="BERT_MODEL_PATH"
     )
+    CARD_SOURCE_BATCH_SIZE: int = Field(8, env="CARD_SOURCE_BATCH_SIZE")
+    CARD_SOURCE_MODE: Literal["qa", "embedding"] = Field("qa", env="CARD_SOURCE_MODE")
+    CARD_SOURCE_SIMILARITY_THRESHOLD: float = Field(
+        0.5, env="CARD_SOURCE_SIMILARITY_THRESHOLD"
+    )
+    CARD_SOURCE_BACKEND: Literal["pipeline", "onnx"] = Field(
+        "pipeline", env="CARD_SOURCE_BACKEND"
+    )
+    CARD_SOURCE_ONNX_DIR: str = Field("models/card_source", env="CARD_SOURCE_ONNX_DIR")
+    CARD_SOURCE_QUANTIZE: bool = Field(False, env="CARD_SOURCE_QUANTIZE")
+    CARD_SOURCE_INTRA_OP_THREADS: int = Field(0, env="CARD_SOURCE_INTRA_OP_THREADS")
+    # the token limits of the question answering model inputs and answers
+    CARD_SOURCE_MAX_SEQ_LEN: int = Field(384, env="CARD_SOURCE_MAX_SEQ_LEN")
+    CARD_SOURCE_DOC_STRIDE: int = Field(128, env="CARD_SOURCE_DOC_STRIDE")
+    CARD_SOURCE_MAX_QUESTION_LEN: int = Field(64, env="CARD_SOURCE_MAX_QUESTION_LEN")
+    CARD_SOURCE_MAX_ANSWER_LEN: int = Field(15, env="CARD_SOURCE_MAX_ANSWER_LEN")
+    CARD_SOURCE_WORKERS: int = Field(1, env="CARD_SOURCE_WORKERS")
+    CARD_SOURCE_MAX_BATCH_QUESTIONS: int = Field(
+        32, env="CARD_SOURCE_MAX_BATCH_QUESTIONS"
+    )
+    CARD_SOURCE_MAX_PENDING: int = Field(256, env="CARD_SOURCE_MAX_PENDING")
+    CARD_SOURCE_BATCH_WAIT_MS: int = Field(10, env="CARD_SOURCE_BATCH_WAIT_MS")
 
     QA_CFG_NAME: str = Field("qa", env="QA_CFG_NAME")
     CARD_GENERATION_CFG_NAME: str = Field(
         "card_generation", env="CARD_GENERATION_CFG_NAME"
     )
+    CARD_GENERATION_MAX_CONCURRENCY: int = Field(
+        4, env="CARD_GENERATION_MAX_CONCURRENCY"
+    )
     SUMMARIZER_CFG_NAME: str = Field("summarization", env="SUMMARIZER_CFG_NAME")
+    SUMMARIZER_MAX_CONCURRENCY: int = Field(4, env="SUMMARIZER_MAX_CONCURRENCY")
+    SUMMARIZER_HIERARCHICAL_REDUCE: bool = Field(
+        False, env="SUMMARIZER_HIERARCHICAL_REDUCE"
+    )
     SINGLE_CARD_GENERATION_CFG_NAME: str = Field(
         "single_card_generation", env="SINGLE_CARD_GENERATION_CFG_NAME"
     )
@@ -46,6 +117,14 @@ class EnvConfig(BaseSettings):
     def transform_log_level(cls, log_level):
         return log_level.upper()
 
+    @validator("VECTOR_STORE_MAX_DISTANCE", pre=True)
+    def transform_max_distance(cls, max_distance):
+        # an empty value or "none" turns the cutoff off
+        if str(max_distance).strip().lower() in ("", "none"):
+            return None
+
+        return max_distance
+
     def is_dev(self):
         return self.ENV == "development"
 
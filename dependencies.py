@@ -1,11 +1,35 @@
+from typing import Union
+
 from adapters.DeckServiceAPI import DeckServiceAPI
 from config import env_config
-from lib.CardSourceGenerator import CardSourceGenerator, CardSourceGeneratorMock
+from lib.CardSourceGenerator import CardSourceGeneratorMock
+from lib.CardSourcePool import BackendConfig, CardSourcePool
 
 deck_service = DeckServiceAPI(env_config)
 
-card_source_generator = (
-    CardSourceGenerator() if env_config.is_prod() else CardSourceGeneratorMock()
+card_source_generator: Union[CardSourcePool, CardSourceGeneratorMock] = (
+    CardSourcePool(
+        BackendConfig(
+            name=env_config.CARD_SOURCE_BACKEND,
+            model_path=env_config.BERT_MODEL_PATH,
+            onnx_dir=env_config.CARD_SOURCE_ONNX_DIR,
+            quantize=env_config.CARD_SOURCE_QUANTIZE,
+            intra_op_threads=env_config.CARD_SOURCE_INTRA_OP_THREADS,
+            batch_size=env_config.CARD_SOURCE_BATCH_SIZE,
+            mode=env_config.CARD_SOURCE_MODE,
+            similarity_threshold=env_config.CARD_SOURCE_SIMILARITY_THRESHOLD,
+            max_seq_len=env_config.CARD_SOURCE_MAX_SEQ_LEN,
+            doc_stride=env_config.CARD_SOURCE_DOC_STRIDE,
+            max_question_len=env_config.CARD_SOURCE_MAX_QUESTION_LEN,
+            max_answer_len=env_config.CARD_SOURCE_MAX_ANSWER_LEN,
+        ),
+        workers=env_config.CARD_SOURCE_WORKERS,
+        max_batch_questions=env_config.CARD_SOURCE_MAX_BATCH_QUESTIONS,
+        max_pending=env_config.CARD_SOURCE_MAX_PENDING,
+        max_wait_s=env_config.CARD_SOURCE_BATCH_WAIT_MS / 1000,
+    )
+    if env_config.is_prod()
+    else CardSourceGeneratorMock()
 )
 
 
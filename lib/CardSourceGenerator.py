@@ -1,44 +1,296 @@
 import re
-from typing import Tuple
+from typing import Callable, List, NamedTuple, Optional, Tuple
 
-from transformers import pipeline  # type: ignore
+import numpy as np
+from chromadb.api.types import Embeddings
 
-from config import env_config
+from lib.QuestionAnswering import QuestionAnsweringBackend
+from lib.SentenceIndex import SentenceIndex
+
+# matches chroma's embedding functions, e.g. DefaultEmbeddingFunction
+EmbeddingFunction = Callable[[List[str]], Embeddings]
+
+PARAGRAPH_SEPARATOR = re.compile(r"\n\s*\n")
+
+Span = Tuple[int, int]
 
 
 class CardSourceGeneratorMock:
-    def __call__(self, text: str, question: str) -> Tuple[int, int]:
-        return 0, len(text) // 2
+    async def __call__(
+        self,
+        text: str,
+        questions: List[str],
+        sentence_index: Optional[SentenceIndex] = None,
+        answers: Optional[List[str]] = None,
+        hints: Optional[List[Optional[Span]]] = None,
+    ) -> List[Tuple[int, int]]:
+        return [(0, len(text) // 2) for _ in questions]
+
+
+class SourceRequest(NamedTuple):
+    text: str
+    questions: List[str]
+    sentence_index: Optional[SentenceIndex] = None
+    # the answers of the cards, improve the embedding similarity match
+    answers: Optional[List[str]] = None
+    # the part of the text each card was generated from, if known
+    hints: Optional[List[Optional[Span]]] = None
 
 
 class CardSourceGenerator:
-    def __init__(self) -> None:
-        self._qa_model = pipeline(
-            "question-answering",
-            model=env_config.BERT_MODEL_PATH,
-            tokenizer=env_config.BERT_MODEL_PATH,
+    """
+    Finds the sentences of a text that cards were generated from.
+
+    By default every question is answered by the extractive question answering
+    model. If an embedding function is given, the sentences and the cards are
+    embedded instead and every card is matched to its most similar sentence.
+    The question answering model is then only used for cards whose best
+    similarity is below similarity_threshold.
+
+    For question answering, the text is split into paragraph aligned windows
+    that fit into the model next to a question. A card with a hint is only
+    matched against the windows and sentences overlapping its hint.
+    """
+
+    def __init__(
+        self,
+        qa_backend: QuestionAnsweringBackend,
+        batch_size: int = 8,
+        embedding_function: Optional[EmbeddingFunction] = None,
+        similarity_threshold: float = 0.5,
+    ):
+        self._qa_backend = qa_backend
+        self._batch_size = batch_size
+        self._embedding_function = embedding_function
+        self._similarity_threshold = similarity_threshold
+
+    def __call__(
+        self,
+        text: str,
+        questions: List[str],
+        sentence_index: Optional[SentenceIndex] = None,
+        answers: Optional[List[str]] = None,
+        hints: Optional[List[Optional[Span]]] = None,
+    ) -> List[Tuple[int, int]]:
+        """
+        Finds the source sentence of every question within the same text.
+        All questions are answered in batched forward passes.
+        """
+        [sources] = self.find_sources(
+            [SourceRequest(text, questions, sentence_index, answers, hints)]
         )
+        return sources
+
+    def find_sources(
+        self, requests: List[SourceRequest]
+    ) -> List[List[Tuple[int, int]]]:
+        """
+        Finds the sources of several texts, e.g. of different notes, in the
+        same batched forward passes.
+        """
+        sentence_indices = [
+            request.sentence_index or SentenceIndex.from_text(request.text)
+            for request in requests
+        ]
+        sources: List[List[Optional[Tuple[int, int]]]] = [
+            [None] * len(request.questions) for request in requests
+        ]
+
+        if self._embedding_function:
+            self._match_by_similarity(requests, sentence_indices, sources)
+
+        self._match_by_question_answering(requests, sentence_indices, sources)
+
+        # every card keeps a source, cards without an answer point at the part
+        # of the text they were generated from
+        return [
+            [
+                source or self._get_fallback_source(request, j)
+                for j, source in enumerate(request_sources)
+            ]
+            for request, request_sources in zip(requests, sources)
+        ]
+
+    def _get_fallback_source(self, request: SourceRequest, j: int) -> Span:
+        hint = request.hints[j] if request.hints else None
+        return hint or (0, len(request.text))
+
+    def _match_by_similarity(
+        self,
+        requests: List[SourceRequest],
+        sentence_indices: List[SentenceIndex],
+        sources: List[List[Optional[Tuple[int, int]]]],
+    ) -> None:
+        assert self._embedding_function is not None
+
+        sentences = [
+            [request.text[start:end] for start, end in sentence_index.boundaries]
+            for request, sentence_index in zip(requests, sentence_indices)
+        ]
+        cards = [
+            [
+                f"{question} {answer}"
+                for question, answer in zip(
+                    request.questions, request.answers or [""] * len(request.questions)
+                )
+            ]
+            for request in requests
+        ]
+
+        texts = [t for s, c in zip(sentences, cards) for t in s + c]
+        if not texts:
+            return
+
+        # embeds the sentences and cards of all requests in one batch
+        embeddings = np.asarray(self._embedding_function(texts), dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
+
+        offset = 0
+
+        for i, sentence_index in enumerate(sentence_indices):
+            no_sentences, no_cards = len(sentences[i]), len(cards[i])
+
+            sentence_embeddings = embeddings[offset : offset + no_sentences]
+            card_embeddings = embeddings[
+                offset + no_sentences : offset + no_sentences + no_cards
+            ]
+            offset += no_sentences + no_cards
+
+            if not no_sentences or not no_cards:
+                continue
+
+            similarities = card_embeddings @ sentence_embeddings.T
 
-    def __call__(self, text: str, question: str) -> Tuple[int, int]:
-        answer = self._qa_model(question=question, context=text)  # type: ignore
+            hints = requests[i].hints
+            if hints:
+                similarities[~self._get_hint_mask(sentence_index, hints)] = -np.inf
 
-        start, end = self._find_sentence_indices(text, answer["start"], answer["end"])
-        return start, end
+            best_sentences = similarities.argmax(axis=1)
+            best_similarities = similarities.max(axis=1)
 
-    def _find_sentence_indices(
-        self, text: str, substring_start: int, substring_end: int
-    ) -> Tuple[int, int]:
+            boundaries = sentence_index.boundaries
+
+            for j, (sentence, similarity) in enumerate(
+                zip(best_sentences, best_similarities)
+            ):
+                if similarity >= self._similarity_threshold:
+                    sources[i][j] = boundaries[sentence]
+
+    def _get_hint_mask(
+        self, sentence_index: SentenceIndex, hints: List[Optional[Span]]
+    ) -> np.ndarray:
+        """
+        Marks for every card the sentences that overlap with its hint.
+        """
+        boundaries = np.array(sentence_index.boundaries).reshape(-1, 2)
+        hint_spans = np.array(
+            [hint if hint else (0, np.iinfo(np.int64).max) for hint in hints]
+        )
+
+        return (boundaries[None, :, 0] < hint_spans[:, None, 1]) & (
+            boundaries[None, :, 1] > hint_spans[:, None, 0]
+        )
+
+    def _get_windows(self, text: str, sentence_index: SentenceIndex) -> List[Span]:
         """
-        Finds the starting and ending indices of the sentence that contains the substring.
+        Packs consecutive paragraphs into windows of at most max_context_tokens.
+        Paragraphs that are longer on their own are split at sentence boundaries.
         """
-        sentences = re.split(r"\n|(?<=[.!?])\s+", text)
-        substring = text[substring_start:substring_end]
+        max_tokens = self._qa_backend.max_context_tokens
+
+        paragraphs = []
+        start = 0
+        for separator in PARAGRAPH_SEPARATOR.finditer(text):
+            if separator.start() > start:
+                paragraphs.append((start, separator.start()))
+            start = separator.end()
+        if start < len(text):
+            paragraphs.append((start, len(text)))
+
+        if not paragraphs:
+            return [(0, len(text))]
+
+        counts = self._qa_backend.count_tokens([text[s:e] for s, e in paragraphs])
+
+        segments: List[Tuple[int, int, int]] = []
+        for (start, end), count in zip(paragraphs, counts):
+            if count <= max_tokens:
+                segments.append((start, end, count))
+                continue
+
+            sentences = [
+                (start + s, start + e)
+                for s, e in sentence_index.window(start, end).boundaries
+            ]
+            sentence_counts = self._qa_backend.count_tokens(
+                [text[s:e] for s, e in sentences]
+            )
+            segments += [(s, e, c) for (s, e), c in zip(sentences, sentence_counts)]
+
+        windows = []
+        window_start, window_end, window_tokens = segments[0]
+
+        for start, end, count in segments[1:]:
+            if window_tokens + count > max_tokens:
+                windows.append((window_start, window_end))
+                window_start, window_tokens = start, 0
+
+            window_end = end
+            window_tokens += count
+
+        windows.append((window_start, window_end))
+
+        return windows
+
+    def _match_by_question_answering(
+        self,
+        requests: List[SourceRequest],
+        sentence_indices: List[SentenceIndex],
+        sources: List[List[Optional[Tuple[int, int]]]],
+    ) -> None:
+        unmatched = [
+            (i, j)
+            for i, request_sources in enumerate(sources)
+            for j, source in enumerate(request_sources)
+            if source is None
+        ]
+
+        if not unmatched:
+            return
+
+        # the windows of a text are computed once and shared by all its cards
+        windows = {
+            i: self._get_windows(requests[i].text, sentence_indices[i])
+            for i in {i for i, _ in unmatched}
+        }
+
+        pairs = []
+        for i, j in unmatched:
+            hints = requests[i].hints
+            hint = hints[j] if hints else None
+
+            candidates = [
+                (start, end)
+                for start, end in windows[i]
+                if not hint or (start < hint[1] and end > hint[0])
+            ]
+
+            for start, end in candidates or windows[i]:
+                pairs.append((i, j, start, end))
+
+        answers = self._qa_backend(
+            [requests[i].questions[j] for i, j, _, _ in pairs],
+            [requests[i].text[start:end] for i, _, start, end in pairs],
+            self._batch_size,
+        )
+
+        best_scores: dict[Tuple[int, int], float] = {}
 
-        for sentence in sentences:
-            index = sentence.lower().find(substring.lower())
-            if index != -1:
-                start = text.index(sentence)
-                end = start + len(sentence)
-                return start, end
+        for (i, j, window_start, _), answer in zip(pairs, answers):
+            if answer["score"] <= best_scores.get((i, j), -1.0):
+                continue
 
-        return substring_start, substring_end
+            best_scores[(i, j)] = answer["score"]
+            sources[i][j] = sentence_indices[i].find_enclosing(
+                window_start + answer["start"], window_start + answer["end"]
+            )
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Literal, NamedTuple, Optional, Tuple
+
+from chromadb.utils import embedding_functions
+
+from lib.CardSourceGenerator import CardSourceGenerator, SourceRequest, Span
+from lib.QuestionAnswering import (
+    QuestionAnsweringBackendName,
+    get_question_answering_backend,
+)
+from lib.SentenceIndex import SentenceIndex
+
+logger = logging.getLogger(__name__)
+
+
+class CardSourcePoolSaturatedError(Exception):
+    pass
+
+
+CardSourceMode = Literal["qa", "embedding"]
+
+
+class BackendConfig(NamedTuple):
+    name: QuestionAnsweringBackendName
+    model_path: str
+    onnx_dir: str
+    quantize: bool
+    intra_op_threads: int
+    batch_size: int
+    mode: CardSourceMode = "qa"
+    similarity_threshold: float = 0.5
+    max_seq_len: int = 384
+    doc_stride: int = 128
+    max_question_len: int = 64
+    max_answer_len: int = 15
+
+
+# the card source generator of the current worker process
+_worker_generator: Optional[CardSourceGenerator] = None
+
+
+def _init_worker(config: BackendConfig) -> None:
+    global _worker_generator
+
+    backend = get_question_answering_backend(
+        config.name,
+        config.model_path,
+        config.onnx_dir,
+        quantize=config.quantize,
+        intra_op_threads=config.intra_op_threads,
+        max_seq_len=config.max_seq_len,
+        doc_stride=config.doc_stride,
+        max_question_len=config.max_question_len,
+        max_answer_len=config.max_answer_len,
+    )
+    embedding_function = (
+        embedding_functions.DefaultEmbeddingFunction()
+        if config.mode == "embedding"
+        else None
+    )
+
+    _worker_generator = CardSourceGenerator(
+        backend,
+        config.batch_size,
+        embedding_function=embedding_function,
+        similarity_threshold=config.similarity_threshold,
+    )
+
+
+def _find_sources(requests: List[SourceRequest]) -> List[List[Tuple[int, int]]]:
+    assert _worker_generator is not None, "Worker has not been initialized."
+    return _worker_generator.find_sources(requests)
+
+
+class _PendingRequest(NamedTuple):
+    request: SourceRequest
+    future: asyncio.Future
+
+
+class CardSourcePool:
+    """
+    Runs card source attribution in dedicated worker processes.
+
+    Inference is CPU bound and holds the GIL, so running it in the API process
+    blocks the event loop. Requests that arrive within max_wait_s of each other
+    are answered in one batch, also across users. At most one batch per worker
+    is in flight. Once max_pending questions are queued or running, new
+    requests are rejected with CardSourcePoolSaturatedError instead of queueing
+    up without bound. A request is always admitted by an idle pool, even if it
+    has more than max_pending questions on its own.
+    """
+
+    def __init__(
+        self,
+        backend_config: BackendConfig,
+        workers: int = 1,
+        max_batch_questions: int = 32,
+        max_pending: int = 256,
+        max_wait_s: float = 0.01,
+    ):
+        self._backend_config = backend_config
+        self._workers = workers
+        self._max_batch_questions = max_batch_questions
+        self._max_pending = max_pending
+        self._max_wait_s = max_wait_s
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._queue: List[_PendingRequest] = []
+        self._no_pending = 0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: set[asyncio.Task] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> None:
+        """
+        Starts the worker processes, which load the model in the background.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers,
+                # forking a process that already runs threads is unsafe
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self._backend_config,),
+            )
+
+            # starts every worker, which loads the model before the first
+            # request arrives
+            for _ in range(self._workers):
+                self._executor.submit(_find_sources, [])
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def __call__(
+        self,
+        text: str,
+        questions: List[str],
+        sentence_index: Optional[SentenceIndex] = None,
+        answers: Optional[List[str]] = None,
+        hints: Optional[List[Optional[Span]]] = None,
+    ) -> List[Tuple[int, int]]:
+        if not questions:
+            return []
+
+        if self._no_pending and self._no_pending + len(questions) > self._max_pending:
+            raise CardSourcePoolSaturatedError(
+                f"{self._no_pending} questions are already pending."
+            )
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._slots = asyncio.Semaphore(self._workers)
+            self._dispatcher = None
+            self._loop = loop
+
+        future = loop.create_future()
+        self._queue.append(
+            _PendingRequest(
+                SourceRequest(text, questions, sentence_index, answers, hints), future
+            )
+        )
+        self._no_pending += len(questions)
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+
+        return await future
+
+    async def _dispatch(self) -> None:
+        assert self._slots is not None
+
+        while self._queue:
+            # gives concurrent requests the chance to join the batch
+            await asyncio.sleep(self._max_wait_s)
+            await self._slots.acquire()
+
+            batch = self._take_batch()
+
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def _take_batch(self) -> List[_PendingRequest]:
+        batch: List[_PendingRequest] = []
+        no_questions = 0
+
+        while self._queue:
+            no_request_questions = len(self._queue[0].request.questions)
+            if (
+                batch
+                and no_questions + no_request_questions > self._max_batch_questions
+            ):
+                break
+
+            batch.append(self._queue.pop(0))
+            no_questions += no_request_questions
+
+        return batch
+
+    async def _run(self, batch: List[_PendingRequest]) -> None:
+        assert self._slots is not None
+
+        self.start()
+        executor = self._executor
+        loop = asyncio.get_running_loop()
+
+        try:
+            sources = await loop.run_in_executor(
+                executor, _find_sources, [p.request for p in batch]
+            )
+
+            for pending, request_sources in zip(batch, sources):
+                if not pending.future.done():
+                    pending.future.set_result(request_sources)
+        except Exception as e:
+            logger.error(f"Failed to find card sources: {e}")
+
+            # e.g. the model failed to load, the next batch starts new workers
+            if isinstance(e, BrokenProcessPool) and self._executor is executor:
+                self.close()
+
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+        finally:
+            self._no_pending -= sum(len(p.request.questions) for p in batch)
+            self._slots.release()
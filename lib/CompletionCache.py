@@ -0,0 +1,195 @@
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Literal, Optional, TypedDict
+
+from adapters.database_models.ModelConfig import Messages, ModelConfig
+from adapters.DBConnection import get_db_connection
+from adapters.repository.CompletionCacheRepository import CompletionCacheRepository
+from config import env_config
+
+logger = logging.getLogger(__name__)
+
+CacheStat = Literal["memory_hits", "persistent_hits", "misses", "bypassed"]
+
+
+class CacheStats(TypedDict):
+    memory_hits: int
+    persistent_hits: int
+    misses: int
+    bypassed: int
+
+
+class CompletionCache:
+    """
+    Caches completions by model config, parameters and prompt messages.
+
+    Lookups go to an in-process LRU first and to a Mongo collection with a TTL
+    index second. Completions sampled with a temperature above 0 are not cached
+    unless allow_nondeterministic is set, as repeating the call would give a
+    different result.
+    """
+
+    def __init__(
+        self,
+        repository: CompletionCacheRepository,
+        max_entries: int,
+        ttl_s: int,
+        allow_nondeterministic: bool = False,
+    ):
+        self._repository = repository
+        self._max_entries = max_entries
+        self._ttl_s = ttl_s
+        self._allow_nondeterministic = allow_nondeterministic
+
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._stats: dict[str, CacheStats] = {}
+
+    async def setup(self) -> None:
+        await self._repository.ensure_indexes(self._ttl_s)
+
+    def _make_key(self, model_config: ModelConfig, messages: Messages) -> str:
+        payload = json.dumps(
+            {
+                "model_config_id": str(model_config.id),
+                "parameters": model_config.parameters.dict(),
+                "messages": [m.dict() for m in messages],
+            },
+            sort_keys=True,
+        )
+
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _is_cacheable(self, model_config: ModelConfig) -> bool:
+        return model_config.parameters.temperature <= 0 or self._allow_nondeterministic
+
+    def _count(self, model_config: ModelConfig, stat: CacheStat) -> None:
+        config_id = str(model_config.id)
+
+        if config_id not in self._stats:
+            self._stats[config_id] = {
+                "memory_hits": 0,
+                "persistent_hits": 0,
+                "misses": 0,
+                "bypassed": 0,
+            }
+
+        self._stats[config_id][stat] += 1
+
+    def _remember(self, key: str, completion: str) -> None:
+        self._entries[key] = completion
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    async def _load(self, key: str) -> Optional[str]:
+        try:
+            entry = await self._repository.find_one({"key": key})
+        except Exception as e:
+            logger.error(f"Failed to read completion cache. Error: {e}")
+            return None
+
+        return entry["completion"] if entry else None
+
+    async def _store(self, key: str, model_config: ModelConfig, completion: str):
+        try:
+            await self._repository.upsert_one(
+                {"key": key},
+                {
+                    "key": key,
+                    "model_config_id": str(model_config.id),
+                    "completion": completion,
+                    "created_at": datetime.now(),
+                },
+            )
+        except Exception as e:
+            logger.error(f"Failed to write completion cache. Error: {e}")
+
+    async def _lookup(self, key: str, model_config: ModelConfig) -> Optional[str]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self._count(model_config, "memory_hits")
+            return self._entries[key]
+
+        completion = await self._load(key)
+
+        if completion is not None:
+            self._count(model_config, "persistent_hits")
+            self._remember(key, completion)
+        else:
+            self._count(model_config, "misses")
+
+        return completion
+
+    async def get_or_create(
+        self,
+        model_config: ModelConfig,
+        messages: Messages,
+        create: Callable[[], Awaitable[str]],
+    ) -> str:
+        if not self._is_cacheable(model_config):
+            self._count(model_config, "bypassed")
+            return await create()
+
+        key = self._make_key(model_config, messages)
+
+        completion = await self._lookup(key, model_config)
+
+        if completion is None:
+            completion = await create()
+            await self._store(key, model_config, completion)
+            self._remember(key, completion)
+
+        return completion
+
+    async def stream_or_create(
+        self,
+        model_config: ModelConfig,
+        messages: Messages,
+        create: Callable[[], AsyncIterator[str]],
+    ) -> AsyncIterator[str]:
+        """
+        Yields a cached completion as a single chunk. Otherwise the created
+        stream is passed through and cached once it completed.
+        """
+        if not self._is_cacheable(model_config):
+            self._count(model_config, "bypassed")
+            async for chunk in create():
+                yield chunk
+            return
+
+        key = self._make_key(model_config, messages)
+
+        completion = await self._lookup(key, model_config)
+
+        if completion is not None:
+            yield completion
+            return
+
+        chunks = []
+        async for chunk in create():
+            chunks.append(chunk)
+            yield chunk
+
+        # only reached if the stream was not interrupted
+        completion = "".join(chunks)
+        await self._store(key, model_config, completion)
+        self._remember(key, completion)
+
+    def stats(self) -> dict[str, CacheStats]:
+        return {config_id: stats.copy() for config_id, stats in self._stats.items()}
+
+
+completion_cache = CompletionCache(
+    CompletionCacheRepository(get_db_connection()),
+    max_entries=env_config.COMPLETION_CACHE_MAX_ENTRIES,
+    ttl_s=env_config.COMPLETION_CACHE_TTL_S,
+    allow_nondeterministic=env_config.COMPLETION_CACHE_ALLOW_NONDETERMINISTIC,
+)
+
+
+def get_completion_cache() -> CompletionCache:
+    return completion_cache
@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Literal, Optional, TypedDict
+
+from config import env_config
+
+Priority = Literal["interactive", "background"]
+
+# lower rank is served first
+PRIORITY_RANKS: dict[Priority, int] = {"interactive": 0, "background": 1}
+
+
+class WaitTimeStats(TypedDict):
+    count: int
+    avg_s: float
+    max_s: float
+
+
+class SchedulerStats(TypedDict):
+    queue_depth: dict[Priority, int]
+    wait_time: dict[Priority, WaitTimeStats]
+    available_requests: float
+    available_tokens: float
+
+
+class TokenBucket:
+    """
+    Budget that refills continuously up to its per minute capacity.
+    """
+
+    def __init__(self, per_minute: int):
+        self._capacity = float(per_minute)
+        self._refill_per_s = per_minute / 60
+        self._available = self._capacity
+        self._updated_at = time.monotonic()
+
+    @property
+    def capacity(self) -> float:
+        return self._capacity
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._available
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._available = min(
+            self._capacity,
+            self._available + (now - self._updated_at) * self._refill_per_s,
+        )
+        self._updated_at = now
+
+    def time_until_available(self, amount: float) -> float:
+        missing = amount - self.available
+        return max(missing, 0) / self._refill_per_s
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        # may become negative when the actual usage exceeds the estimate, a
+        # refund never exceeds the capacity
+        self._available = min(self._capacity, self._available - amount)
+
+
+@dataclass(order=True)
+class _Waiter:
+    rank: int
+    seq: int
+    tokens: int = field(compare=False)
+    priority: Priority = field(compare=False)
+
+
+class CompletionScheduler:
+    """
+    Process wide admission control for LLM requests.
+
+    Every completion has to acquire its estimated number of tokens and one request
+    from the requests- and tokens-per-minute budgets before it is sent. Waiting
+    requests are served strictly by priority and then in arrival order, so
+    interactive card generation overtakes queued background summarization.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+
+        self._queue: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._wait_count = {p: 0 for p in PRIORITY_RANKS}
+        self._wait_total_s = {p: 0.0 for p in PRIORITY_RANKS}
+        self._wait_max_s = {p: 0.0 for p in PRIORITY_RANKS}
+
+    def _get_condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+            self._queue = []
+
+        return self._condition
+
+    def _time_until_available(self, tokens: int) -> float:
+        return max(
+            self._requests.time_until_available(1),
+            self._tokens.time_until_available(tokens),
+        )
+
+    async def acquire(self, tokens: int, priority: Priority = "interactive") -> None:
+        """
+        Waits until the request is at the head of the queue and the budgets allow it.
+        """
+        # a request larger than the whole budget could never be scheduled
+        tokens = min(tokens, int(self._tokens.capacity))
+
+        waiter = _Waiter(PRIORITY_RANKS[priority], next(self._seq), tokens, priority)
+        enqueued_at = time.monotonic()
+
+        condition = self._get_condition()
+
+        async with condition:
+            heapq.heappush(self._queue, waiter)
+
+            try:
+                while True:
+                    timeout = None
+
+                    if self._queue[0] is waiter:
+                        timeout = self._time_until_available(tokens)
+
+                        if timeout <= 0:
+                            heapq.heappop(self._queue)
+                            self._requests.consume(1)
+                            self._tokens.consume(tokens)
+                            break
+
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if waiter in self._queue:
+                    self._queue.remove(waiter)
+                    heapq.heapify(self._queue)
+                raise
+            finally:
+                # let the new head of the queue re-evaluate the budgets
+                condition.notify_all()
+
+        self._record_wait(priority, time.monotonic() - enqueued_at)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        Corrects the token budget once the actual usage of a completion is known.
+        A failed completion uses no tokens and gets its estimate refunded.
+        """
+        self._tokens.consume(actual_tokens - estimated_tokens)
+
+    def _record_wait(self, priority: Priority, wait_s: float) -> None:
+        self._wait_count[priority] += 1
+        self._wait_total_s[priority] += wait_s
+        self._wait_max_s[priority] = max(self._wait_max_s[priority], wait_s)
+
+    def stats(self) -> SchedulerStats:
+        queue_depth = {p: 0 for p in PRIORITY_RANKS}
+        for waiter in self._queue:
+            queue_depth[waiter.priority] += 1
+
+        wait_time: dict[Priority, WaitTimeStats] = {
+            p: {
+                "count": count,
+                "avg_s": self._wait_total_s[p] / count if count else 0.0,
+                "max_s": self._wait_max_s[p],
+            }
+            for p, count in self._wait_count.items()
+        }
+
+        return {
+            "queue_depth": queue_depth,
+            "wait_time": wait_time,
+            "available_requests": self._requests.available,
+            "available_tokens": self._tokens.available,
+        }
+
+
+completion_scheduler = CompletionScheduler(
+    env_config.OPENAI_REQUESTS_PER_MINUTE, env_config.OPENAI_TOKENS_PER_MINUTE
+)
+
+
+def get_completion_scheduler() -> CompletionScheduler:
+    return completion_scheduler
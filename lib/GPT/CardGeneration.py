@@ -1,43 +1,179 @@
-from typing import Any, List, Optional
+import asyncio
+import re
+from abc import abstractmethod
+from typing import AsyncIterator, List, Optional
 
 from adapters.database_models.ModelConfig import Message, Messages, ModelConfig
-from adapters.database_models.Note import GPTCard
+from adapters.database_models.Note import GeneratedCard
 from config import env_config
+from lib.CompletionCache import CompletionCache, get_completion_cache
 from lib.GPT.GPTInterface import GPTInterface
+from lib.TextChunker import SentenceChunker, TextChunk
+from lib.tokenizer import get_prompt_size
 
+CARD_SEPARATOR = "\n\n"
 
-class CardGenerationMock(GPTInterface):
+
+class CardGenerationInterface(GPTInterface):
+    @abstractmethod
+    async def __call__(self, text: str, user_id: str) -> List[GeneratedCard]:
+        pass
+
+    @abstractmethod
+    def stream(self, text: str, user_id: str) -> AsyncIterator[GeneratedCard]:
+        """
+        Yields every card as soon as it has been completely generated.
+        """
+        pass
+
+
+class CardGenerationMock(CardGenerationInterface):
     def __init__(self) -> None:
         pass
 
-    def __call__(self, text: str, user_id: str) -> List[GPTCard]:
+    async def __call__(self, text: str, user_id: str) -> List[GeneratedCard]:
         return [
-            GPTCard(
+            GeneratedCard(
                 question="What is the capital of the United States?",
                 answer="Washington D.C.",
             ),
-            GPTCard(
+            GeneratedCard(
                 question="What is the capital of the United States?",
                 answer="Washington D.C.",
             ),
-            GPTCard(
+            GeneratedCard(
                 question="What is the capital of the United States?",
                 answer="Washington D.C.",
             ),
         ]
 
+    async def stream(self, text: str, user_id: str) -> AsyncIterator[GeneratedCard]:
+        for card in await self(text, user_id):
+            yield card
+
+
+class CardGeneration(CardGenerationInterface):
+    def __init__(
+        self,
+        model_config: ModelConfig,
+        openai_api_key: str,
+        completion_cache: Optional[CompletionCache] = None,
+        max_text_length: int = 1000,
+        max_concurrency: int = 4,
+    ) -> None:
+        super().__init__(model_config, openai_api_key, completion_cache)
+        self._max_text_length = max_text_length
+        self._max_concurrency = max_concurrency
+
+    async def __call__(self, text: str, user_id: str) -> List[GeneratedCard]:
+        chunks = self._plan_chunks(text)
+
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async def generate(chunk: TextChunk) -> List[GeneratedCard]:
+            async with semaphore:
+                messages = self._generate_messages(self.preprocess(chunk.text))
+                completion = await self._get_completion(messages, user_id)
 
-class CardGeneration(GPTInterface):
-    def __call__(self, text: str, user_id: str) -> List[GPTCard]:
-        preprocessed_text = self.preprocess(text)
+            return self.postprocess(completion, chunk)
 
-        messages = self._generate_messages(preprocessed_text)
-        completion = self._get_completion(messages, user_id)
+        chunk_cards = await asyncio.gather(*[generate(chunk) for chunk in chunks])
 
-        cards = self.postprocess(completion)
+        cards = self._dedupe([card for cards in chunk_cards for card in cards])
 
         return cards
 
+    async def stream(self, text: str, user_id: str) -> AsyncIterator[GeneratedCard]:
+        chunks = self._plan_chunks(text)
+
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+        queue: asyncio.Queue[Optional[GeneratedCard]] = asyncio.Queue()
+
+        async def produce(chunk: TextChunk) -> None:
+            try:
+                async with semaphore:
+                    async for card in self._stream_chunk(chunk, user_id):
+                        await queue.put(card)
+            finally:
+                # marks the chunk as done, also if it failed
+                await queue.put(None)
+
+        tasks = [asyncio.create_task(produce(chunk)) for chunk in chunks]
+
+        try:
+            seen_questions = set()
+            no_done = 0
+
+            while no_done < len(tasks):
+                card = await queue.get()
+
+                if card is None:
+                    no_done += 1
+                    continue
+
+                key = self._normalize_question(card.question)
+                if key not in seen_questions:
+                    seen_questions.add(key)
+                    yield card
+
+            for task in tasks:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _stream_chunk(
+        self, chunk: TextChunk, user_id: str
+    ) -> AsyncIterator[GeneratedCard]:
+        messages = self._generate_messages(self.preprocess(chunk.text))
+
+        buffer = ""
+
+        async for token in self._stream_completion(messages, user_id):
+            buffer += token
+
+            # everything before the last separator consists of complete cards
+            *qas, buffer = buffer.split(CARD_SEPARATOR)
+
+            for qa in qas:
+                card = self._parse_card(qa, chunk)
+                if card:
+                    yield card
+
+        card = self._parse_card(buffer, chunk)
+        if card:
+            yield card
+
+    def _get_chunk_size(self) -> int:
+        prompt_size = get_prompt_size(self._model_config)
+        completion_size = self._model_config.parameters.max_tokens
+
+        max_chunk_size = (
+            self._model_config.max_model_tokens - prompt_size - completion_size - 20
+        )  # 20 as a small buffer
+
+        assert max_chunk_size > 100, "The maximum chunk size must be greater than 100."
+
+        return max_chunk_size
+
+    def _plan_chunks(self, text: str) -> List[TextChunk]:
+        """
+        Splits the text into chunks that fit into the prompt next to the system
+        message and the completion. Short notes result in a single chunk.
+        """
+        if len(text) > self._max_text_length:
+            raise ValueError(
+                f"Text exceeds the maximum length of {self._max_text_length} characters."
+            )
+
+        chunker = SentenceChunker(self._model_config.parameters.model)
+        chunks = chunker(text, self._get_chunk_size())
+
+        if not chunks:
+            chunks = [TextChunk(text, 0, len(text), 0, 0)]
+
+        return chunks
+
     def _generate_messages(self, prompt: str) -> Messages:
         system_message = self._model_config.system_message
         messages = [
@@ -50,32 +186,75 @@ class CardGeneration(GPTInterface):
     def preprocess(self, text: str) -> str:
         return text.replace("\n\n", "\n")
 
-    def postprocess(self, completion: str) -> Any:
-        qas = completion.split("\n\n")
+    def postprocess(
+        self, completion: str, chunk: Optional[TextChunk] = None
+    ) -> List[GeneratedCard]:
+        qas = completion.split(CARD_SEPARATOR)
 
         parsed_qas = []
         for qa in qas:
-            split_qa = qa.split("\n")
-            if len(split_qa) == 2:
-                question = split_qa[0].strip().replace("Front: ", "")
-                answer = split_qa[1].strip().replace("Back: ", "")
-                card = GPTCard(question=question, answer=answer)
+            card = self._parse_card(qa, chunk)
+            if card:
                 parsed_qas.append(card)
 
         return parsed_qas
 
+    def _parse_card(
+        self, qa: str, chunk: Optional[TextChunk] = None
+    ) -> Optional[GeneratedCard]:
+        split_qa = qa.strip().split("\n")
+        if len(split_qa) != 2:
+            return None
+
+        question = split_qa[0].strip().replace("Front: ", "")
+        answer = split_qa[1].strip().replace("Back: ", "")
+
+        if not question or not answer:
+            return None
+
+        return GeneratedCard(
+            question=question,
+            answer=answer,
+            chunk_start_index=chunk.char_start if chunk else 0,
+            chunk_end_index=chunk.char_end if chunk else None,
+        )
+
+    def _normalize_question(self, question: str) -> str:
+        return re.sub(r"[\W_]+", " ", question).strip().lower()
+
+    def _dedupe(self, cards: List[GeneratedCard]) -> List[GeneratedCard]:
+        """
+        Removes cards asking the same question, e.g. from overlapping chunks.
+        """
+        seen_questions = set()
+        unique_cards = []
+
+        for card in cards:
+            key = self._normalize_question(card.question)
+            if key not in seen_questions:
+                seen_questions.add(key)
+                unique_cards.append(card)
+
+        return unique_cards
+
 
-card_generation: GPTInterface
+card_generation: CardGenerationInterface
 
 
 def init(model_config: Optional[ModelConfig] = None) -> None:
     global card_generation
 
     if env_config.is_prod() and model_config:
-        card_generation = CardGeneration(model_config, env_config.OPENAI_API_KEY)
+        card_generation = CardGeneration(
+            model_config,
+            env_config.OPENAI_API_KEY,
+            get_completion_cache(),
+            max_text_length=env_config.MAX_TEXT_LENGTH,
+            max_concurrency=env_config.CARD_GENERATION_MAX_CONCURRENCY,
+        )
     else:
         card_generation = CardGenerationMock()
 
 
-def get_card_generation() -> GPTInterface:
+def get_card_generation() -> CardGenerationInterface:
     return card_generation
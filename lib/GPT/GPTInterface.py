@@ -1,32 +1,81 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, AsyncIterator, Optional
 
 import openai
 
 from adapters.database_models.ModelConfig import Messages, ModelConfig
-from lib.gpt import get_chatgpt_completion
+from config import env_config
+from lib.CompletionCache import CompletionCache
+from lib.CompletionScheduler import Priority
+from lib.gpt import get_chatgpt_completion, stream_chatgpt_completion
 from lib.util.error import retry_on_exception
 
 
 class GPTInterface(ABC):
     _model_config: ModelConfig
+    _priority: Priority = "interactive"
 
-    def __init__(self, model_config: ModelConfig, openai_api_key: str) -> None:
+    def __init__(
+        self,
+        model_config: ModelConfig,
+        openai_api_key: str,
+        completion_cache: Optional[CompletionCache] = None,
+    ) -> None:
         self._model_config = model_config
+        self._completion_cache = completion_cache
         openai.api_key = openai_api_key
 
     @abstractmethod
-    def __call__(self, *args: Any, **kwds: Any) -> Any:
+    async def __call__(self, *args: Any, **kwds: Any) -> Any:
         pass
 
-    @retry_on_exception(Exception, max_retries=3, sleep_time=5)
-    def _get_completion(
+    async def _get_completion(
+        self,
+        messages: Messages,
+        user_id: str,
+    ) -> str:
+        if not self._completion_cache:
+            return await self._request_completion(messages, user_id)
+
+        return await self._completion_cache.get_or_create(
+            self._model_config,
+            messages,
+            lambda: self._request_completion(messages, user_id),
+        )
+
+    @retry_on_exception(
+        Exception,
+        max_retries=3,
+        sleep_time=2,
+        deadline_s=env_config.OPENAI_RETRY_DEADLINE_S,
+    )
+    async def _request_completion(
         self,
         messages: Messages,
         user_id: str,
     ) -> str:
-        completion = get_chatgpt_completion(
-            self._model_config.parameters, messages, user_id
+        completion = await get_chatgpt_completion(
+            self._model_config.parameters, messages, user_id, priority=self._priority
         )
 
         return completion
+
+    def _stream_completion(
+        self,
+        messages: Messages,
+        user_id: str,
+    ) -> AsyncIterator[str]:
+        def create() -> AsyncIterator[str]:
+            return stream_chatgpt_completion(
+                self._model_config.parameters,
+                messages,
+                user_id,
+                priority=self._priority,
+            )
+
+        if not self._completion_cache:
+            return create()
+
+        return self._completion_cache.stream_or_create(
+            self._model_config, messages, create
+        )
@@ -5,7 +5,7 @@ from lib.GPT.GPTInterface import GPTInterface
 
 
 class QuestionAnswerGPT(GPTInterface):
-    def __call__(self, documents: list[str], question: str, user_id: str) -> str:
+    async def __call__(self, documents: list[str], question: str, user_id: str) -> str:
         text = "\n\n".join(documents)
 
         system_prompt = self._model_config.system_message.format(question=question)
@@ -15,8 +15,8 @@ class QuestionAnswerGPT(GPTInterface):
             Message(role="user", content=text),
         ]
 
-        completion = get_chatgpt_completion(
-            self._model_config.parameters, messages, user_id
+        completion = await get_chatgpt_completion(
+            self._model_config.parameters, messages, user_id, priority=self._priority
         )
 
         return completion
@@ -14,7 +14,7 @@ class SingleFlashcardGeneratorMock(GPTInterface):
     def __init__(self) -> None:
         pass
 
-    def __call__(self, text: str, user_id: str) -> GPTCard:
+    async def __call__(self, text: str, user_id: str) -> GPTCard:
         return GPTCard(
             question="What is the capital of the United States?",
             answer="Washington D.C.",
@@ -26,9 +26,9 @@ class SingleFlashcardGeneratorMock(GPTInterface):
 
 class SingleFlashcardGenerator(GPTInterface):
 
-    def __call__(self, text: str, user_id: str) -> GPTCard:
+    async def __call__(self, text: str, user_id: str) -> GPTCard:
         messages = self._generate_messages(text)
-        completion = self._get_completion(messages, user_id)
+        completion = await self._get_completion(messages, user_id)
         card = self._postprocess(completion)
 
         return card
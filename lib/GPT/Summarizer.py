@@ -1,44 +1,98 @@
+import asyncio
 import re
 from abc import ABC, abstractmethod
 from typing import List, Optional
 
-from nltk.tokenize import sent_tokenize  # type: ignore
-
 from adapters.database_models.ModelConfig import Message, Messages, ModelConfig
 from config import env_config
-from lib.gpt import (
-    calculate_chat_gpt_token_size,
-    get_no_tokens,
-)
+from lib.CompletionCache import CompletionCache, get_completion_cache
 from lib.GPT.GPTInterface import GPTInterface
+from lib.TextChunker import SentenceChunker, TextChunk
+from lib.tokenizer import get_no_tokens, get_prompt_size
 
 
 class SummarizerInterface(ABC):
     @abstractmethod
-    def __call__(self, text: str, user_id: str) -> str:
+    async def __call__(self, text: str, user_id: str) -> str:
         pass
 
 
 class SummarizerMock(SummarizerInterface):
-    def __call__(self, text: str, user_id: str) -> str:
+    async def __call__(self, text: str, user_id: str) -> str:
         return "Mock Summary"
 
 
 class Summarizer(SummarizerInterface, GPTInterface):
-    def __call__(self, text: str, user_id: str) -> str:
+    # summaries are created in the background and must not delay user requests
+    _priority = "background"
+
+    # upper bound for reduce rounds, each round shrinks the text by a large factor
+    _max_reduce_rounds = 5
+
+    def __init__(
+        self,
+        model_config: ModelConfig,
+        openai_api_key: str,
+        completion_cache: Optional[CompletionCache] = None,
+        max_concurrency: int = 4,
+        hierarchical_reduce: bool = False,
+    ) -> None:
+        super().__init__(model_config, openai_api_key, completion_cache)
+        self._max_concurrency = max_concurrency
+        self._hierarchical_reduce = hierarchical_reduce
+
+    async def __call__(self, text: str, user_id: str) -> str:
         target_size = self._get_target_size()
 
         chunks = self._chunk_text(text, target_size)
 
-        summaries = []
+        summaries = await self._summarize_chunks(chunks, user_id)
 
-        for chunk in chunks:
-            messages = self._generate_messages(chunk)
+        summary = self._postprocess(summaries)
 
-            chunk_summary = self._get_completion(messages, user_id)
-            summaries.append(chunk_summary)
+        if self._hierarchical_reduce:
+            summary = await self._reduce(summary, target_size, user_id)
 
-        summary = self._postprocess(summaries)
+        return summary
+
+    async def _summarize_chunks(
+        self, chunks: List[TextChunk], user_id: str
+    ) -> List[str]:
+        """
+        Summarizes all chunks concurrently with at most max_concurrency requests
+        in flight. The summaries keep the order of the chunks.
+        """
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async def summarize(chunk: TextChunk) -> str:
+            async with semaphore:
+                messages = self._generate_messages(chunk.text)
+                return await self._get_completion(messages, user_id)
+
+        return await asyncio.gather(*[summarize(chunk) for chunk in chunks])
+
+    async def _reduce(self, summary: str, target_size: int, user_id: str) -> str:
+        """
+        Summarizes the combined chunk summaries again until they fit into a
+        single prompt, so the number of sequential rounds grows with the
+        logarithm of the document size.
+        """
+        model = self._model_config.parameters.model
+
+        for _ in range(self._max_reduce_rounds):
+            chunks = self._chunk_text(summary, target_size)
+            if len(chunks) <= 1:
+                break
+
+            summary_size = sum(chunk.no_tokens for chunk in chunks)
+            summaries = await self._summarize_chunks(chunks, user_id)
+            reduced_summary = self._postprocess(summaries)
+
+            # stop if the model does not condense the summaries any further
+            if get_no_tokens(reduced_summary, model) >= summary_size:
+                break
+
+            summary = reduced_summary
 
         return summary
 
@@ -52,10 +106,7 @@ class Summarizer(SummarizerInterface, GPTInterface):
         return "\n".join(summaries)
 
     def _get_target_size(self) -> int:
-        messages = self._generate_messages("")
-        prompt_size = calculate_chat_gpt_token_size(
-            messages, self._model_config.parameters.model
-        )
+        prompt_size = get_prompt_size(self._model_config)
         completion_size = self._model_config.parameters.max_tokens
 
         max_model_tokens = self._model_config.max_model_tokens
@@ -78,7 +129,7 @@ class Summarizer(SummarizerInterface, GPTInterface):
 
         return messages
 
-    def _chunk_text(self, text: str, target_size: int) -> List[str]:
+    def _chunk_text(self, text: str, target_size: int) -> List[TextChunk]:
         """
         Splits the given text into chunks of sentences based on the target size.
 
@@ -87,49 +138,12 @@ class Summarizer(SummarizerInterface, GPTInterface):
             target_size (int): The maximum token size for each chunk.
 
         Returns:
-            List[str]: A list of chunks where each chunk is a string containing sentences.
+            List[TextChunk]: The chunks with their character and token offsets.
 
         """
+        chunker = SentenceChunker(self._model_config.parameters.model)
 
-        text_size = get_no_tokens(text, self._model_config.parameters.model)
-        if text_size < target_size:
-            return [text]
-
-        # Split the text into sentences
-        sentences = sent_tokenize(text)
-
-        chunks = []
-        chunk = ""
-        for sentence in sentences:
-            # Calculate sentence token size to ensure it's less than the target size
-            # and avoid an infinite loop
-            sentence_token_size = get_no_tokens(
-                sentence, self._model_config.parameters.model
-            )
-
-            assert sentence_token_size < target_size, (
-                "The sentence token size is greater than the target size. "
-                "Please increase the target size."
-            )
-
-            # Calculate the token size of the current chunk with the next sentence added
-            new_chunk_size = get_no_tokens(
-                chunk + " " + sentence, self._model_config.parameters.model
-            )
-
-            # If the new chunk size is larger than the target size, then start a new chunk
-            if new_chunk_size > target_size:
-                chunks.append(chunk)
-                chunk = sentence
-            else:
-                # Add the sentence to the current chunk
-                chunk += " " + sentence
-
-        # Add the last chunk if it's not empty
-        if chunk:
-            chunks.append(chunk)
-
-        return chunks
+        return chunker(text, target_size)
 
 
 summarizer: SummarizerInterface
@@ -139,7 +153,13 @@ def init(model_config: Optional[ModelConfig] = None) -> None:
     global summarizer
 
     if env_config.is_prod() and model_config:
-        summarizer = Summarizer(model_config, env_config.OPENAI_API_KEY)
+        summarizer = Summarizer(
+            model_config,
+            env_config.OPENAI_API_KEY,
+            get_completion_cache(),
+            max_concurrency=env_config.SUMMARIZER_MAX_CONCURRENCY,
+            hierarchical_reduce=env_config.SUMMARIZER_HIERARCHICAL_REDUCE,
+        )
     else:
         summarizer = SummarizerMock()
 
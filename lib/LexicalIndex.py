@@ -0,0 +1,180 @@
+import heapq
+import math
+import re
+from collections import Counter, OrderedDict
+from typing import Any, Iterable
+
+from adapters.repository.LexicalIndexRepository import LexicalIndexRepository
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class _UserIndex:
+    """
+    Inverted index over the chunks of one user.
+    """
+
+    def __init__(self, documents: list[dict]):
+        self.chunk_ids: list[str] = []
+        self.metadatas: list[dict] = []
+        self.lengths: list[int] = []
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+
+        for i, document in enumerate(documents):
+            self.chunk_ids.append(document["chunk_id"])
+            self.metadatas.append(document["metadata"])
+            self.lengths.append(document["length"])
+
+            for term, count in document["terms"].items():
+                self.postings.setdefault(term, []).append((i, count))
+
+        self.average_length = sum(self.lengths) / len(self.lengths) if documents else 0
+
+
+class LexicalIndex:
+    """
+    BM25 keyword search over the chunks of the vector store.
+
+    The term counts of every chunk are persisted in Mongo, so the index does not
+    have to be rebuilt from Chroma. The inverted index of a user is loaded on
+    their first search and kept for the most recent max_users users. Adding or
+    deleting chunks drops the loaded index of the affected users.
+    """
+
+    def __init__(
+        self,
+        repository: LexicalIndexRepository,
+        max_users: int = 100,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self._repository = repository
+        self._max_users = max_users
+        self._k1 = k1
+        self._b = b
+
+        self._indices: OrderedDict[str, _UserIndex] = OrderedDict()
+        self._versions: dict[str, int] = {}
+
+    async def setup(self) -> None:
+        await self._repository.ensure_indexes()
+
+    async def add(
+        self, chunk_ids: list[str], documents: list[str], metadatas: list[Any]
+    ) -> None:
+        entries = []
+
+        for chunk_id, document, metadata in zip(chunk_ids, documents, metadatas):
+            terms = Counter(tokenize(document))
+            entries.append(
+                {
+                    "chunk_id": chunk_id,
+                    "user_id": metadata["user_id"],
+                    "source_id": metadata["source_id"],
+                    "metadata": dict(metadata),
+                    "terms": dict(terms),
+                    "length": sum(terms.values()),
+                }
+            )
+
+        await self._repository.upsert_many(entries)
+
+        self._invalidate(metadata["user_id"] for metadata in metadatas)
+
+    async def delete(self, sources: dict[str, str]) -> None:
+        """
+        Deletes the chunks of all sources, given as source id to user id.
+        """
+        await self._repository.delete_by_sources(list(sources))
+
+        self._invalidate(sources.values())
+
+    async def delete_chunks(self, chunks: dict[str, str]) -> None:
+        """
+        Deletes single chunks, given as chunk id to user id.
+        """
+        if not chunks:
+            return
+
+        await self._repository.delete_by_chunk_ids(list(chunks))
+
+        self._invalidate(chunks.values())
+
+    def _invalidate(self, user_ids: Iterable[str]) -> None:
+        for user_id in set(user_ids):
+            self._indices.pop(user_id, None)
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    async def _get_index(self, user_id: str) -> _UserIndex:
+        if user_id in self._indices:
+            self._indices.move_to_end(user_id)
+            return self._indices[user_id]
+
+        version = self._versions.get(user_id, 0)
+        index = _UserIndex(await self._repository.find_by_user(user_id))
+
+        # chunks changed while loading, the next search loads the index again
+        if self._versions.get(user_id, 0) != version:
+            return index
+
+        self._indices[user_id] = index
+        while len(self._indices) > self._max_users:
+            self._indices.popitem(last=False)
+
+        return index
+
+    def _matches(self, metadata: dict, filters: dict) -> bool:
+        for key, value in filters.items():
+            if isinstance(value, list):
+                if metadata.get(key) not in value:
+                    return False
+            elif value and metadata.get(key) != value:
+                return False
+
+        return True
+
+    async def search(
+        self, query: str, filters: dict, n_results: int
+    ) -> list[tuple[str, float]]:
+        """
+        Returns the ids and BM25 scores of the best matching chunks of the
+        user in filters["user_id"] that match all other filters.
+        """
+        index = await self._get_index(filters["user_id"])
+        no_chunks = len(index.chunk_ids)
+
+        scores: dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            postings = index.postings.get(term)
+            if not postings:
+                continue
+
+            idf = math.log(
+                1 + (no_chunks - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+
+            for i, count in postings:
+                length_norm = (
+                    1
+                    - self._b
+                    + self._b * (index.lengths[i] / (index.average_length or 1))
+                )
+                scores[i] = scores.get(i, 0.0) + idf * count * (self._k1 + 1) / (
+                    count + self._k1 * length_norm
+                )
+
+        best = heapq.nlargest(
+            n_results,
+            (
+                (score, i)
+                for i, score in scores.items()
+                if self._matches(index.metadatas[i], filters)
+            ),
+        )
+
+        return [(index.chunk_ids[i], score) for score, i in best]
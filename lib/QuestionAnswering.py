@@ -0,0 +1,389 @@
+import fcntl
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Literal, NamedTuple, Tuple, TypedDict
+
+import numpy as np
+from transformers import AutoTokenizer, PreTrainedTokenizerBase, pipeline  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+QuestionAnsweringBackendName = Literal["pipeline", "onnx"]
+
+
+class Answer(TypedDict):
+    start: int
+    end: int
+    score: float
+
+
+class QuestionAnsweringBackend(ABC):
+    """
+    Extractive question answering. Answers the i-th question from the i-th context.
+
+    Question and context have to fit into max_seq_len tokens together. Longer
+    contexts are split into windows overlapping by doc_stride tokens, so callers
+    should pass contexts of at most max_context_tokens.
+    """
+
+    _tokenizer: PreTrainedTokenizerBase
+
+    def __init__(
+        self,
+        max_seq_len: int = 384,
+        doc_stride: int = 128,
+        max_question_len: int = 64,
+        max_answer_len: int = 15,
+    ):
+        self._max_seq_len = max_seq_len
+        self._doc_stride = doc_stride
+        self._max_question_len = max_question_len
+        self._max_answer_len = max_answer_len
+
+    @property
+    def max_context_tokens(self) -> int:
+        return (
+            self._max_seq_len
+            - self._max_question_len
+            - self._tokenizer.num_special_tokens_to_add(pair=True)
+        )
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+
+        encodings = self._tokenizer(texts, add_special_tokens=False)
+        return [len(ids) for ids in encodings["input_ids"]]
+
+    @abstractmethod
+    def __call__(
+        self, questions: List[str], contexts: List[str], batch_size: int
+    ) -> List[Answer]:
+        pass
+
+
+class PipelineBackend(QuestionAnsweringBackend):
+    def __init__(self, model_path: str, **kwargs):
+        super().__init__(**kwargs)
+        self._qa_model = pipeline(
+            "question-answering",
+            model=model_path,
+            tokenizer=model_path,
+        )
+        self._tokenizer = self._qa_model.tokenizer
+
+    def __call__(
+        self, questions: List[str], contexts: List[str], batch_size: int
+    ) -> List[Answer]:
+        answers = self._qa_model(  # type: ignore
+            question=questions,
+            context=contexts,
+            batch_size=batch_size,
+            max_seq_len=self._max_seq_len,
+            doc_stride=self._doc_stride,
+            max_question_len=self._max_question_len,
+            max_answer_len=self._max_answer_len,
+        )
+
+        # the pipeline unwraps the result of a single question
+        if isinstance(answers, dict):
+            answers = [answers]
+
+        return [
+            Answer(start=a["start"], end=a["end"], score=a["score"]) for a in answers
+        ]
+
+
+def export_onnx_model(model_path: str, model_file: str) -> None:
+    import torch
+    from transformers import AutoModelForQuestionAnswering  # type: ignore
+
+    model = AutoModelForQuestionAnswering.from_pretrained(model_path)
+    model.eval()
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    inputs = tokenizer("Question?", "Context.", return_tensors="pt")
+
+    # distilbert does not use token_type_ids
+    input_names = [
+        name
+        for name in ("input_ids", "attention_mask", "token_type_ids")
+        if name in inputs
+    ]
+    output_names = ["start_logits", "end_logits"]
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(inputs[name] for name in input_names),
+            model_file,
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes={
+                name: {0: "batch", 1: "sequence"} for name in input_names + output_names
+            },
+            opset_version=14,
+        )
+
+
+def quantize_onnx_model(model_file: str, quantized_model_file: str) -> None:
+    from onnxruntime.quantization import QuantType, quantize_dynamic  # type: ignore
+
+    quantize_dynamic(model_file, quantized_model_file, weight_type=QuantType.QInt8)
+
+
+def prepare_onnx_model(model_path: str, onnx_dir: str, quantize: bool) -> str:
+    """
+    Returns the onnx model file in onnx_dir and exports, and if quantize is set
+    quantizes, the model on first use. Workers starting at the same time wait
+    for the one that holds the lock, and files are only moved into place once
+    they are complete, so no worker loads a half written model.
+    """
+    model_file = os.path.join(onnx_dir, "model.onnx")
+    quantized_model_file = os.path.join(onnx_dir, "model.int8.onnx")
+
+    os.makedirs(onnx_dir, exist_ok=True)
+
+    with open(os.path.join(onnx_dir, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        if not os.path.exists(model_file):
+            logger.info(f"Exporting {model_path} to {model_file}")
+            export_onnx_model(model_path, f"{model_file}.tmp")
+            os.replace(f"{model_file}.tmp", model_file)
+
+        if not quantize:
+            return model_file
+
+        if not os.path.exists(quantized_model_file):
+            logger.info(f"Quantizing {model_file} to {quantized_model_file}")
+            quantize_onnx_model(model_file, f"{quantized_model_file}.tmp")
+            os.replace(f"{quantized_model_file}.tmp", quantized_model_file)
+
+    return quantized_model_file
+
+
+class _Feature(NamedTuple):
+    question: int
+    input_ids: List[int]
+    token_type_ids: List[int]
+    context_start: int
+    offsets: List[Tuple[int, int]]
+
+
+class ONNXBackend(QuestionAnsweringBackend):
+    """
+    Runs the question answering model with onnxruntime on the CPU.
+
+    The model is exported from model_path to onnx_dir on first use and, if
+    quantize is set, its weights are dynamically quantized to int8. Every
+    distinct context is tokenized once per call and combined with the token ids
+    of each question, instead of tokenizing every question and context pair.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        onnx_dir: str,
+        quantize: bool = False,
+        intra_op_threads: int = 0,
+        **kwargs,
+    ):
+        import onnxruntime as ort  # type: ignore
+
+        super().__init__(**kwargs)
+        self._tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+        # position of the context within the special tokens, e.g. [CLS] q [SEP] c [SEP]
+        layout = self._tokenizer.build_inputs_with_special_tokens([-1], [-2])
+        self._context_offset = layout.index(-2) - 1
+
+        options = ort.SessionOptions()
+        # 0 lets onnxruntime use all cores
+        options.intra_op_num_threads = intra_op_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self._session = ort.InferenceSession(
+            prepare_onnx_model(model_path, onnx_dir, quantize),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = [i.name for i in self._session.get_inputs()]
+
+    def _get_spans(
+        self, no_context_tokens: int, no_question_tokens: int
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        Yields the token spans of the context windows that fit next to the question.
+        """
+        max_len = (
+            self._max_seq_len
+            - no_question_tokens
+            - self._tokenizer.num_special_tokens_to_add(pair=True)
+        )
+
+        start = 0
+        while True:
+            end = min(start + max_len, no_context_tokens)
+            yield start, end
+
+            if end >= no_context_tokens:
+                break
+
+            start = max(end - self._doc_stride, start + 1)
+
+    def _get_features(
+        self, questions: List[str], contexts: List[str]
+    ) -> List[_Feature]:
+        unique_contexts = list(dict.fromkeys(contexts))
+        context_encodings = self._tokenizer(
+            unique_contexts, add_special_tokens=False, return_offsets_mapping=True
+        )
+        context_ids = dict(zip(unique_contexts, context_encodings["input_ids"]))
+        context_offsets = dict(
+            zip(unique_contexts, context_encodings["offset_mapping"])
+        )
+
+        question_ids = self._tokenizer(
+            questions,
+            add_special_tokens=False,
+            truncation=True,
+            max_length=self._max_question_len,
+        )["input_ids"]
+
+        features = []
+
+        for question, (q_ids, context) in enumerate(zip(question_ids, contexts)):
+            c_ids = context_ids[context]
+
+            for start, end in self._get_spans(len(c_ids), len(q_ids)):
+                features.append(
+                    _Feature(
+                        question=question,
+                        input_ids=self._tokenizer.build_inputs_with_special_tokens(
+                            q_ids, c_ids[start:end]
+                        ),
+                        token_type_ids=self._tokenizer.create_token_type_ids_from_sequences(
+                            q_ids, c_ids[start:end]
+                        ),
+                        context_start=len(q_ids) + self._context_offset,
+                        offsets=context_offsets[context][start:end],
+                    )
+                )
+
+        return features
+
+    def _run(self, features: List[_Feature]) -> Tuple[np.ndarray, np.ndarray]:
+        max_len = max(len(f.input_ids) for f in features)
+        pad_id = self._tokenizer.pad_token_id or 0
+
+        inputs = {
+            "input_ids": np.array(
+                [
+                    f.input_ids + [pad_id] * (max_len - len(f.input_ids))
+                    for f in features
+                ]
+            ),
+            "attention_mask": np.array(
+                [
+                    [1] * len(f.input_ids) + [0] * (max_len - len(f.input_ids))
+                    for f in features
+                ]
+            ),
+            "token_type_ids": np.array(
+                [
+                    f.token_type_ids + [0] * (max_len - len(f.token_type_ids))
+                    for f in features
+                ]
+            ),
+        }
+
+        start_logits, end_logits = self._session.run(
+            ["start_logits", "end_logits"],
+            {name: inputs[name].astype(np.int64) for name in self._input_names},
+        )
+
+        return start_logits, end_logits
+
+    def __call__(
+        self, questions: List[str], contexts: List[str], batch_size: int
+    ) -> List[Answer]:
+        if not questions:
+            return []
+
+        features = self._get_features(questions, contexts)
+        answers: List[Answer] = [Answer(start=0, end=0, score=-1.0) for _ in questions]
+
+        for i in range(0, len(features), batch_size):
+            batch = features[i : i + batch_size]
+            start_logits, end_logits = self._run(batch)
+
+            for feature, start, end in zip(batch, start_logits, end_logits):
+                if not feature.offsets:
+                    continue
+
+                is_context = np.zeros(len(start), dtype=bool)
+                is_context[
+                    feature.context_start : feature.context_start + len(feature.offsets)
+                ] = True
+
+                start_token, end_token, score = self._find_best_span(
+                    start, end, is_context
+                )
+
+                if score > answers[feature.question]["score"]:
+                    offsets = feature.offsets
+                    answers[feature.question] = Answer(
+                        start=int(offsets[start_token - feature.context_start][0]),
+                        end=int(offsets[end_token - feature.context_start][1]),
+                        score=score,
+                    )
+
+        return answers
+
+    def _find_best_span(
+        self, start_logits: np.ndarray, end_logits: np.ndarray, is_context: np.ndarray
+    ) -> tuple[int, int, float]:
+        """
+        Returns the context span with the highest start times end probability
+        that does not exceed max_answer_len tokens.
+        """
+        start_logits = np.where(is_context, start_logits, -np.inf)
+        end_logits = np.where(is_context, end_logits, -np.inf)
+
+        start_probs = np.exp(start_logits - start_logits.max())
+        start_probs /= start_probs.sum()
+        end_probs = np.exp(end_logits - end_logits.max())
+        end_probs /= end_probs.sum()
+
+        scores = np.outer(start_probs, end_probs)
+        scores = np.tril(np.triu(scores), self._max_answer_len - 1)
+
+        start_token, end_token = np.unravel_index(np.argmax(scores), scores.shape)
+
+        return int(start_token), int(end_token), float(scores[start_token, end_token])
+
+
+def get_question_answering_backend(
+    name: QuestionAnsweringBackendName,
+    model_path: str,
+    onnx_dir: str,
+    quantize: bool = False,
+    intra_op_threads: int = 0,
+    max_seq_len: int = 384,
+    doc_stride: int = 128,
+    max_question_len: int = 64,
+    max_answer_len: int = 15,
+) -> QuestionAnsweringBackend:
+    window = dict(
+        max_seq_len=max_seq_len,
+        doc_stride=doc_stride,
+        max_question_len=max_question_len,
+        max_answer_len=max_answer_len,
+    )
+
+    if name == "onnx":
+        return ONNXBackend(model_path, onnx_dir, quantize, intra_op_threads, **window)
+
+    return PipelineBackend(model_path, **window)
@@ -0,0 +1,71 @@
+import re
+from bisect import bisect_left, bisect_right
+from typing import List, Sequence, Tuple
+
+SENTENCE_SEPARATOR = re.compile(r"\n|(?<=[.!?])\s+")
+
+
+class SentenceIndex:
+    """
+    Sorted start and end offsets of the sentences of a text.
+
+    The index is built in a single pass over the text. Looking up the sentence
+    that encloses a span is a binary search, so it is cheap to do for every card
+    of a note and repeated sentences resolve to their own position.
+    """
+
+    def __init__(self, boundaries: Sequence[Tuple[int, int]]):
+        self._starts = [start for start, _ in boundaries]
+        self._ends = [end for _, end in boundaries]
+
+    @classmethod
+    def from_text(cls, text: str) -> "SentenceIndex":
+        boundaries = []
+        start = 0
+
+        for separator in SENTENCE_SEPARATOR.finditer(text):
+            if separator.start() > start:
+                boundaries.append((start, separator.start()))
+            start = separator.end()
+
+        if start < len(text):
+            boundaries.append((start, len(text)))
+
+        return cls(boundaries)
+
+    @property
+    def boundaries(self) -> List[Tuple[int, int]]:
+        return list(zip(self._starts, self._ends))
+
+    def window(self, window_start: int, window_end: int) -> "SentenceIndex":
+        """
+        Returns the index of text[window_start:window_end] with offsets relative
+        to the window. Sentences crossing the window are cut at its borders.
+        """
+        first = bisect_right(self._ends, window_start)
+        last = bisect_left(self._starts, window_end)
+
+        return SentenceIndex(
+            [
+                (
+                    max(start, window_start) - window_start,
+                    min(end, window_end) - window_start,
+                )
+                for start, end in zip(self._starts[first:last], self._ends[first:last])
+            ]
+        )
+
+    def find_enclosing(self, start: int, end: int) -> Tuple[int, int]:
+        """
+        Returns the start of the sentence containing start and the end of the
+        sentence containing end. Spans between sentences are returned as is.
+        """
+        # first sentence ending after start
+        first = bisect_right(self._ends, start)
+        # last sentence starting before end
+        last = bisect_left(self._starts, max(end, start + 1)) - 1
+
+        if first >= len(self._starts) or last < first:
+            return start, end
+
+        return self._starts[first], self._ends[last]
@@ -0,0 +1,168 @@
+from typing import NamedTuple
+
+from nltk.tokenize import sent_tokenize  # type: ignore
+
+from lib.tokenizer import encode_batch, get_encoder
+
+
+class TextChunk(NamedTuple):
+    text: str
+    char_start: int
+    char_end: int
+    token_start: int
+    token_end: int
+
+    @property
+    def no_tokens(self) -> int:
+        return self.token_end - self.token_start
+
+
+class _Span(NamedTuple):
+    char_start: int
+    char_end: int
+    no_tokens: int
+
+
+class SentenceChunker:
+    """
+    Packs whole sentences into chunks of at most target_size tokens.
+
+    Every sentence is tokenized exactly once and packed by a running sum of its
+    token count, so chunking is linear in the length of the text. Sentences
+    longer than target_size are split at token boundaries.
+    """
+
+    # reserved for the whitespace joining two sentences
+    _separator_tokens = 1
+
+    def __init__(self, model: str):
+        self._model = model
+
+    def __call__(self, text: str, target_size: int) -> list[TextChunk]:
+        spans = self._split_spans(text, target_size)
+
+        chunks: list[TextChunk] = []
+        chunk_spans: list[_Span] = []
+        chunk_size = 0
+        token_offset = 0
+
+        def close_chunk():
+            nonlocal token_offset
+
+            no_tokens = sum(span.no_tokens for span in chunk_spans)
+            char_start = chunk_spans[0].char_start
+            char_end = chunk_spans[-1].char_end
+
+            chunks.append(
+                TextChunk(
+                    text=text[char_start:char_end],
+                    char_start=char_start,
+                    char_end=char_end,
+                    token_start=token_offset,
+                    token_end=token_offset + no_tokens,
+                )
+            )
+            token_offset += no_tokens
+
+        for span in spans:
+            span_size = span.no_tokens + (self._separator_tokens if chunk_spans else 0)
+
+            if chunk_spans and chunk_size + span_size > target_size:
+                close_chunk()
+                chunk_spans = []
+                chunk_size = 0
+                span_size = span.no_tokens
+
+            chunk_spans.append(span)
+            chunk_size += span_size
+
+        if chunk_spans:
+            close_chunk()
+
+        return chunks
+
+    def _split_spans(self, text: str, target_size: int) -> list[_Span]:
+        offsets = self._locate_sentences(text)
+        sentences = [text[char_start:char_end] for char_start, char_end in offsets]
+
+        spans = []
+
+        for (char_start, char_end), sentence, tokens in zip(
+            offsets, sentences, encode_batch(sentences, self._model)
+        ):
+            if len(tokens) <= target_size:
+                spans.append(_Span(char_start, char_end, len(tokens)))
+            else:
+                spans += self._split_sentence(sentence, char_start, tokens, target_size)
+
+        return spans
+
+    def _locate_sentences(self, text: str) -> list[tuple[int, int]]:
+        """
+        Returns the character offsets of the sentences in the text. Sentences
+        the sentence tokenizer altered, e.g. by normalizing quotes, are not
+        found in the text. The text up to the next sentence that is found takes
+        their place, so no text is lost.
+        """
+        offsets: list[tuple[int, int]] = []
+        cursor = 0
+        skipped = False
+
+        def add_gap(gap_end: int):
+            gap = text[cursor:gap_end]
+            char_start = cursor + len(gap) - len(gap.lstrip())
+            char_end = cursor + len(gap.rstrip())
+
+            if char_end > char_start:
+                offsets.append((char_start, char_end))
+
+        for sentence in sent_tokenize(text):
+            # sentences are slices of the text, so searching from the end of the
+            # previous one recovers their offsets in a single pass
+            char_start = text.find(sentence, cursor)
+
+            if char_start == -1:
+                skipped = True
+                continue
+
+            if skipped:
+                add_gap(char_start)
+                skipped = False
+
+            offsets.append((char_start, char_start + len(sentence)))
+            cursor = char_start + len(sentence)
+
+        if skipped:
+            add_gap(len(text))
+
+        return offsets
+
+    def _split_sentence(
+        self, sentence: str, char_start: int, tokens: list[int], target_size: int
+    ) -> list[_Span]:
+        """
+        Splits an oversized sentence into pieces of target_size tokens.
+        """
+        encoder = get_encoder(self._model)
+        sentence_bytes = sentence.encode("utf-8")
+
+        spans = []
+        byte_offset = 0
+        char_offset = 0
+
+        for start in range(0, len(tokens), target_size):
+            window = tokens[start : start + target_size]
+            byte_offset += len(encoder.decode_bytes(window))
+
+            # a token boundary may fall inside a multi-byte character
+            window_end = len(sentence_bytes[:byte_offset].decode("utf-8", "ignore"))
+
+            if window_end > char_offset:
+                spans.append(
+                    _Span(
+                        char_start + char_offset, char_start + window_end, len(window)
+                    )
+                )
+                char_offset = window_end
+
+        return spans
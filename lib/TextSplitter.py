@@ -1,41 +1,201 @@
 from abc import ABC, abstractmethod
+from typing import Literal, NamedTuple, Optional
+
+from config import env_config
+from lib.TextChunker import SentenceChunker, TextChunk
+from lib.tokenizer import get_no_tokens_batch
+
+# markers opening and closing code and LaTeX blocks
+FENCES = ("```", "~~~", "$$")
+
+BlockType = Literal["paragraph", "heading", "fenced"]
+
+
+class _Block(NamedTuple):
+    char_start: int
+    char_end: int
+    type: BlockType
+
+
+class _Segment(NamedTuple):
+    char_start: int
+    char_end: int
+    no_tokens: int
+    type: BlockType
 
 
 class TextSplitterInterface(ABC):
     @abstractmethod
-    def __call__(self, text: str) -> list[str]:
+    def __call__(self, text: str) -> list[TextChunk]:
         pass
 
 
 class TextSplitter(TextSplitterInterface):
-    def __init__(self, chunk_char_size: int, overlap: int):
-        self._chunk_char_size = chunk_char_size
-        self._overlap = overlap
+    """
+    Packs whole markdown blocks into chunks of at most max_tokens tokens.
 
-    def __call__(
-        self,
-        text: str,
-    ) -> list[str]:
-        chunks = self._split(text)
+    Paragraphs, headings and fenced code or LaTeX blocks are never cut, unless
+    a single block exceeds max_tokens on its own, in which case it is split at
+    sentence boundaries. A heading is moved to the next chunk instead of
+    ending one. Every chunk keeps its character offsets in the text.
 
-        return chunks
+    Tokens are counted with the tokenizer of model, not with the one of the
+    embedding model. The default embedding model (all-MiniLM-L6-v2) ignores
+    everything after 256 WordPiece tokens, which usually cover less text than
+    256 gpt-3.5-turbo tokens, so max_tokens has to leave a margin below that.
+    """
+
+    # reserved for the blank line joining two blocks
+    _separator_tokens = 1
+
+    def __init__(self, max_tokens: int = 192, model: str = "gpt-3.5-turbo"):
+        self._max_tokens = max_tokens
+        self._model = model
+        self._sentence_chunker = SentenceChunker(model)
+
+    def __call__(self, text: str) -> list[TextChunk]:
+        segments = self._split_segments(text)
+
+        chunks: list[TextChunk] = []
+        chunk_segments: list[_Segment] = []
+        chunk_size = 0
+        token_offset = 0
+
+        def close_chunk(segments: list[_Segment]):
+            nonlocal token_offset
+
+            no_tokens = sum(segment.no_tokens for segment in segments)
+            char_start = segments[0].char_start
+            char_end = segments[-1].char_end
+
+            chunks.append(
+                TextChunk(
+                    text=text[char_start:char_end],
+                    char_start=char_start,
+                    char_end=char_end,
+                    token_start=token_offset,
+                    token_end=token_offset + no_tokens,
+                )
+            )
+            token_offset += no_tokens
+
+        for segment in segments:
+            segment_size = segment.no_tokens + (
+                self._separator_tokens if chunk_segments else 0
+            )
+
+            if chunk_segments and chunk_size + segment_size > self._max_tokens:
+                # a heading belongs to the block that follows it
+                if len(chunk_segments) > 1 and chunk_segments[-1].type == "heading":
+                    heading = chunk_segments.pop()
+                    close_chunk(chunk_segments)
+                    chunk_segments = [heading]
+                    chunk_size = heading.no_tokens
+                else:
+                    close_chunk(chunk_segments)
+                    chunk_segments = []
+                    chunk_size = 0
 
-    def _split(self, text: str) -> list[str]:
-        chunks = []
-        start = 0
-        end = self._chunk_char_size
+                segment_size = segment.no_tokens + (
+                    self._separator_tokens if chunk_segments else 0
+                )
 
-        while start < len(text):
-            chunk = text[start:end]
-            chunks.append(chunk)
+            chunk_segments.append(segment)
+            chunk_size += segment_size
 
-            start += self._chunk_char_size - self._overlap
-            end = start + self._chunk_char_size
+        if chunk_segments:
+            close_chunk(chunk_segments)
 
         return chunks
 
+    def _split_segments(self, text: str) -> list[_Segment]:
+        blocks = self._split_blocks(text)
+        counts = get_no_tokens_batch(
+            [text[block.char_start : block.char_end] for block in blocks], self._model
+        )
+
+        segments = []
+
+        for block, count in zip(blocks, counts):
+            if count <= self._max_tokens:
+                segments.append(
+                    _Segment(block.char_start, block.char_end, count, block.type)
+                )
+                continue
+
+            block_text = text[block.char_start : block.char_end]
+            segments += [
+                _Segment(
+                    block.char_start + chunk.char_start,
+                    block.char_start + chunk.char_end,
+                    chunk.no_tokens,
+                    "paragraph",
+                )
+                for chunk in self._sentence_chunker(block_text, self._max_tokens)
+            ]
+
+        return segments
+
+    def _split_blocks(self, text: str) -> list[_Block]:
+        """
+        Splits markdown into blocks separated by blank lines. Headings are
+        blocks of their own and fenced blocks may contain blank lines.
+        """
+        blocks: list[_Block] = []
+        block_start: Optional[int] = None
+        fence: Optional[str] = None
+        offset = 0
+
+        def close_block(end: int, type: BlockType = "paragraph"):
+            nonlocal block_start
+
+            if block_start is not None:
+                end = block_start + len(text[block_start:end].rstrip())
+                if end > block_start:
+                    blocks.append(_Block(block_start, end, type))
+
+            block_start = None
+
+        for line in text.splitlines(keepends=True):
+            line_start = offset
+            offset += len(line)
+
+            stripped = line.strip()
+            content_start = line_start + len(line) - len(line.lstrip())
+
+            if fence:
+                if stripped.endswith(fence):
+                    close_block(offset, "fenced")
+                    fence = None
+                continue
+
+            opening = next((f for f in FENCES if stripped.startswith(f)), None)
+
+            if opening:
+                close_block(line_start)
+                block_start = content_start
+
+                # e.g. $$ x^2 $$ on a single line
+                if len(stripped) > 2 * len(opening) and stripped.endswith(opening):
+                    close_block(offset, "fenced")
+                else:
+                    fence = opening
+            elif not stripped:
+                close_block(line_start)
+            elif stripped.startswith("#"):
+                close_block(line_start)
+                block_start = content_start
+                close_block(offset, "heading")
+            elif block_start is None:
+                block_start = content_start
+
+        # an unclosed fence runs until the end of the text
+        close_block(offset, "fenced" if fence else "paragraph")
+
+        return blocks
+
 
-text_splitter = TextSplitter(1000, 70)
+text_splitter = TextSplitter(env_config.TEXT_SPLITTER_MAX_TOKENS)
 
 
 def get_text_splitter():
@@ -11,7 +11,7 @@ from bs4 import BeautifulSoup  # type: ignore
 from PIL import Image  # type: ignore
 
 from config import env_config
-from lib.util.error import retry_on_exception
+from lib.util.error import TransientError, retry_on_exception
 
 logger = logging.getLogger(__name__)
 
@@ -26,9 +26,12 @@ def get_pdf_from_scihub(src: str) -> bytes:
     res = requests.post(env_config.SCIHUB_URL, data={"request": src}, headers=headers)
     soup = BeautifulSoup(res.text, "html.parser")
     iframe = soup.find("iframe", attrs={"id": "pdf"})
-    src = iframe["src"]
 
-    res = requests.get(src, headers=headers)
+    # sci-hub occasionally serves the page without the pdf viewer
+    if iframe is None:
+        raise TransientError(f"Sci-Hub returned no pdf for {src}")
+
+    res = requests.get(str(iframe["src"]), headers=headers)
 
     return res.content
 
@@ -52,7 +55,10 @@ def scrape_url(url: str) -> str:
     if response.ok:
         return response.text
     else:
-        raise Exception(f"Failed to get content from {url}. Response: {response}")
+        raise requests.HTTPError(
+            f"Failed to get content from {url}. Response: {response}",
+            response=response,
+        )
 
 
 @retry_on_exception(exception=Exception, max_retries=3)
@@ -69,8 +75,9 @@ def get_readability(target_url: str, raw_content: str) -> dict:
     if response.ok:
         return response.json()
     else:
-        raise Exception(
-            f"Failed to get readability doc from {url}. Response: {response}"
+        raise requests.HTTPError(
+            f"Failed to get readability doc from {url}. Response: {response}",
+            response=response,
         )
 
 
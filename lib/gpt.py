@@ -1,65 +1,149 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+import aiohttp
 import openai
-import tiktoken
 
 from adapters.database_models.ModelConfig import Messages, ModelParameters
+from config import env_config
+from lib.CompletionScheduler import Priority, get_completion_scheduler
+from lib.tokenizer import calculate_chat_gpt_token_size
 
 
-def calculate_chat_gpt_token_size(messages: Messages, model: str) -> int:
+class OpenAISession:
     """
-    Calculates the number of tokens
-    required to generate a GPT-based chat response for the given messages.
-
-    Args:
-        messages: A list of dictionaries representing messages in the chat conversation.
-                  Each message should have a "role"
-                  key with a value of either "user" or "assistant", and a "content"
-                key with a value of the message text.
-
-    Returns:
-        An integer representing the number of tokens
-        required to generate a response for the given messages.
-
-    Note: This function is copied from OpenAI's documentation and
-          the calculation may change in the future.
-          (https://platform.openai.com/docs/guides/chat/introduction)
+    Holds a single aiohttp session for all OpenAI requests so that completions
+    reuse pooled keep-alive connections instead of opening a new one per call.
     """
-    num_tokens = 0
 
-    for message in messages:
-        num_tokens += (
-            4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
-        )
-        for key, value in message.dict().items():
-            num_tokens += get_no_tokens(value, model)
-            if key == "name":  # if there's a name, the role is omitted
-                num_tokens += -1  # role is always required and always 1 token
+    _session: Optional[aiohttp.ClientSession]
+    _loop: Optional[asyncio.AbstractEventLoop]
 
-    num_tokens += 2  # every reply is primed with <im_start>assistant
-    return num_tokens
+    def __init__(self, max_connections: int):
+        self._max_connections = max_connections
+        self._session = None
+        self._loop = None
 
+    def get(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
 
-def get_no_tokens(text: str, model: str) -> int:
-    encoder = tiktoken.encoding_for_model(model)
+        # the session is bound to the loop it was created on
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self._max_connections)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
 
-    no_tokens = len(encoder.encode(text))
+        return self._session
 
-    return no_tokens
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
 
+        self._session = None
+        self._loop = None
 
-def get_chatgpt_completion(
-    parameters: ModelParameters, messages: Messages, user_id: str
-) -> str:
-    completion = openai.ChatCompletion.create(
-        model=parameters.model,
-        messages=[m.dict() for m in messages],
-        temperature=parameters.temperature,
-        max_tokens=parameters.max_tokens,
-        top_p=parameters.top_p,
-        n=parameters.n,
-        stop=parameters.stop_sequence,
-        presence_penalty=parameters.presence_penalty,
-        frequency_penalty=parameters.frequency_penalty,
-        user=user_id,
+
+openai_session = OpenAISession(env_config.OPENAI_MAX_CONNECTIONS)
+
+
+def _get_completion_params(
+    parameters: ModelParameters,
+    messages: Messages,
+    user_id: str,
+    timeout_s: Optional[float],
+) -> dict:
+    return {
+        "model": parameters.model,
+        "messages": [m.dict() for m in messages],
+        "temperature": parameters.temperature,
+        "max_tokens": parameters.max_tokens,
+        "top_p": parameters.top_p,
+        "n": parameters.n,
+        "stop": parameters.stop_sequence,
+        "presence_penalty": parameters.presence_penalty,
+        "frequency_penalty": parameters.frequency_penalty,
+        "user": user_id,
+        "request_timeout": timeout_s or env_config.OPENAI_REQUEST_TIMEOUT_S,
+    }
+
+
+def _estimate_completion_tokens(parameters: ModelParameters, messages: Messages) -> int:
+    return (
+        calculate_chat_gpt_token_size(messages, parameters.model)
+        + parameters.max_tokens * parameters.n
     )
 
+
+async def get_chatgpt_completion(
+    parameters: ModelParameters,
+    messages: Messages,
+    user_id: str,
+    timeout_s: Optional[float] = None,
+    priority: Priority = "interactive",
+) -> str:
+    scheduler = get_completion_scheduler()
+
+    estimated_tokens = _estimate_completion_tokens(parameters, messages)
+    await scheduler.acquire(estimated_tokens, priority)
+
+    openai.aiosession.set(openai_session.get())
+
+    try:
+        completion = await openai.ChatCompletion.acreate(
+            **_get_completion_params(parameters, messages, user_id, timeout_s)
+        )
+    except BaseException:
+        scheduler.record_usage(estimated_tokens, 0)
+        raise
+
+    if "usage" in completion:
+        scheduler.record_usage(estimated_tokens, completion.usage["total_tokens"])
+
     return completion.choices[0].message["content"]
+
+
+async def stream_chatgpt_completion(
+    parameters: ModelParameters,
+    messages: Messages,
+    user_id: str,
+    timeout_s: Optional[float] = None,
+    priority: Priority = "interactive",
+) -> AsyncIterator[str]:
+    """
+    Yields the content of the first choice piece by piece as it is generated.
+    """
+    scheduler = get_completion_scheduler()
+
+    estimated_tokens = _estimate_completion_tokens(parameters, messages)
+    await scheduler.acquire(estimated_tokens, priority)
+
+    openai.aiosession.set(openai_session.get())
+
+    # streams do not report usage, every content chunk is about one token
+    completion_tokens = 0
+
+    try:
+        chunks = await openai.ChatCompletion.acreate(
+            **_get_completion_params(parameters, messages, user_id, timeout_s),
+            stream=True,
+        )
+
+        async for chunk in chunks:
+            if not chunk.choices:
+                continue
+
+            content = chunk.choices[0].delta.get("content")
+            if content:
+                completion_tokens += 1
+
+            if content and chunk.choices[0].index == 0:
+                yield content
+    finally:
+        # a request that failed before generating anything is refunded
+        used_tokens = (
+            calculate_chat_gpt_token_size(messages, parameters.model)
+            + completion_tokens
+            if completion_tokens
+            else 0
+        )
+        scheduler.record_usage(estimated_tokens, used_tokens)
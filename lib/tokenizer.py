@@ -0,0 +1,89 @@
+from functools import lru_cache
+
+import tiktoken
+
+from adapters.database_models.ModelConfig import Message, Messages, ModelConfig
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str) -> tiktoken.Encoding:
+    return tiktoken.encoding_for_model(model)
+
+
+def get_no_tokens(text: str, model: str) -> int:
+    encoder = get_encoder(model)
+
+    no_tokens = len(encoder.encode_ordinary(text))
+
+    return no_tokens
+
+
+def encode_batch(texts: list[str], model: str) -> list[list[int]]:
+    """
+    Encodes all texts with one call, tiktoken spreads the batch over threads.
+    """
+    if not texts:
+        return []
+
+    return get_encoder(model).encode_ordinary_batch(texts)
+
+
+def get_no_tokens_batch(texts: list[str], model: str) -> list[int]:
+    return [len(tokens) for tokens in encode_batch(texts, model)]
+
+
+def calculate_chat_gpt_token_size(messages: Messages, model: str) -> int:
+    """
+    Calculates the number of tokens
+    required to generate a GPT-based chat response for the given messages.
+
+    Args:
+        messages: A list of dictionaries representing messages in the chat conversation.
+                  Each message should have a "role"
+                  key with a value of either "user" or "assistant", and a "content"
+                key with a value of the message text.
+
+    Returns:
+        An integer representing the number of tokens
+        required to generate a response for the given messages.
+
+    Note: This function is copied from OpenAI's documentation and
+          the calculation may change in the future.
+          (https://platform.openai.com/docs/guides/chat/introduction)
+    """
+    num_tokens = 0
+
+    values = []
+
+    for message in messages:
+        num_tokens += (
+            4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
+        )
+        for key, value in message.dict().items():
+            values.append(value)
+            if key == "name":  # if there's a name, the role is omitted
+                num_tokens += -1  # role is always required and always 1 token
+
+    num_tokens += sum(get_no_tokens_batch(values, model))
+
+    num_tokens += 2  # every reply is primed with <im_start>assistant
+    return num_tokens
+
+
+@lru_cache(maxsize=None)
+def _get_prompt_size(model: str, system_message: str) -> int:
+    messages = [
+        Message(role="system", content=system_message),
+        Message(role="user", content=""),
+    ]
+
+    return calculate_chat_gpt_token_size(messages, model)
+
+
+def get_prompt_size(model_config: ModelConfig) -> int:
+    """
+    Returns the number of tokens of the fixed part of a prompt made of the
+    system message and a user message, i.e. everything except the user's text.
+    The count is computed once per model config.
+    """
+    return _get_prompt_size(model_config.parameters.model, model_config.system_message)
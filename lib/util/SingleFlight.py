@@ -0,0 +1,62 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces concurrent calls with the same key into a single execution.
+
+    The first caller starts the call, every caller arriving while it is in flight
+    awaits the same result (or exception). A cancelled caller does not cancel the
+    call for the others.
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[Hashable, asyncio.Future[T]] = {}
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[T]],
+        forget_on_done: bool = True,
+        ttl_s: Optional[float] = None,
+    ) -> T:
+        """
+        Args:
+            key: Identifies duplicate calls.
+            fn: Starts the call if none is in flight for the key.
+            forget_on_done: Whether the key is released once the call finished.
+                Otherwise a successful result is shared until forget is called.
+            ttl_s: Releases a shared result after ttl_s at the latest, so a key
+                whose owner never calls forget does not stay forever.
+        """
+        flight = self._flights.get(key)
+
+        if flight is None:
+            flight = asyncio.ensure_future(fn())
+            self._flights[key] = flight
+            flight.add_done_callback(
+                lambda f: self._on_done(key, f, forget_on_done, ttl_s)
+            )
+
+        return await asyncio.shield(flight)
+
+    def forget(self, key: Hashable, flight: Optional[asyncio.Future[T]] = None):
+        if key in self._flights and (flight is None or self._flights[key] is flight):
+            del self._flights[key]
+
+    def _on_done(
+        self,
+        key: Hashable,
+        flight: asyncio.Future[T],
+        forget: bool,
+        ttl_s: Optional[float],
+    ):
+        # retrieving the exception marks it as handled even if every caller went
+        # away, failed calls are never shared with later callers
+        if flight.cancelled() or flight.exception() or forget:
+            self.forget(key, flight)
+        elif ttl_s is not None:
+            asyncio.get_running_loop().call_later(ttl_s, self.forget, key, flight)
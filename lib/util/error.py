@@ -1,23 +1,223 @@
+import asyncio
+import inspect
+import logging
+import random
+import re
 import time
-from typing import Any, Callable, Type
+from email.utils import parsedate_to_datetime
+from functools import wraps
+from typing import Any, Callable, Mapping, Optional, Type
+
+import aiohttp
+import openai.error
+import requests
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+RATE_LIMIT_RESET_HEADERS = ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class TransientError(Exception):
+    """
+    Raised for failures that are expected to go away on their own, e.g. an
+    upstream page that was served without its content.
+    """
+
+
+def _get_status_code(e: Exception) -> Optional[int]:
+    status = getattr(e, "http_status", None) or getattr(e, "status", None)
+
+    response = getattr(e, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+
+    return status if isinstance(status, int) else None
+
+
+def _get_headers(e: Exception) -> Mapping[str, str]:
+    headers = getattr(e, "headers", None)
+
+    response = getattr(e, "response", None)
+    if not headers and response is not None:
+        headers = getattr(response, "headers", None)
+
+    return {k.lower(): v for k, v in (headers or {}).items()}
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """
+    Parses durations as sent in OpenAI's rate limit headers, e.g. "1s", "6m0s" or "20ms".
+    """
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def get_retry_after(e: Exception) -> Optional[float]:
+    """
+    Returns the number of seconds the server asked us to wait before retrying,
+    based on the Retry-After or rate limit reset headers of the failed response.
+    """
+    headers = _get_headers(e)
+
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+
+    if "retry-after" in headers:
+        retry_after = headers["retry-after"]
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                return max(retry_at.timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+
+    if _get_status_code(e) == 429:
+        durations = [
+            _parse_duration(headers[header])
+            for header in RATE_LIMIT_RESET_HEADERS
+            if header in headers
+        ]
+        resets = [reset for reset in durations if reset is not None]
+
+        if resets:
+            return max(resets)
+
+    return None
+
+
+def is_transient_error(e: Exception) -> bool:
+    """
+    Decides whether an error can succeed when the same call is simply repeated,
+    e.g. timeouts, dropped connections, rate limits and 5xx responses.
+    """
+    if isinstance(e, openai.error.RateLimitError):
+        # an exhausted quota does not recover by waiting a few seconds
+        return e.code != "insufficient_quota"
+
+    if isinstance(
+        e,
+        (
+            openai.error.Timeout,
+            openai.error.APIConnectionError,
+            openai.error.ServiceUnavailableError,
+            openai.error.TryAgain,
+        ),
+    ):
+        return True
+
+    if isinstance(
+        e,
+        (
+            TransientError,
+            asyncio.TimeoutError,
+            TimeoutError,
+            ConnectionError,
+            aiohttp.ClientConnectionError,
+            requests.ConnectionError,
+            requests.Timeout,
+        ),
+    ):
+        return True
+
+    status = _get_status_code(e)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+
+    # openai reports errors without a response (e.g. broken streams) as APIError
+    return isinstance(e, openai.error.APIError)
 
 
 def retry_on_exception(
-    exception: Type[Exception], max_retries: int = 3, sleep_time: int = 5
+    exception: Type[Exception] = Exception,
+    max_retries: int = 3,
+    sleep_time: float = 5,
+    max_sleep_time: float = 60,
+    deadline_s: Optional[float] = None,
+    is_retryable: Callable[[Exception], bool] = is_transient_error,
 ) -> Callable:
+    """
+    Retries the decorated function or coroutine function when it raises a
+    retryable exception.
+
+    Waits with exponential backoff and full jitter starting at sleep_time, unless
+    the error carries a Retry-After or rate limit reset header. Coroutines sleep
+    with asyncio.sleep so the event loop keeps running in between attempts.
+
+    Args:
+        exception: Exception type that is considered for a retry.
+        max_retries: Maximum number of attempts.
+        sleep_time: Base delay in seconds for the backoff.
+        max_sleep_time: Upper bound for a single backoff delay.
+        deadline_s: Total time budget in seconds for all attempts including waits.
+        is_retryable: Predicate that decides whether a caught exception is retried.
+    """
+
     def decorator(func: Callable):
+        def get_delay(e: Exception, retries: int, started_at: float) -> float:
+            """
+            Returns how long to wait before the next attempt or raises if the
+            error is final.
+            """
+            if not is_retryable(e):
+                raise e
+
+            if retries < max_retries:
+                delay = get_retry_after(e)
+                if delay is None:
+                    backoff = min(max_sleep_time, sleep_time * 2 ** (retries - 1))
+                    delay = random.uniform(0, backoff)
+
+                elapsed = time.monotonic() - started_at
+                if deadline_s is None or elapsed + delay < deadline_s:
+                    logger.warning(
+                        f"{func.__name__} failed ({e}). Retry {retries}/{max_retries - 1} in {delay:.1f}s"
+                    )
+                    return delay
+
+            raise Exception(
+                f"Failed to execute {func.__name__} after {retries} retries due to error: {e}"
+            ) from e
+
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                started_at = time.monotonic()
+                retries = 0
+                while True:
+                    try:
+                        return await func(*args, **kwargs)
+                    except exception as e:
+                        retries += 1
+                        delay = get_delay(e, retries, started_at)
+                    await asyncio.sleep(delay)
+
+            return async_wrapper
+
+        @wraps(func)
         def wrapper(*args, **kwargs) -> Any:
+            started_at = time.monotonic()
             retries = 0
-            while retries < max_retries:
+            while True:
                 try:
                     return func(*args, **kwargs)
                 except exception as e:
                     retries += 1
-                    if retries == max_retries:
-                        raise Exception(
-                            f"Failed to execute {func.__name__} after {max_retries} retries due to error: {e}"
-                        ) from e
-                time.sleep(sleep_time)
+                    delay = get_delay(e, retries, started_at)
+                time.sleep(delay)
 
         return wrapper
 
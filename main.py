@@ -13,17 +13,28 @@ from adapters.database_models.ModelConfig import (
 )
 from adapters.DBConnection import get_db_connection
 from adapters.http_models.HttpModels import HTTPException
-from adapters.repository import ConfigRepository
+from adapters.repository import (
+    ConfigRepository,
+    ContentRepository,
+    VectorTombstoneRepository,
+)
 from adapters.vector_store.ChromaConnection import chroma_conn
+from adapters.vector_store.VectorStore import get_vector_store
+from adapters.vector_store.VectorStore import init as init_vector_store
 from api import api_router
 from config import env_config
+from dependencies import get_card_source_generator
 from lib.GPT import (
     init_card_generation,
     init_qa_model,
     init_single_card_generator,
     init_summarizer,
 )
+from lib.CardSourcePool import CardSourcePool
+from lib.CompletionCache import get_completion_cache
+from lib.gpt import openai_session
 from lib.util.limitier import limiter
+from usecases import VectorReconciler
 
 uvicorn_logger = logging.getLogger("uvicorn")
 uvicorn_logger.propagate = False
@@ -81,9 +92,28 @@ async def lifespan(app: FastAPI):
     logger.info("Connecting to MongoDB...")
     await db_conn.wait_for_connection()
 
+    logger.info("Setting up completion cache...")
+    await get_completion_cache().setup()
+
     logger.info("Connecting to ChromaDB...")
     await chroma_conn.wait_for_connection()
 
+    logger.info("Loading embedding model...")
+    init_vector_store(chroma_conn.get_client())
+    await get_vector_store().setup()
+
+    logger.info("Starting vector reconciler...")
+    tombstone_repository = VectorTombstoneRepository(get_db_connection())
+    await tombstone_repository.ensure_indexes()
+    vector_reconciler = VectorReconciler(
+        ContentRepository(get_db_connection()),
+        tombstone_repository,
+        get_vector_store(),
+        interval_s=env_config.VECTOR_RECONCILE_INTERVAL_S,
+        orphan_scan_interval_s=env_config.VECTOR_ORPHAN_SCAN_INTERVAL_S,
+    )
+    vector_reconciler.start()
+
     await env_setups[env_config.ENV]()
 
     logger.info("Loading Question Answer GPT model...")
@@ -92,8 +122,21 @@ async def lifespan(app: FastAPI):
     )
     init_qa_model(qagpt_model_config)
 
+    card_source_generator = get_card_source_generator()
+    if isinstance(card_source_generator, CardSourcePool):
+        logger.info("Starting card source workers...")
+        card_source_generator.start()
+
     yield
 
+    logger.info("Shutting down...")
+    await openai_session.close()
+    vector_reconciler.close()
+    get_vector_store().close()
+
+    if isinstance(card_source_generator, CardSourcePool):
+        card_source_generator.close()
+
 
 app = FastAPI(lifespan=lifespan)
 app.state.limiter = limiter
@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from typing import List
 
@@ -89,8 +90,15 @@ class DeckServiceAPIMock:
 
 
 class CardSourceGeneratorMock:
-    def __call__(self, text: str, question: str):
-        return 0, 4
+    async def __call__(
+        self,
+        text: str,
+        questions: List[str],
+        sentence_index=None,
+        answers=None,
+        hints=None,
+    ):
+        return [(0, 4) for _ in questions]
 
 
 def get_deck_service_mock():
@@ -161,6 +169,36 @@ def test_create_cards():
     assert response_data == expeceted_data
 
 
+def test_stream_cards():
+    expected_card = {
+        "question": "What is the capital of the United States?",
+        "answer": "Washington D.C.",
+        "source_start_index": 0,
+        "source_end_index": 4,
+    }
+
+    data = {
+        "text": "text",
+        "deck_id": "1",
+    }
+    response = client.post(f"/notes/stream?userID={str(OBJECT_ID)}", json=data)
+
+    events = [
+        (lines[0].removeprefix("event: "), json.loads(lines[1].removeprefix("data: ")))
+        for lines in (
+            event.split("\n") for event in response.text.strip().split("\n\n")
+        )
+    ]
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert events[:3] == [("card", expected_card)] * 3
+    assert events[3] == (
+        "done",
+        {"id": str(OBJECT_ID), "text": "text", "cards": [expected_card] * 3},
+    )
+
+
 def test_create_cards_exceed_char_limit():
     expected_status_code = 422
 
@@ -0,0 +1,94 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from adapters.database_models.ModelConfig import ModelConfig, ModelParameters
+from lib.GPT.CardGeneration import CardGeneration
+from lib.TextChunker import TextChunk
+from tests.text.test_text_chunker import ByteEncoder, split_sentences
+
+
+def get_card_generation() -> CardGeneration:
+    model_config = ModelConfig(
+        system_message="Create flashcards.",
+        max_model_tokens=4096,
+        parameters=ModelParameters(
+            temperature=0,
+            model="gpt-3.5-turbo",
+            max_tokens=500,
+            top_p=1,
+            n=1,
+            stop_sequence=None,
+        ),
+    )
+
+    return CardGeneration(model_config, "key", max_text_length=100)
+
+
+def test_card_generation_merges_chunks():
+    text = "Paris is in France. Berlin is in Germany."
+    chunks = [TextChunk(text[:19], 0, 19, 0, 5), TextChunk(text[20:], 20, 41, 5, 10)]
+
+    completions = {
+        chunks[0].text: "Front: Where is Paris?\nBack: France",
+        chunks[1].text: "Front: Where is Berlin?\nBack: Germany\n\n"
+        "Front: where is paris\nBack: France",
+    }
+
+    async def get_completion(messages, user_id):
+        return completions[messages[1].content]
+
+    generator = get_card_generation()
+
+    with patch.object(generator, "_plan_chunks", return_value=chunks), patch.object(
+        generator, "_get_completion", side_effect=get_completion
+    ):
+        cards = asyncio.run(generator(text, "user123"))
+
+    assert [card.question for card in cards] == ["Where is Paris?", "Where is Berlin?"]
+    assert [(c.chunk_start_index, c.chunk_end_index) for c in cards] == [
+        (0, 19),
+        (20, 41),
+    ]
+
+
+def test_card_generation_rejects_long_text():
+    with pytest.raises(ValueError):
+        get_card_generation()._plan_chunks("a" * 101)
+
+
+def test_card_generation_plans_sentence_chunks():
+    text = "Paris is in France. Berlin is in Germany.\nRome is in Italy."
+
+    async def get_completion(messages, user_id):
+        city = messages[1].content.split()[0]
+        return f"Front: Where is {city}?\nBack: Europe"
+
+    generator = get_card_generation()
+
+    with patch("lib.tokenizer.get_encoder", return_value=ByteEncoder()), patch(
+        "lib.TextChunker.get_encoder", return_value=ByteEncoder()
+    ), patch(
+        "lib.TextChunker.sent_tokenize", side_effect=split_sentences
+    ), patch.object(
+        generator, "_get_chunk_size", return_value=42
+    ), patch.object(
+        generator, "_get_completion", side_effect=get_completion
+    ):
+        chunks = generator._plan_chunks(text)
+        cards = asyncio.run(generator(text, "user123"))
+
+    # whole sentences are packed up to the chunk size
+    assert [chunk.text for chunk in chunks] == [
+        "Paris is in France. Berlin is in Germany.",
+        "Rome is in Italy.",
+    ]
+    assert [(c.chunk_start_index, c.chunk_end_index) for c in cards] == [
+        (0, 41),
+        (42, 59),
+    ]
+    assert all(
+        text[c.chunk_start_index : c.chunk_end_index] == chunk.text
+        for c, chunk in zip(cards, chunks)
+    )
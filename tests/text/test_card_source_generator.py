@@ -1,14 +1,9 @@
 from lib.CardSourceGenerator import CardSourceGenerator
+from lib.SentenceIndex import SentenceIndex
 
 
 def test_find_sentence_indices():
-    try:
-        source_generator = CardSourceGenerator()
-    except OSError:
-        print("Unable to load model. Please ensure the model is downloaded.")
-        return
-
-    test_cases = [
+    test_cases: list[dict] = [
         {
             "text": "This is a test sentence. It contains a substring that we want to find. The substring is here.",
             "substring_start": 29,
@@ -33,9 +28,121 @@ def test_find_sentence_indices():
         substring_start = test_case["substring_start"]
         substring_end = test_case["substring_end"]
         expected_output = test_case["expected_output"]
-        output = source_generator._find_sentence_indices(
-            text, substring_start, substring_end
+        output = SentenceIndex.from_text(text).find_enclosing(
+            substring_start, substring_end
         )
         assert (
             output == expected_output
         ), f"Failed test case {i}. Expected {expected_output}, but got {output}"
+
+
+def test_sentence_index_finds_enclosing_sentence():
+    text = "It repeats. Something else.\nIt repeats. The end!"
+    sentence_index = SentenceIndex.from_text(text)
+
+    assert sentence_index.boundaries == [(0, 11), (12, 27), (28, 39), (40, 48)]
+    # the second occurrence of a repeated sentence resolves to its own position
+    assert sentence_index.find_enclosing(31, 38) == (28, 39)
+    # answers spanning two sentences cover both
+    assert sentence_index.find_enclosing(5, 20) == (0, 27)
+
+
+def test_sentence_index_window():
+    text = "First one. Second one. Third one."
+    sentence_index = SentenceIndex.from_text(text)
+
+    window = sentence_index.window(11, 33)
+
+    assert window.boundaries == [(0, 11), (12, 22)]
+    assert window.find_enclosing(13, 16) == (12, 22)
+
+
+class KeywordEmbedding:
+    """
+    Embeds texts by the keywords they contain.
+    """
+
+    keywords = ["paris", "berlin", "rome"]
+
+    def __call__(self, texts):
+        return [[float(k in text.lower()) for k in self.keywords] for text in texts]
+
+
+class QABackendMock:
+    """
+    Counts words as tokens and answers with the start of every context.
+    """
+
+    max_context_tokens = 5
+
+    def __init__(self):
+        self.questions = []
+        self.contexts = []
+
+    def count_tokens(self, texts):
+        return [len(text.split()) for text in texts]
+
+    def __call__(self, questions, contexts, batch_size):
+        self.questions += questions
+        self.contexts += contexts
+        return [{"start": 0, "end": 5, "score": 1.0} for _ in questions]
+
+
+def test_embedding_mode_falls_back_to_qa():
+    text = "Paris is in France. Berlin is in Germany. Rome is in Italy."
+    qa_backend = QABackendMock()
+    source_generator = CardSourceGenerator(
+        qa_backend,  # type: ignore
+        embedding_function=KeywordEmbedding(),
+        similarity_threshold=0.5,
+    )
+
+    sources = source_generator(
+        text,
+        ["Which city is in Germany?", "Which country is Rome in?", "What is Madrid?"],
+        answers=["Berlin", "Italy", "The capital of Spain"],
+    )
+
+    assert sources == [(20, 41), (42, 59), (0, 19)]
+    # only the card without a similar sentence is answered by the QA model
+    assert set(qa_backend.questions) == {"What is Madrid?"}
+
+
+def test_qa_windows_follow_paragraphs_and_hints():
+    text = "One two three.\n\nFour five.\n\nSix seven eight nine. Ten eleven twelve."
+    qa_backend = QABackendMock()
+    source_generator = CardSourceGenerator(qa_backend)  # type: ignore
+
+    sentence_index = SentenceIndex.from_text(text)
+    windows = source_generator._get_windows(text, sentence_index)
+
+    # the first two paragraphs share a window, the last one is split by sentence
+    assert [text[s:e] for s, e in windows] == [
+        "One two three.\n\nFour five.",
+        "Six seven eight nine.",
+        "Ten eleven twelve.",
+    ]
+
+    sources = source_generator(
+        text, ["Which number?"], sentence_index, hints=[(50, len(text))]
+    )
+
+    assert qa_backend.contexts == ["Ten eleven twelve."]
+    assert sources == [(50, 68)]
+
+
+def test_unanswered_cards_fall_back_to_their_hint():
+    text = "One two three. Four five six."
+
+    class NoAnswerBackend(QABackendMock):
+        def __call__(self, questions, contexts, batch_size):
+            return [{"start": 0, "end": 0, "score": -2.0} for _ in questions]
+
+    source_generator = CardSourceGenerator(NoAnswerBackend())  # type: ignore
+
+    sources = source_generator(
+        text, ["First?", "Second?"], hints=[(15, len(text)), None]
+    )
+
+    # one source per question, in order
+    assert sources == [(15, len(text)), (0, len(text))]
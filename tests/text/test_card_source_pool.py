@@ -0,0 +1,109 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+import pytest
+
+from lib.CardSourcePool import (
+    BackendConfig,
+    CardSourcePool,
+    CardSourcePoolSaturatedError,
+    _init_worker,
+)
+
+
+def get_pool(**kwargs) -> CardSourcePool:
+    pool = CardSourcePool(
+        BackendConfig("pipeline", "model", "onnx", False, 0, 8), **kwargs
+    )
+    # runs in threads so that the worker function can be patched
+    pool._executor = ThreadPoolExecutor(1)  # type: ignore
+
+    return pool
+
+
+def find_sources(requests):
+    return [[(0, len(request.text))] * len(request.questions) for request in requests]
+
+
+def test_card_source_pool_batches_concurrent_requests():
+    pool = get_pool()
+
+    async def run():
+        return await asyncio.gather(
+            pool("First note.", ["Q1", "Q2"]), pool("Second note.", ["Q3"])
+        )
+
+    with patch("lib.CardSourcePool._find_sources", side_effect=find_sources) as mock:
+        sources = asyncio.run(run())
+
+    assert sources == [[(0, 11), (0, 11)], [(0, 12)]]
+    assert mock.call_count == 1
+
+
+def test_card_source_pool_rejects_when_saturated():
+    pool = get_pool(max_pending=2)
+
+    async def run():
+        first = asyncio.create_task(pool("First note.", ["Q1", "Q2"]))
+        await asyncio.sleep(0)
+
+        with pytest.raises(CardSourcePoolSaturatedError):
+            await pool("Second note.", ["Q3"])
+
+        return await first
+
+    with patch("lib.CardSourcePool._find_sources", side_effect=find_sources):
+        assert asyncio.run(run()) == [(0, 11), (0, 11)]
+
+
+def test_card_source_pool_admits_large_request_when_idle():
+    pool = get_pool(max_pending=2)
+
+    with patch("lib.CardSourcePool._find_sources", side_effect=find_sources):
+        sources = asyncio.run(pool("Note.", ["Q1", "Q2", "Q3"]))
+
+    assert sources == [(0, 5)] * 3
+
+
+def test_card_source_pool_replaces_broken_workers():
+    pool = get_pool()
+    broken = [True]
+
+    def find_sources_once_broken(requests):
+        if requests and broken:
+            broken.pop()
+            raise BrokenProcessPool("worker died")
+        return find_sources(requests)
+
+    async def run():
+        with pytest.raises(BrokenProcessPool):
+            await pool("Note.", ["Q1"])
+
+        assert pool._executor is None
+
+        return await pool("Note.", ["Q1"])
+
+    with patch(
+        "lib.CardSourcePool._find_sources", side_effect=find_sources_once_broken
+    ), patch(
+        "lib.CardSourcePool.ProcessPoolExecutor",
+        side_effect=lambda **kwargs: ThreadPoolExecutor(1),
+    ) as executor:
+        assert asyncio.run(run()) == [(0, 5)]
+
+    assert executor.call_count == 1
+
+
+def test_worker_passes_window_config_to_backend():
+    config = BackendConfig(
+        "onnx", "model", "onnx", False, 0, 8, max_seq_len=256, max_answer_len=30
+    )
+
+    with patch("lib.CardSourcePool.get_question_answering_backend") as get_backend:
+        _init_worker(config)
+
+    kwargs = get_backend.call_args.kwargs
+    assert (kwargs["max_seq_len"], kwargs["doc_stride"]) == (256, 128)
+    assert (kwargs["max_question_len"], kwargs["max_answer_len"]) == (64, 30)
@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from config import env_config
+from lib.QuestionAnswering import ONNXBackend, PipelineBackend, prepare_onnx_model
+from lib.SentenceIndex import SentenceIndex
+
+CONTEXT = (
+    "The mitochondrion is the powerhouse of the cell. It produces ATP through "
+    "cellular respiration. Photosynthesis takes place in the chloroplasts of "
+    "plant cells. The nucleus contains most of the genetic material of the cell."
+)
+
+QUESTIONS = [
+    "What is the powerhouse of the cell?",
+    "How does the mitochondrion produce ATP?",
+    "Where does photosynthesis take place?",
+    "What does the nucleus contain?",
+]
+
+
+def test_onnx_backend_matches_pipeline(tmp_path):
+    try:
+        pipeline_backend = PipelineBackend(env_config.BERT_MODEL_PATH)
+        onnx_backend = ONNXBackend(env_config.BERT_MODEL_PATH, str(tmp_path))
+    except (OSError, ImportError):
+        pytest.skip("Unable to load model. Please ensure the model is downloaded.")
+
+    sentence_index = SentenceIndex.from_text(CONTEXT)
+
+    expected = pipeline_backend(QUESTIONS, [CONTEXT] * len(QUESTIONS), batch_size=4)
+    answers = onnx_backend(QUESTIONS, [CONTEXT] * len(QUESTIONS), batch_size=4)
+
+    for e, a in zip(expected, answers):
+        assert sentence_index.find_enclosing(
+            a["start"], a["end"]
+        ) == sentence_index.find_enclosing(e["start"], e["end"])
+
+
+def test_prepare_onnx_model_exports_once(tmp_path):
+    def export(model_path, model_file):
+        with open(model_file, "w") as f:
+            f.write("model")
+            # a worker checking the file now must not see it yet
+            time.sleep(0.05)
+
+    with patch(
+        "lib.QuestionAnswering.export_onnx_model", side_effect=export
+    ) as export_model, ThreadPoolExecutor(3) as executor:
+        model_files = list(
+            executor.map(
+                lambda _: prepare_onnx_model("model", str(tmp_path), False), range(3)
+            )
+        )
+
+    assert export_model.call_count == 1
+    assert all(open(model_file).read() == "model" for model_file in model_files)
+    assert not (tmp_path / "model.onnx.tmp").exists()
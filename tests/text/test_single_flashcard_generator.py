@@ -1,3 +1,4 @@
+import asyncio
 from unittest.mock import Mock, patch
 
 from adapters.database_models.ModelConfig import ModelConfig
@@ -18,6 +19,6 @@ def test_single_flashcard_generator():
         "_get_completion",
         return_value="Q: What is Python?\nA: A programming language.",
     ):
-        result = generator("Tell me about Python.", "user123")
+        result = asyncio.run(generator("Tell me about Python.", "user123"))
         assert result.question == "What is Python?"
         assert result.answer == "A programming language."
@@ -0,0 +1,70 @@
+import asyncio
+from unittest.mock import patch
+
+from adapters.database_models.ModelConfig import ModelConfig, ModelParameters
+from lib.GPT.Summarizer import Summarizer
+from lib.TextChunker import TextChunk
+
+
+def get_summarizer(**kwargs) -> Summarizer:
+    model_config = ModelConfig(
+        parameters=ModelParameters(
+            temperature=0, model="gpt-3.5-turbo", max_tokens=100, top_p=1, n=1
+        ),
+        max_model_tokens=4096,
+        system_message="Summarize.",
+    )
+
+    return Summarizer(model_config, "key", **kwargs)
+
+
+def get_chunks(texts: list[str]) -> list[TextChunk]:
+    return [TextChunk(text, 0, len(text), 0, len(text)) for text in texts]
+
+
+def test_summarizer_keeps_chunk_order_and_limits_concurrency():
+    summarizer = get_summarizer(max_concurrency=2)
+    in_flight = []
+    max_in_flight = 0
+
+    async def get_completion(messages, user_id):
+        nonlocal max_in_flight
+
+        text = messages[-1].content
+        in_flight.append(text)
+        max_in_flight = max(max_in_flight, len(in_flight))
+
+        # later chunks finish first
+        await asyncio.sleep(0.01 / int(text))
+        in_flight.remove(text)
+
+        return f"summary {text}"
+
+    with patch.object(summarizer, "_get_completion", side_effect=get_completion):
+        summaries = asyncio.run(
+            summarizer._summarize_chunks(get_chunks(["1", "2", "3", "4", "5"]), "user")
+        )
+
+    assert summaries == [f"summary {i}" for i in range(1, 6)]
+    assert max_in_flight == 2
+
+
+def test_summarizer_reduce_stops_when_summary_does_not_shrink():
+    summarizer = get_summarizer()
+
+    async def get_completion(messages, user_id):
+        # as long as the text it summarizes
+        return messages[-1].content
+
+    with patch.object(
+        summarizer, "_get_completion", side_effect=get_completion
+    ) as completion, patch.object(
+        summarizer, "_chunk_text", return_value=get_chunks(["aaaa", "bbbb"])
+    ), patch(
+        "lib.GPT.Summarizer.get_no_tokens", side_effect=lambda text, model: len(text)
+    ):
+        summary = asyncio.run(summarizer._reduce("aaaa bbbb", 4, "user"))
+
+    # a single round, the unchanged summary is kept
+    assert summary == "aaaa bbbb"
+    assert completion.call_count == 2
@@ -0,0 +1,65 @@
+import re
+from unittest.mock import patch
+
+from lib.TextChunker import SentenceChunker
+
+
+class ByteEncoder:
+    """
+    Treats every utf-8 byte as one token.
+    """
+
+    def encode_ordinary_batch(self, texts: list[str]) -> list[list[int]]:
+        return [list(text.encode("utf-8")) for text in texts]
+
+    def decode_bytes(self, tokens: list[int]) -> bytes:
+        return bytes(tokens)
+
+
+def split_sentences(text: str) -> list[str]:
+    return re.split(r"(?<=[.!?])\s+", text)
+
+
+def chunk(text: str, target_size: int):
+    with patch("lib.tokenizer.get_encoder", return_value=ByteEncoder()), patch(
+        "lib.TextChunker.get_encoder", return_value=ByteEncoder()
+    ), patch("lib.TextChunker.sent_tokenize", side_effect=split_sentences):
+        return SentenceChunker("model")(text, target_size)
+
+
+def test_chunk_text_packs_sentences():
+    text = "First one. Second one.\nThird one is longer."
+
+    chunks = chunk(text, 25)
+
+    assert [c.text for c in chunks] == [
+        "First one. Second one.",
+        "Third one is longer.",
+    ]
+    assert [(c.char_start, c.char_end) for c in chunks] == [(0, 22), (23, 43)]
+    assert [(c.token_start, c.token_end) for c in chunks] == [(0, 21), (21, 41)]
+    assert all(text[c.char_start : c.char_end] == c.text for c in chunks)
+
+
+def test_chunk_text_splits_oversized_sentence():
+    text = "Short. " + "ä" * 10 + "."
+
+    chunks = chunk(text, 6)
+
+    assert chunks[0].text == "Short."
+    assert "".join(c.text for c in chunks[1:]) == "ä" * 10 + "."
+    assert all(c.no_tokens <= 6 for c in chunks)
+
+
+def test_chunk_text_keeps_normalized_sentences():
+    text = 'First one. He said "hi". Then he left.'
+
+    def normalize_quotes(text: str) -> list[str]:
+        return [sentence.replace('"', "''") for sentence in split_sentences(text)]
+
+    with patch("lib.tokenizer.get_encoder", return_value=ByteEncoder()), patch(
+        "lib.TextChunker.get_encoder", return_value=ByteEncoder()
+    ), patch("lib.TextChunker.sent_tokenize", side_effect=normalize_quotes):
+        chunks = SentenceChunker("model")(text, 14)
+
+    assert [c.text for c in chunks] == ["First one.", 'He said "hi".', "Then he left."]
@@ -0,0 +1,55 @@
+import re
+from unittest.mock import patch
+
+from lib.TextSplitter import TextSplitter
+
+
+class WordEncoder:
+    """
+    Treats every whitespace separated word as one token.
+    """
+
+    def encode_ordinary_batch(self, texts: list[str]) -> list[list[int]]:
+        return [[len(word) for word in text.split()] for text in texts]
+
+
+def split_sentences(text: str) -> list[str]:
+    return re.split(r"(?<=[.!?])\s+", text)
+
+
+def split(text: str, max_tokens: int):
+    with patch("lib.tokenizer.get_encoder", return_value=WordEncoder()), patch(
+        "lib.TextChunker.sent_tokenize", side_effect=split_sentences
+    ):
+        return TextSplitter(max_tokens, "model")(text)
+
+
+def test_text_splitter_keeps_blocks_whole():
+    text = (
+        "# Energy\n\n"
+        "Mass and energy are equivalent. Einstein found the relation.\n\n"
+        "$$\nE = mc^2\n\n\\text{with c the speed of light}\n$$\n\n"
+        "## Momentum\n\n"
+        "Momentum is mass times velocity."
+    )
+
+    chunks = split(text, 14)
+
+    assert [c.text for c in chunks] == [
+        "# Energy\n\nMass and energy are equivalent. Einstein found the relation.",
+        "$$\nE = mc^2\n\n\\text{with c the speed of light}\n$$",
+        "## Momentum\n\nMomentum is mass times velocity.",
+    ]
+    assert all(text[c.char_start : c.char_end] == c.text for c in chunks)
+
+
+def test_text_splitter_splits_oversized_blocks_at_sentences():
+    text = "One two three. Four five six. Seven eight nine.\n\nTen."
+
+    chunks = split(text, 7)
+
+    assert [c.text for c in chunks] == [
+        "One two three. Four five six.",
+        "Seven eight nine.\n\nTen.",
+    ]
+    assert all(text[c.char_start : c.char_end] == c.text for c in chunks)
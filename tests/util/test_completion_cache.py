@@ -0,0 +1,121 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+from adapters.database_models.ModelConfig import Message, ModelConfig, ModelParameters
+from lib.CompletionCache import CompletionCache
+
+
+class CompletionCacheRepositoryMock:
+    def __init__(self):
+        self.documents: dict[str, dict] = {}
+
+    async def ensure_indexes(self, ttl_s):
+        pass
+
+    async def find_one(self, query):
+        return self.documents.get(query["key"])
+
+    async def upsert_one(self, query, document):
+        self.documents[query["key"]] = document
+
+
+def get_model_config(temperature: int = 0) -> ModelConfig:
+    return ModelConfig(
+        parameters=ModelParameters(
+            temperature=temperature, model="gpt-3.5-turbo", max_tokens=10, top_p=1, n=1
+        ),
+        max_model_tokens=4096,
+        system_message="Summarize.",
+    )
+
+
+def get_messages(text: str):
+    return [Message(role="user", content=text)]
+
+
+def test_completion_cache_evicts_least_recently_used():
+    cache = CompletionCache(CompletionCacheRepositoryMock(), max_entries=2, ttl_s=60)
+    model_config = get_model_config()
+
+    async def run():
+        for text in ["a", "b", "a", "c"]:
+            await cache.get_or_create(
+                model_config, get_messages(text), AsyncMock(return_value=text)
+            )
+
+    asyncio.run(run())
+
+    keys = [cache._make_key(model_config, get_messages(text)) for text in "abc"]
+    # b was used least recently when c was added
+    assert list(cache._entries) == [keys[0], keys[2]]
+
+
+def test_completion_cache_bypasses_sampled_completions():
+    repository = CompletionCacheRepositoryMock()
+    cache = CompletionCache(repository, max_entries=10, ttl_s=60)
+    model_config = get_model_config(temperature=1)
+    create = AsyncMock(side_effect=["first", "second"])
+
+    async def run():
+        return [
+            await cache.get_or_create(model_config, get_messages("a"), create)
+            for _ in range(2)
+        ]
+
+    assert asyncio.run(run()) == ["first", "second"]
+    assert not repository.documents and not cache._entries
+    assert cache.stats()[str(model_config.id)]["bypassed"] == 2
+
+
+def test_completion_cache_fills_memory_from_persistent_hit():
+    repository = CompletionCacheRepositoryMock()
+    model_config = get_model_config()
+
+    async def run():
+        await CompletionCache(repository, max_entries=10, ttl_s=60).get_or_create(
+            model_config, get_messages("a"), AsyncMock(return_value="stored")
+        )
+
+        # a new process only has the persistent tier
+        cache = CompletionCache(repository, max_entries=10, ttl_s=60)
+        create = AsyncMock()
+        results = [
+            await cache.get_or_create(model_config, get_messages("a"), create)
+            for _ in range(2)
+        ]
+
+        return cache, create, results
+
+    cache, create, results = asyncio.run(run())
+
+    assert results == ["stored", "stored"]
+    assert create.call_count == 0
+    stats = cache.stats()[str(model_config.id)]
+    assert (stats["persistent_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_completion_cache_replays_streamed_completion():
+    repository = CompletionCacheRepositoryMock()
+    cache = CompletionCache(repository, max_entries=10, ttl_s=60)
+    model_config = get_model_config()
+    calls = []
+
+    async def create():
+        calls.append(1)
+        for chunk in ["Hello", " world"]:
+            yield chunk
+
+    async def stream():
+        return [
+            chunk
+            async for chunk in cache.stream_or_create(
+                model_config, get_messages("a"), create
+            )
+        ]
+
+    async def run():
+        return [await stream() for _ in range(2)]
+
+    assert asyncio.run(run()) == [["Hello", " world"], ["Hello world"]]
+    assert len(calls) == 1
+    assert [d["completion"] for d in repository.documents.values()] == ["Hello world"]
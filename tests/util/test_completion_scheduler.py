@@ -0,0 +1,137 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from adapters.database_models.ModelConfig import Message, ModelParameters
+from lib.CompletionScheduler import CompletionScheduler
+from lib.gpt import get_chatgpt_completion, stream_chatgpt_completion
+
+
+def test_scheduler_serves_interactive_before_background():
+    # refills 100 requests and 1000 tokens per second
+    scheduler = CompletionScheduler(6000, 60000)
+    order = []
+
+    async def acquire(name, priority):
+        await scheduler.acquire(10, priority)
+        order.append(name)
+
+    async def run():
+        await scheduler.acquire(60000)
+
+        background = asyncio.create_task(acquire("background", "background"))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(acquire("interactive", "interactive"))
+
+        await asyncio.gather(background, interactive)
+
+    asyncio.run(run())
+
+    assert order == ["interactive", "background"]
+
+
+def test_scheduler_waits_for_token_budget():
+    # refills 100 tokens per second
+    scheduler = CompletionScheduler(6000, 6000)
+
+    async def run():
+        await scheduler.acquire(6000)
+
+        started_at = time.monotonic()
+        await scheduler.acquire(5)
+        return time.monotonic() - started_at
+
+    assert asyncio.run(run()) >= 0.04
+
+
+def test_scheduler_removes_waiter_on_timeout():
+    scheduler = CompletionScheduler(6000, 6000)
+
+    async def run():
+        await scheduler.acquire(6000)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.acquire(3000), timeout=0.01)
+
+        depth = scheduler.stats()["queue_depth"]
+
+        # the next request is not stuck behind the abandoned one
+        await asyncio.wait_for(scheduler.acquire(2), timeout=1)
+
+        return depth
+
+    assert asyncio.run(run()) == {"interactive": 0, "background": 0}
+
+
+def test_scheduler_corrects_budget_with_actual_usage():
+    # refills one token per second
+    scheduler = CompletionScheduler(60, 60)
+
+    async def run():
+        await scheduler.acquire(10)
+        scheduler.record_usage(10, 30)
+        after_usage = scheduler.stats()["available_tokens"]
+
+        scheduler.record_usage(30, 0)
+        after_refund = scheduler.stats()["available_tokens"]
+
+        return after_usage, after_refund
+
+    after_usage, after_refund = asyncio.run(run())
+
+    assert after_usage == pytest.approx(30, abs=0.5)
+    assert after_refund == pytest.approx(60, abs=0.5)
+
+
+def test_failed_completion_refunds_estimated_tokens():
+    scheduler = CompletionScheduler(60, 6000)
+    parameters = ModelParameters(
+        temperature=0, model="gpt-3.5-turbo", max_tokens=100, top_p=1, n=1
+    )
+
+    with patch("lib.gpt.get_completion_scheduler", return_value=scheduler), patch(
+        "lib.gpt._estimate_completion_tokens", return_value=1000
+    ), patch(
+        "lib.gpt.openai.ChatCompletion.acreate", side_effect=ConnectionError("reset")
+    ):
+        with pytest.raises(ConnectionError):
+            asyncio.run(
+                get_chatgpt_completion(
+                    parameters, [Message(role="user", content="hi")], "user"
+                )
+            )
+
+    assert scheduler.stats()["available_tokens"] == pytest.approx(6000, abs=1)
+
+
+def test_failed_stream_records_generated_tokens():
+    scheduler = CompletionScheduler(60, 6000)
+    parameters = ModelParameters(
+        temperature=0, model="gpt-3.5-turbo", max_tokens=100, top_p=1, n=1
+    )
+
+    async def chunks():
+        yield SimpleNamespace(
+            choices=[SimpleNamespace(index=0, delta={"content": "a"})]
+        )
+        raise ConnectionError("reset")
+
+    async def run():
+        async for _ in stream_chatgpt_completion(
+            parameters, [Message(role="user", content="hi")], "user"
+        ):
+            pass
+
+    with patch("lib.gpt.get_completion_scheduler", return_value=scheduler), patch(
+        "lib.gpt._estimate_completion_tokens", return_value=1000
+    ), patch("lib.gpt.calculate_chat_gpt_token_size", return_value=10), patch(
+        "lib.gpt.openai.ChatCompletion.acreate", return_value=chunks()
+    ):
+        with pytest.raises(ConnectionError):
+            asyncio.run(run())
+
+    # the prompt and the one generated token are charged, the rest is refunded
+    assert scheduler.stats()["available_tokens"] == pytest.approx(5989, abs=5)
@@ -0,0 +1,101 @@
+import asyncio
+from unittest.mock import ANY, Mock, patch
+
+import openai.error
+import pytest
+
+from lib.content.util import get_pdf_from_scihub
+from lib.util.error import get_retry_after, is_transient_error, retry_on_exception
+
+
+def test_retry_sync_transient_error():
+    func = Mock(side_effect=[ConnectionError("reset"), "ok"])
+    func.__name__ = "func"
+
+    with patch("lib.util.error.time.sleep") as sleep:
+        result = retry_on_exception(Exception, max_retries=3, sleep_time=1)(func)()
+
+    assert result == "ok"
+    assert func.call_count == 2
+    assert sleep.call_count == 1
+
+
+def test_retry_async_uses_retry_after_header():
+    error = openai.error.RateLimitError(
+        "rate limited", http_status=429, headers={"Retry-After": "3"}
+    )
+    calls = []
+
+    @retry_on_exception(Exception, max_retries=3, sleep_time=1)
+    async def func():
+        calls.append(1)
+        if len(calls) == 1:
+            raise error
+        return "ok"
+
+    with patch("lib.util.error.asyncio.sleep") as sleep:
+        result = asyncio.run(func())
+
+    assert result == "ok"
+    sleep.assert_awaited_once_with(3.0)
+
+
+def test_no_retry_for_permanent_error():
+    func = Mock(side_effect=openai.error.InvalidRequestError("bad", param=None))
+    func.__name__ = "func"
+
+    with patch("lib.util.error.time.sleep") as sleep:
+        with pytest.raises(openai.error.InvalidRequestError):
+            retry_on_exception(Exception, max_retries=3)(func)()
+
+    assert func.call_count == 1
+    sleep.assert_not_called()
+
+
+def test_retry_gives_up_after_deadline():
+    func = Mock(side_effect=TimeoutError("timeout"))
+    func.__name__ = "func"
+
+    with patch("lib.util.error.time.sleep"):
+        with pytest.raises(Exception, match="Failed to execute func"):
+            retry_on_exception(
+                Exception, max_retries=10, sleep_time=10, deadline_s=0.001
+            )(func)()
+
+    assert func.call_count == 1
+
+
+def test_error_classification():
+    rate_limit_reset = openai.error.RateLimitError(
+        "rate limited",
+        http_status=429,
+        headers={
+            "x-ratelimit-reset-tokens": "6m0s",
+            "x-ratelimit-reset-requests": "20ms",
+        },
+    )
+    quota = openai.error.RateLimitError(
+        "quota", http_status=429, code="insufficient_quota"
+    )
+
+    assert get_retry_after(rate_limit_reset) == 360
+    assert is_transient_error(rate_limit_reset)
+    assert not is_transient_error(quota)
+    assert not is_transient_error(ValueError("invalid"))
+
+
+def test_retry_scihub_page_without_pdf():
+    page_without_pdf = Mock(text="<html></html>")
+    page_with_pdf = Mock(text='<iframe id="pdf" src="https://scihub/paper.pdf">')
+
+    with patch(
+        "lib.content.util.requests.post", side_effect=[page_without_pdf, page_with_pdf]
+    ), patch(
+        "lib.content.util.requests.get", return_value=Mock(content=b"pdf")
+    ) as get, patch(
+        "lib.util.error.time.sleep"
+    ):
+        pdf = get_pdf_from_scihub("10.1000/paper")
+
+    assert pdf == b"pdf"
+    get.assert_called_once_with("https://scihub/paper.pdf", headers=ANY)
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from lib.util.SingleFlight import SingleFlight
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flights: SingleFlight[int] = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def run():
+        results = await asyncio.gather(*[flights.do("key", fn) for _ in range(3)])
+        again = await flights.do("key", fn)
+        return results, again
+
+    results, again = asyncio.run(run())
+
+    assert results == [1, 1, 1]
+    # the key was released once the call finished
+    assert again == 2
+
+
+def test_single_flight_releases_key_on_exception():
+    flights: SingleFlight[str] = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise ValueError("failed")
+        return "ok"
+
+    async def run():
+        results = await asyncio.gather(
+            flights.do("key", fn, forget_on_done=False),
+            flights.do("key", fn, forget_on_done=False),
+            return_exceptions=True,
+        )
+        again = await flights.do("key", fn, forget_on_done=False)
+        return results, again
+
+    results, again = asyncio.run(run())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert again == "ok"
+    assert len(calls) == 2
+
+
+def test_single_flight_shares_result_until_forget_or_ttl():
+    flights: SingleFlight[int] = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        first = await flights.do("key", fn, forget_on_done=False)
+        shared = await flights.do("key", fn, forget_on_done=False)
+
+        flights.forget("key")
+        after_forget = await flights.do("key", fn, forget_on_done=False, ttl_s=0.01)
+        shared_within_ttl = await flights.do("key", fn, forget_on_done=False)
+
+        await asyncio.sleep(0.05)
+        after_ttl = await flights.do("key", fn, forget_on_done=False)
+
+        return first, shared, after_forget, shared_within_ttl, after_ttl
+
+    assert asyncio.run(run()) == (1, 1, 2, 2, 3)
+
+
+def test_single_flight_cancelled_caller_does_not_cancel_call():
+    flights: SingleFlight[str] = SingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def run():
+        cancelled = asyncio.create_task(flights.do("key", fn))
+        waiting = asyncio.create_task(flights.do("key", fn))
+        await asyncio.sleep(0)
+
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+        return await waiting
+
+    assert asyncio.run(run()) == "ok"
@@ -0,0 +1,63 @@
+import asyncio
+
+from lib.LexicalIndex import LexicalIndex
+
+
+class LexicalIndexRepositoryMock:
+    def __init__(self):
+        self.documents: list[dict] = []
+
+    async def ensure_indexes(self):
+        pass
+
+    async def upsert_many(self, documents):
+        chunk_ids = {d["chunk_id"] for d in documents}
+        self.documents = [d for d in self.documents if d["chunk_id"] not in chunk_ids]
+        self.documents += documents
+
+    async def find_by_user(self, user_id):
+        return [d for d in self.documents if d["user_id"] == user_id]
+
+    async def delete_by_sources(self, source_ids):
+        self.documents = [d for d in self.documents if d["source_id"] not in source_ids]
+
+    async def delete_by_chunk_ids(self, chunk_ids):
+        self.documents = [d for d in self.documents if d["chunk_id"] not in chunk_ids]
+
+
+def test_lexical_index_ranks_exact_terms():
+    index = LexicalIndex(LexicalIndexRepositoryMock())
+
+    async def run():
+        await index.add(
+            ["1", "2", "3", "4"],
+            [
+                "BRCA1 mutations raise the risk of breast cancer.",
+                "Cancer risk depends on many genes.",
+                "BRCA1 is also studied in mice.",
+                "BRCA1 appears in another user's notes.",
+            ],
+            [
+                {"source_id": "a", "source_type": "pdf", "user_id": "u"},
+                {"source_id": "a", "source_type": "pdf", "user_id": "u"},
+                {"source_id": "b", "source_type": "url", "user_id": "u"},
+                {"source_id": "c", "source_type": "pdf", "user_id": "v"},
+            ],
+        )
+        first = await index.search(
+            "brca1 cancer", {"user_id": "u", "source_type": ["pdf", "url"]}, 5
+        )
+        filtered = await index.search(
+            "brca1", {"user_id": "u", "source_type": "url"}, 5
+        )
+
+        await index.delete({"a": "u"})
+        after_delete = await index.search("brca1 cancer", {"user_id": "u"}, 5)
+
+        return first, filtered, after_delete
+
+    first, filtered, after_delete = asyncio.run(run())
+
+    assert [chunk_id for chunk_id, _ in first] == ["1", "3", "2"]
+    assert [chunk_id for chunk_id, _ in filtered] == ["3"]
+    assert [chunk_id for chunk_id, _ in after_delete] == ["3"]
@@ -0,0 +1,75 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from usecases.DeleteContentUsecase import DeleteContentUsecase
+from usecases.VectorReconciler import VectorReconciler
+
+
+def get_reconciler(tombstones=(), sources=None, existing_ids=()):
+    content_repository = AsyncMock()
+    content_repository.find_existing_ids.return_value = set(existing_ids)
+
+    tombstone_repository = AsyncMock()
+    tombstone_repository.query.return_value = list(tombstones)
+
+    vector_store = AsyncMock()
+    vector_store.get_sources.return_value = sources or {}
+
+    return VectorReconciler(content_repository, tombstone_repository, vector_store)
+
+
+def test_failed_tombstone_deletion_is_kept_for_retry():
+    reconciler = get_reconciler(tombstones=[{"source_id": "1", "user_id": "a"}])
+    reconciler._vector_store.delete_by_sources.side_effect = ConnectionError()
+
+    try:
+        asyncio.run(reconciler.delete_tombstoned())
+    except ConnectionError:
+        pass
+
+    reconciler._tombstone_repository.record_attempt.assert_awaited_once_with(["1"])
+    reconciler._tombstone_repository.remove.assert_not_awaited()
+
+
+def test_orphaned_sources_are_deleted():
+    reconciler = get_reconciler(
+        sources={"1": "a", "2": "a", "3": "b"}, existing_ids=["2"]
+    )
+
+    assert asyncio.run(reconciler.delete_orphans()) == 2
+
+    reconciler._vector_store.delete_by_sources.assert_awaited_once_with(
+        {"1": "a", "3": "b"}
+    )
+
+
+def test_delete_content_writes_tombstone_first():
+    calls = Mock()
+    repository, tombstone_repository = AsyncMock(), AsyncMock()
+    repository.delete_one.return_value = True
+    calls.attach_mock(repository.delete_one, "delete_one")
+    calls.attach_mock(tombstone_repository.add, "add_tombstone")
+
+    delete_content = DeleteContentUsecase(repository, tombstone_repository, AsyncMock())
+
+    assert asyncio.run(delete_content("1", "a"))
+    assert [c[0] for c in calls.mock_calls] == ["add_tombstone", "delete_one"]
+
+
+def test_failed_content_deletion_removes_tombstone():
+    repository, tombstone_repository = AsyncMock(), AsyncMock()
+    repository.delete_one.side_effect = ConnectionError()
+    vector_store = AsyncMock()
+
+    delete_content = DeleteContentUsecase(
+        repository, tombstone_repository, vector_store
+    )
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(delete_content("1", "a"))
+
+    # the content may still exist, so its vectors are kept
+    tombstone_repository.remove.assert_awaited_once_with(["1"])
+    vector_store.delete_by_source.assert_not_awaited()
@@ -0,0 +1,381 @@
+import asyncio
+import hashlib
+from unittest.mock import patch
+
+import chromadb
+import pytest
+
+from adapters.vector_store.QueryCache import QueryCache
+from adapters.vector_store.VectorStore import QueryFilters, VectorStore
+from lib.LexicalIndex import LexicalIndex
+from lib.TextSplitter import TextSplitter
+from tests.vector_store.test_lexical_index import LexicalIndexRepositoryMock
+
+
+class HashEmbedding:
+    """
+    Embeds texts as normalized bags of hashed words.
+    """
+
+    def __call__(self, input):
+        embeddings = []
+
+        for text in input:
+            embedding = [0.0] * 32
+            for word in text.lower().split():
+                embedding[hashlib.md5(word.encode()).digest()[0] % 32] += 1.0
+            norm = sum(x * x for x in embedding) ** 0.5 or 1.0
+            embeddings.append([x / norm for x in embedding])
+
+        return embeddings
+
+
+class WordEncoder:
+    def encode_ordinary_batch(self, texts: list[str]) -> list[list[int]]:
+        return [[len(word) for word in text.split()] for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def word_encoder():
+    with patch("lib.tokenizer.get_encoder", return_value=WordEncoder()):
+        yield
+
+
+def get_vector_store(**kwargs) -> VectorStore:
+    client = chromadb.EphemeralClient()
+    # the ephemeral client is shared within the process
+    for collection in client.list_collections():
+        client.delete_collection(collection.name)
+
+    with patch(
+        "adapters.vector_store.VectorStore.embedding_functions.DefaultEmbeddingFunction",
+        return_value=HashEmbedding(),
+    ):
+        return VectorStore(TextSplitter(), client, **kwargs)
+
+
+def test_vector_store_add_and_query():
+    vector_store = get_vector_store()
+
+    async def run():
+        await vector_store.setup()
+        await vector_store.add_documents(
+            ["Cats purr and sleep a lot.", "Rockets need fuel to reach orbit."],
+            [
+                {"source_id": "1", "source_type": "url", "user_id": "user"},
+                {"source_id": "2", "source_type": "pdf", "user_id": "user"},
+            ],
+        )
+        return await vector_store.query(
+            "rockets fuel orbit", {"user_id": "user", "source_type": ["url", "pdf"]}
+        )
+
+    results = asyncio.run(run())
+
+    assert results["metadatas"][0]["source_id"] == "2"
+
+
+def test_vector_store_bulk_ingestion_batches_embeddings():
+    vector_store = get_vector_store(embedding_batch_size=2)
+    documents = [f"Document number {i} about topic {i}." for i in range(5)]
+    metadatas = [
+        {"source_id": str(i), "source_type": "url", "user_id": "user"} for i in range(5)
+    ]
+
+    collection_type = type(vector_store._get_user_collection("user"))
+
+    with patch.object(
+        vector_store, "_embedding_function", wraps=vector_store._embedding_function
+    ) as embedding_function, patch.object(
+        collection_type, "upsert", autospec=True, side_effect=collection_type.upsert
+    ) as upsert:
+        stats = asyncio.run(vector_store.add_documents(documents, metadatas))
+
+    assert stats["no_chunks"] == 5
+    assert embedding_function.call_count == 3
+    assert upsert.call_count == 1
+    assert vector_store._get_user_collection("user").count() == 5
+
+
+def test_vector_store_stores_chunk_offsets():
+    vector_store = get_vector_store()
+    document = "# Cats\n\nCats purr.\n\n# Rockets\n\nRockets need fuel."
+
+    with patch.object(vector_store._document_splitter, "_max_tokens", 6):
+        asyncio.run(
+            vector_store.add_documents(
+                [document],
+                [{"source_id": "1", "source_type": "url", "user_id": "user"}],
+            )
+        )
+
+    results = vector_store._get_user_collection("user").get(
+        include=["documents", "metadatas"]
+    )
+
+    assert len(results["ids"]) == 2
+    for chunk, metadata in zip(results["documents"], results["metadatas"]):
+        assert document[metadata["chunk_start"] : metadata["chunk_end"]] == chunk
+
+
+def test_vector_store_reembeds_only_changed_chunks():
+    vector_store = get_vector_store()
+    metadata = {"source_id": "1", "source_type": "url", "user_id": "user"}
+    document = "# Cats\n\nCats purr.\n\n# Rockets\n\nRockets need fuel."
+    changed = "# Cats\n\nCats purr.\n\n# Moons\n\nMoons orbit planets."
+
+    async def run():
+        first = await vector_store.add_documents([document], [metadata])
+        unchanged = await vector_store.add_documents([document], [metadata])
+        second = await vector_store.add_documents([changed], [metadata])
+        return first, unchanged, second
+
+    with patch.object(vector_store._document_splitter, "_max_tokens", 6):
+        first, unchanged, second = asyncio.run(run())
+
+    assert (first["no_new_chunks"], first["no_deleted_chunks"]) == (2, 0)
+    assert (unchanged["no_new_chunks"], unchanged["no_deleted_chunks"]) == (0, 0)
+    assert (second["no_new_chunks"], second["no_deleted_chunks"]) == (1, 1)
+
+    results = vector_store._get_user_collection("user").get(include=["documents"])
+    assert sorted(results["documents"]) == ["# Cats\n\nCats purr.", changed[20:]]
+    assert all(chunk_id.startswith("1:") for chunk_id in results["ids"])
+
+
+def test_vector_store_caches_queries_until_content_changes():
+    vector_store = get_vector_store(query_cache=QueryCache())
+    metadata = {"source_id": "1", "source_type": "url", "user_id": "user"}
+    filters = {"user_id": "user", "source_type": ["url"]}
+
+    collection_type = type(vector_store._get_user_collection("user"))
+
+    async def run():
+        await vector_store.add_documents(["Cats purr and sleep a lot."], [metadata])
+
+        first = await vector_store.query("Do cats  purr?", filters)
+        second = await vector_store.query("do cats purr?", filters)
+
+        await vector_store.add_documents(
+            ["Rockets need fuel."], [{**metadata, "source_id": "2"}]
+        )
+        third = await vector_store.query("do cats purr?", filters)
+
+        return first, second, third
+
+    with patch.object(
+        vector_store, "_embedding_function", wraps=vector_store._embedding_function
+    ) as embedding_function, patch.object(
+        collection_type, "query", autospec=True, side_effect=collection_type.query
+    ) as query:
+        first, second, third = asyncio.run(run())
+
+    assert first == second
+    assert len(third["ids"]) == 2
+    # two documents and a single query embedding
+    assert embedding_function.call_count == 3
+    assert query.call_count == 2
+
+
+def test_vector_store_deletes_by_source():
+    vector_store = get_vector_store()
+
+    async def run():
+        await vector_store.add_documents(
+            ["Cats purr.", "Rockets need fuel.", "Dogs bark."],
+            [
+                {"source_id": "1", "source_type": "url", "user_id": "a"},
+                {"source_id": "2", "source_type": "pdf", "user_id": "a"},
+                {"source_id": "3", "source_type": "url", "user_id": "b"},
+            ],
+        )
+        await vector_store.delete_by_sources({"1": "a", "3": "b"})
+        return await vector_store.get_sources()
+
+    assert asyncio.run(run()) == {"2": "a"}
+
+
+def test_vector_store_partitions_users():
+    vector_store = get_vector_store(partition_mode="user")
+
+    async def run():
+        await vector_store.add_documents(
+            ["Cats purr.", "Cats meow.", "Dogs bark."],
+            [
+                {"source_id": "1", "source_type": "url", "user_id": "a"},
+                {"source_id": "2", "source_type": "url", "user_id": "b"},
+                {"source_id": "3", "source_type": "url", "user_id": "b"},
+            ],
+        )
+        return (
+            await vector_store.query("cats", {"user_id": "a", "source_type": "url"}),
+            await vector_store.query("cats", {"user_id": "c", "source_type": "url"}),
+        )
+
+    results, no_content = asyncio.run(run())
+
+    assert results["ids"] and all(m["user_id"] == "a" for m in results["metadatas"])
+    # searching does not create a collection for a user without content
+    assert no_content["ids"] == []
+    assert len(vector_store._chroma_client.list_collections()) == 2
+    assert vector_store._get_user_collection("a").count() == 1
+    assert vector_store._get_user_collection("b").count() == 2
+    assert asyncio.run(vector_store.get_sources()) == {"1": "a", "2": "b", "3": "b"}
+    assert asyncio.run(vector_store.count()) == 3
+
+
+def test_vector_store_handles_missing_collections_of_http_client():
+    vector_store = get_vector_store(partition_mode="user")
+    get_collection = vector_store._chroma_client.get_collection
+
+    def get_collection_over_http(*args, **kwargs):
+        try:
+            return get_collection(*args, **kwargs)
+        except ValueError as e:
+            # what chromadb.HttpClient raises for the server's error response
+            raise Exception(f'{{"error":"ValueError(\'{e}\')"}}')
+
+    async def run():
+        empty = await vector_store.query("cats", {"user_id": "a"})
+        await vector_store.delete_by_sources({"1": "a"})
+        await vector_store.add_documents(
+            ["Cats purr."], [{"source_id": "1", "source_type": "url", "user_id": "a"}]
+        )
+        return empty, await vector_store.query("cats", {"user_id": "a"})
+
+    with patch.object(
+        vector_store._chroma_client,
+        "get_collection",
+        side_effect=get_collection_over_http,
+    ):
+        empty, results = asyncio.run(run())
+
+    assert empty["ids"] == []
+    assert len(results["ids"]) == 1
+
+
+def test_vector_store_copies_collection_into_buckets():
+    shared = get_vector_store()
+    asyncio.run(
+        shared.add_documents(
+            ["Cats purr.", "Dogs bark."],
+            [
+                {"source_id": "1", "source_type": "url", "user_id": "a"},
+                {"source_id": "2", "source_type": "url", "user_id": "b"},
+            ],
+        )
+    )
+
+    with patch(
+        "adapters.vector_store.VectorStore.embedding_functions.DefaultEmbeddingFunction",
+        return_value=HashEmbedding(),
+    ):
+        partitioned = VectorStore(
+            TextSplitter(),
+            shared._chroma_client,
+            partition_mode="bucket",
+            partition_buckets=4,
+        )
+
+    assert partitioned.copy_collection("content") == 2
+    assert partitioned._get_user_collection("a").get()["ids"]
+    assert partitioned._get_collection_name("a").startswith("content-bucket-")
+
+
+def test_vector_store_fuses_lexical_matches():
+    vector_store = get_vector_store(
+        lexical_index=LexicalIndex(LexicalIndexRepositoryMock()), n_results=2
+    )
+    # the rare term ranks the last chunk first lexically, which keeps it
+    # among the results whatever the vector search ranks first
+    documents = [
+        "Notes about topics and more topics here.",
+        "Notes on cooking pasta.",
+        "Travel plans for summer.",
+        "Budget for the new office.",
+        "Reading list about history.",
+        "Meeting notes from monday.",
+        "Gene XK42 regulates growth.",
+    ]
+    metadatas = [
+        {"source_id": str(i), "source_type": "pdf", "user_id": "user"}
+        for i in range(len(documents))
+    ]
+
+    async def run():
+        await vector_store.add_documents(documents, metadatas)
+        return await vector_store.query(
+            "what do my notes say about xk42",
+            {"user_id": "user", "source_type": "pdf"},
+        )
+
+    results = asyncio.run(run())
+
+    assert "6" in [metadata["source_id"] for metadata in results["metadatas"]]
+    assert len(results["distances"]) == len(results["ids"]) == 2
+
+
+def test_vector_store_rebuilds_lexical_index_from_chroma():
+    repository = LexicalIndexRepositoryMock()
+    vector_store = get_vector_store(lexical_index=LexicalIndex(repository))
+    metadata = {"source_id": "1", "source_type": "pdf", "user_id": "user"}
+
+    async def run():
+        with patch.object(repository, "upsert_many", side_effect=ConnectionError):
+            await vector_store.add_documents(
+                ["Gene XK42 regulates growth."], [metadata]
+            )
+
+        missing = await vector_store._lexical_index.search(
+            "xk42", {"user_id": "user"}, 5
+        )
+
+        # running it twice does not index chunks twice
+        await vector_store.rebuild_lexical_index()
+        no_chunks = await vector_store.rebuild_lexical_index()
+
+        rebuilt = await vector_store._lexical_index.search(
+            "xk42", {"user_id": "user"}, 5
+        )
+
+        return missing, no_chunks, rebuilt
+
+    missing, no_chunks, rebuilt = asyncio.run(run())
+
+    assert missing == []
+    assert no_chunks == 1
+    assert len(rebuilt) == 1 and len(repository.documents) == 1
+
+
+def test_vector_store_cuts_off_and_diversifies_results():
+    vector_store = get_vector_store(max_distance=1.2, mmr_lambda=0.5)
+    documents = [
+        "Rockets need fuel to reach orbit.",
+        "Rockets need fuel to reach orbit.",
+        "Rockets burn fuel and reach space.",
+        "Cats purr and sleep a lot.",
+    ]
+    metadatas = [
+        {"source_id": str(i), "source_type": "url", "user_id": "user"}
+        for i in range(len(documents))
+    ]
+
+    filters: QueryFilters = {"user_id": "user", "source_type": "url"}
+
+    async def run():
+        await vector_store.add_documents(documents, metadatas)
+        return (
+            await vector_store.query(
+                "rockets need fuel to reach orbit", filters, n_results=2
+            ),
+            await vector_store.query(
+                "rockets need fuel to reach orbit", filters, n_results=4
+            ),
+        )
+
+    results, all_results = asyncio.run(run())
+
+    # one of the duplicates is skipped for the next most relevant chunk
+    source_ids = [m["source_id"] for m in results["metadatas"]]
+    assert source_ids[0] in ("0", "1") and source_ids[1] == "2"
+    # the unrelated chunk is cut off
+    assert "3" not in [m["source_id"] for m in all_results["metadatas"]]
@@ -1,20 +1,26 @@
 import logging
 from datetime import datetime
 from io import BytesIO
-from typing import Annotated, Union
+from typing import Annotated, Hashable, Optional, Union
 
 from fastapi import Depends
 from fastapi.concurrency import run_in_threadpool
 
 from adapters import PDFStorage, TaskQueue
-from adapters.database_models.Content import ContentModel
+from adapters.database_models.Content import ContentModel, ContentSourceType
 from adapters.repository import ContentRepository
-from adapters.vector_store.VectorStore import VectorStore, VectorStoreInterface
+from adapters.vector_store.VectorStore import VectorStoreInterface, get_vector_store
+from config import env_config
 from lib.content import ContentExtractor
 from lib.GPT.Summarizer import SummarizerInterface, get_summarizer
+from lib.util.SingleFlight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+# shared by all usecase instances, one flight lasts until the content is processed
+# or CONTENT_FLIGHT_TTL_S passed, in case the processing task never ran
+content_flights: SingleFlight[ContentModel] = SingleFlight()
+
 
 class CreateContentUsecase:
     _file_storage: PDFStorage
@@ -27,7 +33,7 @@ class CreateContentUsecase:
     def __init__(
         self,
         repository: Annotated[ContentRepository, Depends()],
-        vector_store: Annotated[VectorStore, Depends()],
+        vector_store: Annotated[VectorStoreInterface, Depends(get_vector_store)],
         task_queue: Annotated[TaskQueue, Depends()],
         content_extractor: Annotated[ContentExtractor, Depends()],
         pdf_storage: Annotated[PDFStorage, Depends()],
@@ -43,19 +49,45 @@ class CreateContentUsecase:
     async def __call__(self, source: Union[str, bytes], user_id: str):
         content_type = self._content_extractor.get_type_from_src(source)
 
+        if isinstance(source, bytes):
+            return await self._create_content(source, content_type, user_id, None)
+
+        # the same url or doi submitted again while it is still being processed
+        # returns the content that is already on its way
+        key = (user_id, content_type, source.strip())
+
+        return await content_flights.do(
+            key,
+            lambda: self._create_content(source, content_type, user_id, key),
+            forget_on_done=False,
+            ttl_s=env_config.CONTENT_FLIGHT_TTL_S,
+        )
+
+    async def _create_content(
+        self,
+        source: Union[str, bytes],
+        content_type: ContentSourceType,
+        user_id: str,
+        flight_key: Optional[Hashable],
+    ) -> ContentModel:
         content_obj = ContentModel(
             user_id=user_id,
             source_type=content_type,
         )
 
+        # raising releases the flight, so the source can be submitted again
         content_id = await self._repository.insert_one(content_obj.dict(by_alias=True))
 
-        self._task_queue(self._process_content, content_id, user_id, source)
+        self._task_queue(self._process_content, content_id, user_id, source, flight_key)
 
         return content_obj
 
     async def _process_content(
-        self, content_id: str, user_id: str, source: Union[str, bytes]
+        self,
+        content_id: str,
+        user_id: str,
+        source: Union[str, bytes],
+        flight_key: Optional[Hashable] = None,
     ):
         try:
             extracted_content = await run_in_threadpool(
@@ -74,9 +106,9 @@ class CreateContentUsecase:
                 # to also include the doi as a link would be better
                 del extracted_content["pdf"]  # type: ignore
 
-            summary = self._summarizer(extracted_content["view_text"], user_id)
+            summary = await self._summarizer(extracted_content["view_text"], user_id)
 
-            self._vector_store.add_document(
+            await self._vector_store.add_document(
                 extracted_content["view_text"],
                 {
                     "source_type": extracted_content["source_type"],
@@ -107,3 +139,6 @@ class CreateContentUsecase:
                     }
                 },
             )
+        finally:
+            if flight_key:
+                content_flights.forget(flight_key)
@@ -0,0 +1,51 @@
+import logging
+from typing import Annotated
+
+from fastapi import Depends
+
+from adapters.repository import ContentRepository, VectorTombstoneRepository
+from adapters.vector_store.VectorStore import VectorStoreInterface, get_vector_store
+
+logger = logging.getLogger(__name__)
+
+
+class DeleteContentUsecase:
+    _repository: ContentRepository
+    _tombstone_repository: VectorTombstoneRepository
+    _vector_store: VectorStoreInterface
+
+    def __init__(
+        self,
+        repository: Annotated[ContentRepository, Depends()],
+        tombstone_repository: Annotated[VectorTombstoneRepository, Depends()],
+        vector_store: Annotated[VectorStoreInterface, Depends(get_vector_store)],
+    ):
+        self._repository = repository
+        self._tombstone_repository = tombstone_repository
+        self._vector_store = vector_store
+
+    async def __call__(self, content_id: str, user_id: str) -> bool:
+        # written before the content is deleted, so the reconciler removes the
+        # vectors even if this request stops right after the content is gone
+        await self._tombstone_repository.add(content_id, user_id)
+
+        try:
+            is_deleted = await self._repository.delete_one(
+                {"id": content_id, "user_id": user_id}
+            )
+        except Exception:
+            # the content may still exist and must keep its vectors
+            await self._tombstone_repository.remove([content_id])
+            raise
+
+        # a tombstone without content only deletes vectors that are orphaned
+        if not is_deleted:
+            return False
+
+        try:
+            await self._vector_store.delete_by_source(content_id, user_id)
+            await self._tombstone_repository.remove([content_id])
+        except Exception as e:
+            logger.error(f"Failed to delete vectors of content {content_id}: {e}")
+
+        return True
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from adapters.repository import ContentRepository, VectorTombstoneRepository
+from adapters.vector_store.VectorStore import VectorStoreInterface
+
+logger = logging.getLogger(__name__)
+
+# content ids per lookup in the content collection
+LOOKUP_BATCH_SIZE = 1000
+
+
+class VectorReconciler:
+    """
+    Removes the vectors of deleted content in the background.
+
+    Pending tombstones are retried every interval_s. Every
+    orphan_scan_interval_s, the sources in the vector store are compared with
+    the content collection and chunks without content are deleted in bulk,
+    e.g. of content deleted while it was still being processed.
+    """
+
+    def __init__(
+        self,
+        content_repository: ContentRepository,
+        tombstone_repository: VectorTombstoneRepository,
+        vector_store: VectorStoreInterface,
+        interval_s: float = 60,
+        orphan_scan_interval_s: float = 24 * 3600,
+    ):
+        self._content_repository = content_repository
+        self._tombstone_repository = tombstone_repository
+        self._vector_store = vector_store
+        self._interval_s = interval_s
+        self._orphan_scan_interval_s = orphan_scan_interval_s
+
+        self._task: Optional[asyncio.Task] = None
+        self._last_orphan_scan: Optional[float] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.delete_tombstoned()
+
+                if (
+                    self._last_orphan_scan is None
+                    or time.monotonic() - self._last_orphan_scan
+                    >= self._orphan_scan_interval_s
+                ):
+                    self._last_orphan_scan = time.monotonic()
+                    await self.delete_orphans()
+            except Exception as e:
+                logger.error(f"Failed to reconcile vectors: {e}")
+
+            await asyncio.sleep(self._interval_s)
+
+    async def delete_tombstoned(self) -> int:
+        tombstones = await self._tombstone_repository.query({})
+
+        if not tombstones:
+            return 0
+
+        sources = {t["source_id"]: t["user_id"] for t in tombstones}
+
+        try:
+            await self._vector_store.delete_by_sources(sources)
+        except Exception:
+            await self._tombstone_repository.record_attempt(list(sources))
+            raise
+
+        await self._tombstone_repository.remove(list(sources))
+
+        logger.info(f"Deleted the vectors of {len(sources)} tombstoned sources")
+
+        return len(sources)
+
+    async def delete_orphans(self) -> int:
+        sources = await self._vector_store.get_sources()
+        source_ids = list(sources)
+
+        existing_ids: set[str] = set()
+        for i in range(0, len(source_ids), LOOKUP_BATCH_SIZE):
+            existing_ids |= await self._content_repository.find_existing_ids(
+                source_ids[i : i + LOOKUP_BATCH_SIZE]
+            )
+
+        orphans = {
+            source_id: user_id
+            for source_id, user_id in sources.items()
+            if source_id not in existing_ids
+        }
+
+        if orphans:
+            await self._vector_store.delete_by_sources(orphans)
+
+        logger.info(f"Deleted the vectors of {len(orphans)} orphaned sources")
+
+        return len(orphans)
@@ -1 +1,3 @@
 from .CreateContentUsecase import CreateContentUsecase  # noqa: F401
+from .DeleteContentUsecase import DeleteContentUsecase  # noqa: F401
+from .VectorReconciler import VectorReconciler  # noqa: F401